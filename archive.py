@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Mapping, Tuple
+
+from instrumentation import count
+from locks import FileLock
+from serializer import decode_value, encode_value
+from storage import stamp
+
+
+class PartitionedArchive:
+    """
+    Archive of finished documents (e.g. past reservations), partitioned by the month of start_field:
+    one JSON file per partition (<directory>/<YYYY-MM>.json) and a manifest holding the time span
+    (first start, last end) and size of every partition.
+
+    Queries only open the partitions whose span overlaps their time range, so questions about the
+    present and future don't touch the archive at all. Opened partitions are cached until their file
+    changes. Writers hold a file lock, several processes may share the archive.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, directory: str, key_field: str, start_field: str = "start", end_field: str = "end") -> None:
+        self.directory = directory
+        self.key_field = key_field
+        self.start_field = start_field
+        self.end_field = end_field
+        self._lock = FileLock(os.path.join(directory, "archive.lock"))
+        self._guard = threading.Lock()
+        # path -> (file signature, decoded content) as last read or written
+        self._files: Dict[str, Tuple[Any, Any]] = {}
+        # (signature of manifest and partitions, key -> partition key), see _keys()
+        self._key_map: Tuple[Any, Dict[Any, str]] = (None, {})
+
+    @staticmethod
+    def partition_key(value: datetime) -> str:
+        return value.strftime("%Y-%m")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def _read(self, path: str, default: Any) -> Any:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return default
+        signature = stat.st_mtime_ns, stat.st_size
+        with self._guard:
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+        with open(path, encoding="utf-8") as handle:
+            content = decode_value(json.load(handle))
+        count(file_opens=1, bytes_read=stat.st_size)
+        with self._guard:
+            self._files[path] = (signature, content)
+        return content
+
+    def _write(self, path: str, content: Any) -> None:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(encode_value(content), handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+            count(file_opens=1, bytes_written=os.fstat(handle.fileno()).st_size)
+        stamp(tmp_path)
+        os.replace(tmp_path, path)
+        stat = os.stat(path)
+        with self._guard:
+            self._files[path] = ((stat.st_mtime_ns, stat.st_size), content)
+
+    def manifest(self) -> Dict[str, dict]:
+        """Partition key -> {"count", "first_start", "last_end"}. Callers must not modify it."""
+        return self._read(os.path.join(self.directory, self.MANIFEST), {})
+
+    def __len__(self) -> int:
+        return sum(entry["count"] for entry in self.manifest().values())
+
+    def partitions(self, lo: Any = None, hi: Any = None) -> List[str]:
+        """Keys of the partitions that may hold documents overlapping [lo, hi) (None = unbounded), oldest first."""
+        return sorted(
+            key for key, entry in self.manifest().items()
+            if (hi is None or entry["first_start"] < hi) and (lo is None or entry["last_end"] > lo)
+        )
+
+    def _keys(self) -> Dict[Any, str]:
+        """Key of every archived document -> its partition, collected again only after the archive changed."""
+        stats = []
+        for path in [os.path.join(self.directory, self.MANIFEST)] + [self._path(key) for key in self.partitions()]:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stats.append((path, stat.st_mtime_ns, stat.st_size))
+        signature = tuple(stats)
+        with self._guard:
+            if self._key_map[0] == signature:
+                return self._key_map[1]
+        keys = {doc[self.key_field]: key for key in self.partitions() for doc in self.load(key)}
+        with self._guard:
+            self._key_map = (signature, keys)
+        return keys
+
+    def __contains__(self, key_value: Any) -> bool:
+        """True if a document with key_value is archived, O(1) unless the archive changed."""
+        return key_value in self._keys()
+
+    def load(self, key: str) -> List[dict]:
+        """The documents of one partition, ordered by start. Callers must not modify them."""
+        return self._read(self._path(key), [])
+
+    def overlapping(self, lo: Any = None, hi: Any = None) -> Iterator[dict]:
+        """Documents whose [start, end) overlaps [lo, hi), ordered by start within each partition."""
+        for key in self.partitions(lo, hi):
+            for doc in self.load(key):
+                if (hi is None or doc[self.start_field] < hi) and (lo is None or doc[self.end_field] > lo):
+                    yield doc
+
+    def add(self, docs: List[Mapping]) -> None:
+        """Add documents to their partitions; a document already archived (same key) is replaced."""
+        by_partition: Dict[str, List[Mapping]] = {}
+        for doc in docs:
+            by_partition.setdefault(self.partition_key(doc[self.start_field]), []).append(doc)
+        if not by_partition:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            manifest = dict(self.manifest())
+            contents = {}
+            for key, new_docs in by_partition.items():
+                merged = {doc[self.key_field]: doc for doc in self.load(key)}
+                merged.update((doc[self.key_field], dict(doc)) for doc in new_docs)
+                contents[key] = sorted(merged.values(), key=lambda doc: (doc[self.start_field], doc[self.key_field]))
+                manifest[key] = self._summary(contents[key])
+            # Manifest first: a crash in between leaves a span that is too wide, never one that hides documents
+            self._write(os.path.join(self.directory, self.MANIFEST), manifest)
+            for key, content in contents.items():
+                self._write(self._path(key), content)
+
+    def remove(self, key_value: Any) -> bool:
+        """Remove the document with key_value from the archive."""
+        if not os.path.isdir(self.directory):
+            return False
+        with self._lock:
+            key = self._keys().get(key_value)
+            if key is not None:
+                docs = self.load(key)
+                remaining = [doc for doc in docs if doc[self.key_field] != key_value]
+                manifest = dict(self.manifest())
+                if remaining:
+                    self._write(self._path(key), remaining)
+                    manifest[key] = self._summary(remaining)
+                else:
+                    os.remove(self._path(key))
+                    del manifest[key]
+                self._write(os.path.join(self.directory, self.MANIFEST), manifest)
+                return True
+        return False
+
+    def _summary(self, docs: List[Mapping]) -> dict:
+        return {
+            "count": len(docs),
+            "first_start": min(doc[self.start_field] for doc in docs),
+            "last_end": max(doc[self.end_field] for doc in docs),
+        }
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from async_support import WriteCoalescer, run_blocking
+from database import ConflictError, Page, WriteResult
+from entity import CONFLICT_REASON
+from maintenance import CostSummary, Maintenance, MaintenanceManager
+from reservations import DeviceStatus, RecurringReservation, Reservation, ReservationManager
+
+
+class AsyncReservationManager:
+    """
+    asyncio facade of ReservationManager: the blocking calls run in the shared executor of async_support.
+    Bookings arriving within window_ms are checked and written together by one create_many() call,
+    each caller still gets the answer for its own reservation.
+    """
+
+    def __init__(self, manager: Optional[ReservationManager] = None, window_ms: float = 5) -> None:
+        self.manager = manager or ReservationManager()
+        self._creates = WriteCoalescer(self.manager.create_many, window_ms)
+
+    async def create(self, res: Reservation) -> bool:
+        return (await self._creates.submit(res)).accepted
+
+    async def create_detailed(self, res: Reservation) -> WriteResult:
+        """Like create(), but returns the WriteResult with the reason of a rejection."""
+        return await self._creates.submit(res)
+
+    async def create_many(self, reservations: List[Reservation]) -> List[WriteResult]:
+        return await run_blocking(self.manager.create_many, reservations)
+
+    async def create_recurring(self, rule: RecurringReservation) -> WriteResult:
+        return await run_blocking(self.manager.create_recurring, rule)
+
+    async def find_recurring(self, device_name: Optional[str] = None) -> List[RecurringReservation]:
+        return await run_blocking(self.manager.find_recurring, device_name)
+
+    async def is_available(self, device_name: str, start: datetime, end: datetime) -> bool:
+        return await run_blocking(self.manager.is_available, device_name, start, end)
+
+    async def current_reservation(self, device_name: str, at: Optional[datetime] = None) -> Optional[Reservation]:
+        return await run_blocking(self.manager.current_reservation, device_name, at)
+
+    async def reservations_between(self, device_name: str, start: datetime, end: datetime) -> List[Reservation]:
+        return await run_blocking(self.manager.reservations_between, device_name, start, end)
+
+    async def find_free_slots(self, device_name: str, window_start: datetime, window_end: datetime,
+                              min_duration: timedelta = timedelta(0)) -> List[Tuple[datetime, datetime]]:
+        return await run_blocking(self.manager.find_free_slots, device_name, window_start, window_end, min_duration)
+
+    async def find_available_devices(self, start: datetime, end: datetime,
+                                     candidates: Optional[Iterable[str]] = None) -> List[str]:
+        return await run_blocking(self.manager.find_available_devices, start, end, candidates)
+
+    async def fleet_status(self, at: Optional[datetime] = None) -> Dict[str, DeviceStatus]:
+        return await run_blocking(self.manager.fleet_status, at)
+
+    async def delete_by_id(self, reservation_id: str) -> bool:
+        return await run_blocking(self.manager.delete_by_id, reservation_id)
+
+    async def archive(self, before: Optional[datetime] = None) -> int:
+        return await run_blocking(self.manager.archive, before)
+
+    async def find_all(self, include_archive: bool = False) -> List[Reservation]:
+        return await run_blocking(self.manager.find_all, include_archive)
+
+    async def find_where(self, where: Mapping[str, Any], order_by: Optional[str] = None, descending: bool = False,
+                         limit: Optional[int] = None, include_archive: bool = False) -> List[Reservation]:
+        return await run_blocking(self.manager.find_where, where, order_by, descending, limit, include_archive)
+
+    async def find_by_device(self, device_name: str, include_archive: bool = False,
+                             date_range: Optional[Tuple[Optional[datetime], Optional[datetime]]] = None) -> List[Reservation]:
+        return await run_blocking(self.manager.find_by_device, device_name, include_archive, date_range)
+
+    async def find_page(self, offset: int = 0, limit: int = 20, order_by: str = "start",
+                        filters: Optional[Mapping[str, Any]] = None, descending: bool = False,
+                        date_range: Optional[Tuple[Optional[datetime], Optional[datetime]]] = None,
+                        include_archive: bool = False) -> Page:
+        return await run_blocking(
+            self.manager.find_page, offset, limit, order_by, filters, descending, date_range, include_archive
+        )
+
+
+class AsyncMaintenanceManager:
+    """
+    asyncio facade of MaintenanceManager. Upserts arriving within window_ms are written together by
+    one upsert_many() call.
+    """
+
+    def __init__(self, manager: Optional[MaintenanceManager] = None, window_ms: float = 5) -> None:
+        self.manager = manager or MaintenanceManager()
+        self._upserts = WriteCoalescer(self.manager.upsert_many, window_ms)
+
+    async def upsert(self, m: Maintenance) -> None:
+        """Raises ValueError or ConflictError like MaintenanceManager.upsert."""
+        result = await self._upserts.submit(m)
+        if not result.accepted:
+            if result.reason == CONFLICT_REASON:
+                raise ConflictError(f"Maintenance {m.maintenance_id} was changed by someone else")
+            raise ValueError(result.reason)
+
+    async def upsert_many(self, items: List[Maintenance]) -> List[WriteResult]:
+        return await run_blocking(self.manager.upsert_many, items)
+
+    async def delete_by_id(self, maintenance_id: str) -> bool:
+        return await run_blocking(self.manager.delete_by_id, maintenance_id)
+
+    async def find_all(self) -> List[Maintenance]:
+        return await run_blocking(self.manager.find_all)
+
+    async def find_page(self, offset: int = 0, limit: int = 20, order_by: Optional[str] = None,
+                        filters: Optional[Mapping[str, Any]] = None, descending: bool = False) -> Page:
+        return await run_blocking(self.manager.find_page, offset, limit, order_by, filters, descending)
+
+    async def find_where(self, where: Mapping[str, Any], order_by: Optional[str] = None, descending: bool = False,
+                         limit: Optional[int] = None) -> List[Maintenance]:
+        return await run_blocking(self.manager.find_where, where, order_by, descending, limit)
+
+    async def cost_summary(self, device_name: Optional[str] = None) -> CostSummary:
+        return await run_blocking(self.manager.cost_summary, device_name)
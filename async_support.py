@@ -0,0 +1,97 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Tuple
+
+# Bounded, so a burst of requests queues up instead of starting a thread per request
+DEFAULT_MAX_WORKERS = 4
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> Executor:
+    """The shared thread pool running the blocking database calls of the async API."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DEFAULT_MAX_WORKERS, thread_name_prefix="db-io")
+        return _executor
+
+
+def set_max_workers(max_workers: int) -> None:
+    """Replace the shared thread pool by one with max_workers threads (running calls finish first)."""
+    global _executor
+    with _executor_lock:
+        old, _executor = _executor, ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-io")
+    if old is not None:
+        old.shutdown(wait=True)
+
+
+async def run_blocking(fn: Callable, *args, executor: Optional[Executor] = None) -> Any:
+    """Run fn(*args) in the executor (default: the shared one) and wait for it without blocking the loop."""
+    # In the caller's context, so e.g. instrumentation records the call in the caller's scope
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor or get_executor(), context.run, fn, *args)
+
+
+class WriteCoalescer:
+    """
+    Collects the items submitted within window_ms (or until max_batch items are waiting) and writes
+    them with a single call of write_batch(items), which returns one result per item.
+    Every submitter gets the result of its own item; if write_batch raises, all of them get the exception.
+    """
+
+    def __init__(self, write_batch: Callable[[list], list], window_ms: float = 5, max_batch: int = 500,
+                 executor: Optional[Executor] = None) -> None:
+        self.write_batch = write_batch
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self.executor = executor
+        self._loop = None
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer = None
+        # Running commits, referenced so they aren't garbage collected while in flight
+        self._commits = set()
+        # Number of write_batch calls, for monitoring how well writes are coalesced
+        self.batches = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # First use or a new event loop (e.g. another asyncio.run), nothing can be pending for it
+            self._loop = loop
+            self._pending = []
+            self._timer = None
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_ms / 1000, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            commit = self._loop.create_task(self._commit(batch))
+            self._commits.add(commit)
+            commit.add_done_callback(self._commits.discard)
+
+    async def _commit(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        self.batches += 1
+        try:
+            results = await run_blocking(self.write_batch, [item for item, _ in batch], executor=self.executor)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            # The submitter may have been cancelled, the write happened anyway
+            if not future.done():
+                future.set_result(result)
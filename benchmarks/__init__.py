@@ -0,0 +1,7 @@
+"""
+Benchmarks of the database hot paths, run against a generated database in a temp directory.
+
+    python -m benchmarks.run --scale 10k --storage json --output before.json
+    python -m benchmarks.run --scale 10k --storage json --output after.json
+    python -m benchmarks.compare before.json after.json
+"""
@@ -0,0 +1,61 @@
+import argparse
+import json
+import sys
+from typing import List, Optional
+
+METRICS = ("p50_ms", "p99_ms", "peak_kib")
+
+# Absolute change below which a metric counts as noise, whatever the relative change
+NOISE_FLOOR = {"p50_ms": 0.05, "p99_ms": 0.05, "peak_kib": 16.0}
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.25) -> List[str]:
+    """
+    Print the change of every metric per benchmark and return the regressions, i.e. metrics that got
+    worse by more than threshold (0.25 = 25 %).
+    """
+    for key in ("storage", "dataset"):
+        if baseline["meta"].get(key) != current["meta"].get(key):
+            print(f"warning: {key} differs ({baseline['meta'].get(key)} vs {current['meta'].get(key)})")
+
+    regressions = []
+    print(f"{'benchmark':40} " + " ".join(f"{metric:>24}" for metric in METRICS))
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:40} (new)")
+            continue
+        cells = []
+        for metric in METRICS:
+            old, new = before[metric], result[metric]
+            change = (new - old) / old if old else 0.0
+            flag = ""
+            if change > threshold and new - old > NOISE_FLOOR[metric]:
+                flag = " !"
+                regressions.append(f"{name} {metric}: {old:.3f} -> {new:.3f} ({change:+.0%})")
+            cells.append(f"{old:9.3f} -> {new:9.3f}{flag:2}")
+        print(f"{name:40} " + " ".join(f"{cell:>24}" for cell in cells))
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files (see benchmarks.run).")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown counted as regression")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, encoding="utf-8") as handle:
+        baseline = json.load(handle)
+    with open(args.current, encoding="utf-8") as handle:
+        current = json.load(handle)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print("  " + regression)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
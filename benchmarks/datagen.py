@@ -0,0 +1,102 @@
+import random
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from devices import Device, DeviceState
+from maintenance import Maintenance, MaintenanceManager
+from reservations import Reservation, ReservationManager
+from users import User
+
+# Number of users, devices, reservations and maintenance entries per named scale
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+
+# Reservations are spread over this period, starting at BASE
+BASE = datetime(2025, 1, 1)
+PERIOD = timedelta(days=365)
+
+FIRST_NAMES = ["Anna", "Ben", "Clara", "David", "Eva", "Felix", "Greta", "Hannes", "Ida", "Jonas", "Lena", "Max"]
+LAST_NAMES = ["Gruber", "Huber", "Kofler", "Mair", "Moser", "Pichler", "Steiner", "Wallner", "Wolf"]
+DEVICE_KINDS = ["3D-Drucker", "Laser-Cutter", "Oszilloskop", "Lötstation", "CNC-Fräse", "Mikroskop", "Beamer"]
+
+
+@dataclass
+class Dataset:
+    users: int
+    devices: int
+    reservations: int
+    maintenances: int
+
+    @classmethod
+    def from_scale(cls, scale: str, **overrides: Optional[int]) -> "Dataset":
+        n = SCALES[scale] if scale in SCALES else int(scale)
+        counts = {"users": n, "devices": n, "reservations": n, "maintenances": n}
+        counts.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**counts)
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+def user_id(i: int) -> str:
+    return f"u{i:06d}"
+
+
+def device_name(i: int) -> str:
+    return f"{DEVICE_KINDS[i % len(DEVICE_KINDS)]} {i:06d}"
+
+
+def generate(dataset: Dataset, seed: int = 42, batch_size: int = 5_000) -> Dict[str, int]:
+    """
+    Fill the configured database (see DatabaseConnector.configure) with reproducible data of the
+    given size, using the bulk write APIs. Returns the number of rows written per table.
+    """
+    rng = random.Random(seed)
+
+    users = [
+        User(user_id(i), f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}")
+        for i in range(dataset.users)
+    ]
+    for start in range(0, len(users), batch_size):
+        User.store_many(users[start:start + batch_size])
+
+    devices = []
+    for i in range(dataset.devices):
+        device = Device(device_name(i), user_id(rng.randrange(max(1, dataset.users))))
+        # A few devices are out of service, like in a real fleet
+        roll = rng.random()
+        if roll < 0.03:
+            device.state = DeviceState.MAINTENANCE
+        elif roll < 0.05:
+            device.state = DeviceState.INACTIVE
+        devices.append(device)
+    for start in range(0, len(devices), batch_size):
+        Device.store_many(devices[start:start + batch_size])
+
+    # Bookings of 1-8 hours during working hours; some collide and are rejected like in real use
+    reservations = []
+    for _ in range(dataset.reservations):
+        day = BASE + timedelta(days=rng.randrange(PERIOD.days))
+        start = day + timedelta(hours=rng.randint(7, 16))
+        end = start + timedelta(hours=rng.randint(1, 8))
+        reservations.append(Reservation(
+            None, device_name(rng.randrange(max(1, dataset.devices))),
+            user_id(rng.randrange(max(1, dataset.users))), start, end,
+        ))
+    manager = ReservationManager()
+    accepted = 0
+    for start in range(0, len(reservations), batch_size):
+        accepted += sum(r.accepted for r in manager.create_many(reservations[start:start + batch_size]))
+
+    maintenances = [
+        Maintenance(
+            None, device_name(rng.randrange(max(1, dataset.devices))), "Wartung",
+            round(rng.uniform(20, 800), 2), BASE + timedelta(days=rng.randrange(PERIOD.days)),
+        )
+        for _ in range(dataset.maintenances)
+    ]
+    maintenance_manager = MaintenanceManager()
+    for start in range(0, len(maintenances), batch_size):
+        maintenance_manager.upsert_many(maintenances[start:start + batch_size])
+
+    return {"users": len(users), "devices": len(devices), "reservations": accepted, "maintenances": len(maintenances)}
@@ -0,0 +1,241 @@
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+# Allow "python benchmarks/run.py" next to "python -m benchmarks.run"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.datagen import BASE, PERIOD, SCALES, Dataset, device_name, generate, user_id
+from database import DatabaseConnector
+from devices import Device
+from maintenance import Maintenance, MaintenanceManager
+from read_cache import TableCache
+from reservations import Reservation, ReservationManager
+from snapshots import DeviceRecord, UserRecord
+from users import User
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Latency statistics of repeat calls of fn (in ms) and the peak memory allocated by one call (in KiB)."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+
+    # Measured separately, tracing allocations would distort the timings
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "n": repeat,
+        "mean_ms": sum(latencies) / len(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": latencies[-1],
+        "peak_kib": peak / 1024,
+    }
+
+
+def build_benchmarks(dataset: Dataset, rng: random.Random) -> Dict[str, tuple]:
+    """name -> (function, repeat factor). Scans get fewer repetitions than point operations."""
+    reservations = ReservationManager()
+    maintenances = MaintenanceManager()
+    new_ids = iter(range(10 ** 9))
+
+    def random_user() -> str:
+        return user_id(rng.randrange(dataset.users))
+
+    def random_device() -> str:
+        return device_name(rng.randrange(dataset.devices))
+
+    def random_slot():
+        start = BASE + timedelta(days=rng.randrange(PERIOD.days), hours=rng.randint(0, 23))
+        return start, start + timedelta(hours=rng.randint(1, 8))
+
+    def store_existing():
+        User(random_user(), "Umbenannt").store_data()
+
+    def store_new():
+        User(f"bench{next(new_ids)}", "Neu").store_data()
+
+    def create_reservation():
+        start, end = random_slot()
+        reservations.create(Reservation(None, random_device(), random_user(), start, end))
+
+    def is_available():
+        start, end = random_slot()
+        reservations.is_available(random_device(), start, end)
+
+    def upsert_maintenance():
+        maintenances.upsert(Maintenance(None, random_device(), "Bench", 10.0, BASE))
+
+    # The data each main.py view loads on a rerun, without the process-wide TableCache (cold path)
+    def view_devices():
+        users = User.find_all()
+        devices = Device.find_all(lazy=True)
+        devices.column("device_name")
+        [f"{u.name} ({u.id})" for u in users]
+        device = Device.find_by_attribute("device_name", random_device())
+        reservations.current_reservation(device.device_name, BASE + PERIOD / 2)
+
+    def view_users():
+        User.find_all()
+        Device.find_by_attribute("managed_by_user_id", random_user(), num_to_return=100)
+
+    def view_reservations():
+        User.find_all()
+        Device.find_all(lazy=True).column("device_name")
+        reservations.find_page(0, 25)
+        reservations.find_page(0, 25, filters={"device_name": random_device()})
+        start, end = random_slot()
+        reservations.find_free_slots(random_device(), start.replace(hour=0), start.replace(hour=0) + timedelta(days=1))
+        reservations.find_available_devices(start, end)
+
+    def view_maintenance():
+        Device.find_all(lazy=True).column("device_name")
+        maintenances.cost_summary()
+        maintenances.find_page(0, 25, descending=True)
+
+    def view_fleet():
+        reservations.fleet_status(BASE + timedelta(days=rng.randrange(PERIOD.days), hours=12))
+
+    # What main.py reads from its process-wide TableCache on every rerun (warm path)
+    cache = TableCache()
+
+    def view_snapshots():
+        users = cache.get_snapshot(UserRecord)
+        cache.get_snapshot(DeviceRecord).column("device_name")
+        users.derive("labels", lambda rows: tuple(f"{u.name} ({u.id})" for u in rows))
+
+    def view_snapshots_after_write():
+        store_existing()
+        view_snapshots()
+
+    return {
+        "entity.store_data (update)": (store_existing, 1),
+        "entity.store_data (insert)": (store_new, 1),
+        "entity.find_by_attribute (indexed)": (lambda: User.find_by_attribute("id", random_user()), 1),
+        "entity.find_by_attribute (scan)": (lambda: User.find_by_attribute("name", "Niemand"), 0.1),
+        "entity.find_all (users)": (User.find_all, 0.1),
+        "entity.find_all (devices, lazy)": (lambda: Device.find_all(lazy=True), 0.1),
+        "reservations.create": (create_reservation, 1),
+        "reservations.is_available": (is_available, 1),
+        "maintenance.upsert": (upsert_maintenance, 1),
+        "view.devices": (view_devices, 0.1),
+        "view.users": (view_users, 0.1),
+        "view.reservations": (view_reservations, 0.1),
+        "view.maintenance": (view_maintenance, 0.1),
+        "view.fleet": (view_fleet, 0.1),
+        "view.snapshots (unchanged)": (view_snapshots, 1),
+        "view.snapshots (after a write)": (view_snapshots_after_write, 0.1),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(dataset: Dataset, storage: str = "json", repeat: int = 100, seed: int = 42,
+        only: Optional[str] = None, directory: Optional[str] = None) -> dict:
+    """Generate the dataset into a fresh database in directory (default: a temp dir) and run the benchmarks."""
+    own_directory = directory is None
+    directory = directory or tempfile.mkdtemp(prefix="bench_")
+    connector = DatabaseConnector()
+    previous = (connector.path, connector.storage)
+    try:
+        connector.configure(path=os.path.join(directory, "database.json"), storage=storage)
+        start = time.perf_counter()
+        rows = generate(dataset, seed)
+        generate_s = time.perf_counter() - start
+
+        rng = random.Random(seed)
+        results = {}
+        for name, (fn, factor) in build_benchmarks(dataset, rng).items():
+            if only and only not in name:
+                continue
+            results[name] = measure(fn, max(3, int(repeat * factor)))
+            print(f"{name:40} p50 {results[name]['p50_ms']:9.3f} ms   p99 {results[name]['p99_ms']:9.3f} ms"
+                  f"   peak {results[name]['peak_kib']:10.1f} KiB", file=sys.stderr)
+    finally:
+        connector.configure(path=previous[0], storage=previous[1])
+        if own_directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage": storage,
+            "seed": seed,
+            "repeat": repeat,
+            "dataset": dataset.to_dict(),
+            "rows": rows,
+            "generate_s": generate_s,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the database hot paths on generated data.")
+    parser.add_argument("--scale", default="1k", help=f"{'/'.join(SCALES)} or a number of rows per table")
+    for table in ("users", "devices", "reservations", "maintenances"):
+        parser.add_argument(f"--{table}", type=int, help=f"number of {table} (overrides --scale)")
+    parser.add_argument("--storage", default="json", choices=sorted(DatabaseConnector.STORAGES))
+    parser.add_argument("--repeat", type=int, default=100, help="calls per point operation (scans: a tenth)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", help="only run benchmarks whose name contains this")
+    parser.add_argument("--output", help="write the results as JSON to this file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    dataset = Dataset.from_scale(
+        args.scale, users=args.users, devices=args.devices,
+        reservations=args.reservations, maintenances=args.maintenances,
+    )
+    report = run(dataset, args.storage, args.repeat, args.seed, args.only)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import threading
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Mapping, Optional, Tuple
+
+# Operations of a Change
+PUT = "put"
+DELETE = "delete"
+# The table (all tables if Change.table is None) changed in a way the feed doesn't know, e.g. another
+# process wrote to the database file: readers have to reload it
+RESET = "reset"
+
+
+@dataclass(frozen=True)
+class Change:
+    seq: int
+    table: Optional[str]
+    op: str
+    doc_id: Optional[int] = None
+    # The new document for PUT (a copy, readers may keep it)
+    value: Optional[Mapping] = None
+
+
+class ChangeFeed:
+    """
+    Ordered feed of the changes written through one database handle. Readers either poll with a
+    cursor (since()) or subscribe to be called after every write.
+    Only the latest `retain` changes are kept; since() returns None for a cursor that is older,
+    the reader then has to reload, just like after a RESET.
+    """
+
+    def __init__(self, retain: int = 10_000) -> None:
+        self.retain = retain
+        self._changes: List[Change] = []
+        # Sequence number of self._changes[0]
+        self._first_seq = 1
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable[[List[Change]], None]] = []
+
+    @property
+    def cursor(self) -> int:
+        """Sequence number of the latest change (0 before the first one)."""
+        return self._seq
+
+    def publish(self, changes: Iterable[Tuple[Optional[str], str, Optional[int], Optional[Mapping]]]) -> None:
+        """Append (table, op, doc_id, value) changes and pass them to the subscribers."""
+        with self._lock:
+            published = []
+            for table, op, doc_id, value in changes:
+                self._seq += 1
+                published.append(Change(self._seq, table, op, doc_id, value))
+            if not published:
+                return
+            self._changes.extend(published)
+            if len(self._changes) > 2 * self.retain:
+                drop = len(self._changes) - self.retain
+                del self._changes[:drop]
+                self._first_seq += drop
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(published)
+
+    def since(self, cursor: int, table: Optional[str] = None) -> Optional[List[Change]]:
+        """
+        The changes after cursor (of table and the RESETs of all tables, if table is given), oldest first.
+        None if changes after cursor are no longer retained.
+        """
+        with self._lock:
+            if cursor + 1 < self._first_seq:
+                return None
+            changes = self._changes[cursor + 1 - self._first_seq:]
+        if table is None:
+            return changes
+        return [change for change in changes if change.table == table or change.table is None]
+
+    def subscribe(self, callback: Callable[[List[Change]], None]) -> Callable[[], None]:
+        """
+        Call callback(changes) after every write, in the writing thread while it still holds the table
+        lock: it has to be quick and must not write itself. Returns a function that unsubscribes.
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe() -> None:
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
@@ -1,24 +1,692 @@
+import atexit
 import os
-from tinydb import TinyDB
-from tinydb.table import Table
-from tinydb.storages import JSONStorage
-from serializer import serializer
+import threading
+import warnings
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple, TypeVar
+
+from tinydb import TinyDB, Query
+from tinydb.table import Document, Table
+from changes import DELETE, PUT, RESET, ChangeFeed
+from indexes import HashIndex, IntervalIndex, SortedIndex
+from instrumentation import count, instrumented
+from queries import In, Plan, Range, matches
+from sequences import SequenceAllocator
+from serializer import make_serializer
+from sqlite_store import SQLiteDatabase, migrate_json_to_sqlite
+from storage import VERSION_FIELD, JournalStorage, ShardedJSONStorage, WriteBehindMiddleware
+
+
+class _TrackingDict(dict):
+    """dict that remembers which document ids a table updater touched."""
+
+    def __init__(self, *args) -> None:
+        super().__init__(*args)
+        self.touched = set()
+        # Copies of the documents that were only read so far, to tell whether they were modified in place
+        self._originals = {}
+
+    def __getitem__(self, key):
+        # Updates modify the documents in place, so reading one counts as touching it
+        value = super().__getitem__(key)
+        if key not in self.touched:
+            self.touched.add(key)
+            self._originals[key] = dict(value)
+        return value
+
+    def __setitem__(self, key, value) -> None:
+        self.touched.add(key)
+        self._originals.pop(key, None)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key) -> None:
+        self.touched.add(key)
+        self._originals.pop(key, None)
+        super().__delitem__(key)
+
+    def pop(self, key, *default):
+        self.touched.add(key)
+        self._originals.pop(key, None)
+        return super().pop(key, *default)
+
+    def clear(self) -> None:
+        self.touched.update(self.keys())
+        self._originals.clear()
+        super().clear()
+
+    def changed(self) -> set:
+        """The touched ids whose documents were actually inserted, modified or removed."""
+        return {
+            key for key in self.touched
+            if key not in self._originals or dict.get(self, key) != self._originals[key]
+        }
+
+
+class ConflictError(Exception):
+    """A document was changed or removed by someone else since it was read."""
+
+
+T = TypeVar("T")
+
+
+def retry_on_conflict(action: Callable[[], T], attempts: int = 3) -> T:
+    """
+    Run action (which has to read what it changes itself) until it doesn't raise ConflictError,
+    at most attempts times. The last ConflictError is raised again.
+    """
+    for attempt in range(attempts):
+        try:
+            return action()
+        except ConflictError:
+            if attempt == attempts - 1:
+                raise
+
+
+class SharedTable(Table):
+    """
+    Table that serializes its read-modify-write cycles, as one handle is shared by all callers.
+    Keeps hash indexes (see ensure_index) and interval indexes (see ensure_interval_index)
+    in sync with every insert, update and remove.
+    Every write holds the table's cross-process lock (see locked()) and increments the version
+    stamp (VERSION_FIELD) of the documents it changes.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._indexes: Dict[str, HashIndex] = {}
+        self._interval_indexes: Dict[str, IntervalIndex] = {}
+        self._sorted_indexes: Dict[str, SortedIndex] = {}
+        self._indexed_generation = None
+        # Number of lookups that had to fall back to a full table scan
+        self.scans = 0
+
+    def refresh(self) -> None:
+        """Let the storage notice changes on disk, writes of other processes are published as a RESET."""
+        with self._storage.lock:
+            self._storage.read()
+
+    @property
+    def changes(self) -> ChangeFeed:
+        """Feed of the writes to all tables of the handle, see changes.py."""
+        return self._storage.changes
+
+    def ensure_index(self, field: str) -> HashIndex:
+        """Create a hash index on field (if it doesn't exist yet) and return it."""
+        with self._storage.lock:
+            self._sync_indexes()
+            index = self._indexes.get(field)
+            if index is None:
+                index = HashIndex(field)
+                index.rebuild(self._read_table())
+                self._indexes[field] = index
+            return index
+
+    def ensure_interval_index(self, group_field: str, start_field: str, end_field: str) -> IntervalIndex:
+        """Create an index over the [start_field, end_field) intervals per group_field value and return it."""
+        with self._storage.lock:
+            self._sync_indexes()
+            index = self._interval_indexes.get(group_field)
+            if index is None:
+                index = IntervalIndex(group_field, start_field, end_field)
+                index.rebuild(self._read_table())
+                self._interval_indexes[group_field] = index
+            return index
+
+    def ensure_sorted_index(self, field: str) -> SortedIndex:
+        """Create an index keeping the documents ordered by field (if it doesn't exist yet) and return it."""
+        with self._storage.lock:
+            self._sync_indexes()
+            index = self._sorted_indexes.get(field)
+            if index is None:
+                index = SortedIndex(field)
+                index.rebuild(self._read_table())
+                self._sorted_indexes[field] = index
+            return index
+
+    def _all_indexes(self) -> list:
+        return (
+            list(self._indexes.values())
+            + list(self._interval_indexes.values())
+            + list(self._sorted_indexes.values())
+        )
+
+    def _sync_indexes(self) -> None:
+        # The storage reloads its data if the file was changed on disk, indexes have to follow
+        raw_table = self._read_table()
+        if self._indexed_generation != self._storage.generation:
+            indexes = self._all_indexes()
+            for index in indexes:
+                index.rebuild(raw_table)
+            count(rows_scanned=len(raw_table) * len(indexes))
+            # Someone else may have inserted documents
+            self._next_id = None
+            self._indexed_generation = self._storage.generation
+
+    @contextmanager
+    def locked(self):
+        """
+        Hold the lock of this table for a read-check-write sequence, e.g. checking a document's version
+        before overwriting it. With DatabaseConnector.configure(multiprocess=True) this is a file lock
+        (per database file, per table file for the sharded storage) and the block starts on the latest
+        data written by any process.
+        """
+        with self._storage.lock, self._storage.table_lock(self.name):
+            self._sync_indexes()
+            yield self
+
+    def insert(self, document: Mapping) -> int:
+        # TinyDB picks the id before writing, which has to happen under the lock as well
+        with self.locked():
+            return super().insert(document)
+
+    def insert_multiple(self, documents) -> List[int]:
+        with self.locked():
+            return super().insert_multiple(documents)
+
+    def raw_values(self) -> List[Mapping]:
+        """The stored documents without copying them into Document objects. Callers must not modify them."""
+        values = list(self._read_table().values())
+        count(rows_scanned=len(values))
+        return values
+
+    def raw_items(self) -> List[Tuple[int, Mapping]]:
+        """(doc_id, document) pairs like raw_values(), for callers that need the ids as well."""
+        items = [(int(doc_id), doc) for doc_id, doc in self._read_table().items()]
+        count(rows_scanned=len(items))
+        return items
+
+    def search(self, cond) -> List[Document]:
+        if self._query_cache.get(cond) is None:
+            count(rows_scanned=len(self._read_table()))
+        return super().search(cond)
+
+    def lookup(self, field: str, value) -> List[Document]:
+        """Return all documents with document[field] == value, using an index if there is one."""
+        with self._storage.lock:
+            self._sync_indexes()
+            index = self._indexes.get(field)
+            if index is None:
+                self.scans += 1
+                return self.search(Query()[field] == value)
+            return self._documents(sorted(index.lookup(value)))
+
+    def count_lookup(self, field: str, value) -> int:
+        """Number of documents lookup(field, value) returns, O(1) with an index on field."""
+        with self._storage.lock:
+            self._sync_indexes()
+            index = self._indexes.get(field)
+            if index is None:
+                return len(self.lookup(field, value))
+            return index.count(value)
+
+    def find_overlapping(self, group_field: str, group_value, start, end) -> List[Document]:
+        """Documents of group_value whose interval overlaps [start, end), ordered by start."""
+        with self._storage.lock:
+            self._sync_indexes()
+            index = self._interval_indexes[group_field]
+            return self._documents(index.overlapping(group_value, start, end))
+
+    def find_covering(self, group_field: str, group_value, at) -> List[Document]:
+        """Documents of group_value whose interval contains the point in time at."""
+        with self._storage.lock:
+            self._sync_indexes()
+            index = self._interval_indexes[group_field]
+            return self._documents(index.covering(group_value, at))
+
+    def longest_interval(self, group_field: str) -> Any:
+        """Upper bound for end - start of the documents in the interval index of group_field (None if empty)."""
+        with self._storage.lock:
+            self._sync_indexes()
+            return self._interval_indexes[group_field].longest()
+
+    def iter_sorted(self, field: str, lo: Any = None, hi: Any = None, chunk_size: int = 256) -> Iterator[Document]:
+        """
+        Yield the documents with lo <= document[field] < hi (None = unbounded) ordered by field.
+        Documents are read in chunks, so stopping early doesn't touch the rest of the range;
+        the lock is only held while a chunk is read.
+        """
+        index = self._sorted_indexes.get(field) or self.ensure_sorted_index(field)
+        after = None
+        while True:
+            with self._storage.lock:
+                self._sync_indexes()
+                start, end = index.bounds(lo, hi)
+                if after is not None:
+                    # Positions shift when the table changes between chunks, the last entry doesn't
+                    start = max(start, index.position_after(*after))
+                docs = self._documents(index.doc_ids(start, min(end, start + chunk_size)))
+            if not docs:
+                return
+            yield from docs
+            after = (docs[-1][field], docs[-1].doc_id)
+
+    def iter_documents(self, chunk_size: int = 256) -> Iterator[Document]:
+        """
+        Yield all documents in doc_id order, copying one chunk at a time under the lock (e.g. for an
+        export). Only the ids are taken up front; documents removed meanwhile are skipped, documents
+        inserted meanwhile are not part of the result.
+        """
+        with self._storage.lock:
+            doc_ids = [int(key) for key in self._read_table()]
+        for start in range(0, len(doc_ids), chunk_size):
+            with self._storage.lock:
+                docs = self._documents(doc_ids[start:start + chunk_size])
+            yield from docs
+
+    def find_page(self, offset: int = 0, limit: int = 20, order_by: Optional[str] = None,
+                  descending: bool = False, filters: Optional[Mapping[str, Any]] = None,
+                  value_range: Optional[Tuple[Any, Any]] = None) -> "Page":
+        """
+        Return one page of documents ordered by order_by (default: insertion order).
+        filters: field -> value equality conditions.
+        value_range: (lo, hi) bounds for order_by, lo <= value < hi, None for an open end.
+        Ordering uses a sorted index on order_by (created on first use), so without filters a page
+        costs O(log n + limit). Documents without the order_by field are not part of the result.
+        """
+        filters = dict(filters or {})
+        with self._storage.lock:
+            self._sync_indexes()
+            raw_table = self._read_table()
+
+            def matches(doc: Mapping) -> bool:
+                return all(doc.get(field) == value for field, value in filters.items())
+
+            if order_by is None:
+                if value_range is not None:
+                    raise ValueError("value_range needs order_by")
+                # Plain dicts keep the insertion order, which is the doc_id order
+                keys = reversed(raw_table) if descending else iter(raw_table)
+                if not filters:
+                    page_ids = [int(key) for key in islice(keys, offset, offset + limit)]
+                    return Page(self._documents(page_ids), len(raw_table), offset, limit)
+                count(rows_scanned=len(raw_table))
+                doc_ids = (int(key) for key in keys if matches(raw_table[key]))
+                return self._page(doc_ids, offset, limit)
+
+            index = self._sorted_indexes.get(order_by) or self.ensure_sorted_index(order_by)
+            lo, hi = value_range if value_range is not None else (None, None)
+            start, end = index.bounds(lo, hi)
+            if not filters:
+                total = end - start
+                first = end - offset if descending else start + offset
+                if descending:
+                    doc_ids = index.doc_ids(max(start, first - limit), max(start, first), descending=True)
+                else:
+                    doc_ids = index.doc_ids(min(end, first), min(end, first + limit))
+                return Page(self._documents(doc_ids), total, offset, limit)
+
+            # If a filter field is hash indexed and selective, sorting its documents beats walking the range
+            buckets = [self._indexes[f].lookup(v) for f, v in filters.items() if f in self._indexes]
+            bucket = min(buckets, key=len) if buckets else None
+            if bucket is not None and len(bucket) < end - start:
+                count(rows_scanned=len(bucket))
+                candidates = []
+                for doc_id in bucket:
+                    doc = raw_table.get(str(doc_id))
+                    value = doc.get(order_by) if doc is not None else None
+                    if value is None or not matches(doc):
+                        continue
+                    if (lo is None or value >= lo) and (hi is None or value < hi):
+                        candidates.append((value, doc_id))
+                candidates.sort(reverse=descending)
+                return self._page((doc_id for value, doc_id in candidates), offset, limit)
+
+            count(rows_scanned=end - start)
+            doc_ids = (
+                doc_id for doc_id in index.doc_ids(start, end, descending)
+                if matches(raw_table[str(doc_id)])
+            )
+            return self._page(doc_ids, offset, limit)
+
+    def _page(self, doc_ids: Iterator[int], offset: int, limit: int) -> "Page":
+        # Walks all matching ids to count them, but only turns the page itself into documents
+        page_ids = []
+        total = 0
+        for doc_id in doc_ids:
+            if offset <= total < offset + limit:
+                page_ids.append(doc_id)
+            total += 1
+        return Page(self._documents(page_ids), total, offset, limit)
+
+    def find_where(self, where: Mapping[str, Any], order_by: Optional[str] = None, descending: bool = False,
+                   limit: Optional[int] = None) -> List[Document]:
+        """
+        Documents fulfilling all conditions of where: field -> value (equality), In(values) or Range(lo, hi).
+        Ordered by order_by (documents without it are left out, like in find_page) or by insertion order.
+        The candidates come from the most selective index that applies, see explain_where().
+        """
+        with self._storage.lock:
+            self._sync_indexes()
+            plan, doc_ids = self._plan_where(where, order_by, descending)
+            raw_table = self._read_table()
+            found = []
+            examined = 0
+            for doc_id in doc_ids:
+                examined += 1
+                doc = raw_table.get(str(doc_id))
+                if doc is None or not matches(doc, where) or (order_by is not None and doc.get(order_by) is None):
+                    continue
+                found.append((doc_id, doc))
+                if plan.ordered and limit is not None and len(found) >= limit:
+                    break
+            count(rows_scanned=examined)
+            if not plan.ordered:
+                if order_by is None:
+                    found.sort(key=lambda item: item[0], reverse=descending)
+                else:
+                    found.sort(key=lambda item: (item[1][order_by], item[0]), reverse=descending)
+            if limit is not None:
+                found = found[:limit]
+            return [self.document_class(doc, self.document_id_class(doc_id)) for doc_id, doc in found]
+
+    def explain_where(self, where: Mapping[str, Any], order_by: Optional[str] = None,
+                      descending: bool = False) -> Plan:
+        """The Plan find_where() would use for these arguments."""
+        with self._storage.lock:
+            self._sync_indexes()
+            return self._plan_where(where, order_by, descending)[0]
+
+    def _plan_where(self, where: Mapping[str, Any], order_by: Optional[str],
+                    descending: bool) -> Tuple[Plan, Iterable[int]]:
+        # Candidate strategies as (plan, doc ids); the one yielding the fewest documents wins,
+        # on a tie the one that is already in order_by order
+        options = []
+        for field, condition in where.items():
+            if isinstance(condition, Range):
+                index = self._sorted_indexes.get(field)
+                if index is not None:
+                    start, end = index.bounds(condition.lo, condition.hi)
+                    ordered = order_by == field
+                    options.append((
+                        Plan("range", field, end - start, ordered),
+                        partial(index.doc_ids, start, end, descending and ordered),
+                    ))
+            elif field in self._indexes:
+                index = self._indexes[field]
+                values = condition.values if isinstance(condition, In) else (condition,)
+                ids = set().union(*(index.lookup(value) for value in values))
+                options.append((Plan("index", field, len(ids), order_by is None), partial(sorted, ids, reverse=descending)))
+
+        raw_table = self._read_table()
+        if order_by is not None and order_by in self._sorted_indexes:
+            # Walking order_by's index costs as much as a scan, but limit can stop it early
+            index = self._sorted_indexes[order_by]
+            options.append((Plan("range", order_by, len(index), True), partial(index.doc_ids, 0, len(index), descending)))
+        keys = reversed(raw_table) if descending else iter(raw_table)
+        options.append((Plan("scan", None, len(raw_table), order_by is None), lambda: (int(key) for key in keys)))
+        plan, doc_ids = min(options, key=lambda option: (option[0].candidates, not option[0].ordered))
+        return plan, doc_ids()
+
+    def _documents(self, doc_ids) -> List[Document]:
+        raw_table = self._read_table()
+        docs = []
+        for doc_id in doc_ids:
+            doc = raw_table.get(str(doc_id))
+            if doc is not None:
+                docs.append(self.document_class(doc, self.document_id_class(doc_id)))
+        count(rows_scanned=len(docs))
+        return docs
+
+    def write_many(self, documents: List[Tuple[Optional[int], Mapping]]) -> List[int]:
+        """
+        Insert or update several documents with a single table update (and thus a single storage write).
+        documents: (doc_id, document) pairs, doc_id None inserts the document as a new one.
+        Returns the ids of the written documents.
+        """
+        doc_ids = []
+
+        def updater(table: dict) -> None:
+            for doc_id, document in documents:
+                if doc_id is None:
+                    doc_id = self._get_next_id()
+                    table[doc_id] = dict(document)
+                else:
+                    table[doc_id].update(document)
+                doc_ids.append(doc_id)
+
+        with self.locked():
+            self._update_table(updater)
+        return doc_ids
+
+    def index_stats(self) -> Dict[str, Dict[str, int]]:
+        """Hits and misses per index."""
+        indexes = dict(self._indexes)
+        indexes.update((f"{field} (interval)", index) for field, index in self._interval_indexes.items())
+        indexes.update((f"{field} (sorted)", index) for field, index in self._sorted_indexes.items())
+        return {name: {"hits": index.hits, "misses": index.misses} for name, index in indexes.items()}
+
+    def _update_table(self, updater):
+        # Same as Table._update_table, but records which documents the updater touched
+        with self.locked():
+            tables = self._storage.read()
+            if tables is None:
+                tables = {}
+            table = _TrackingDict(
+                (self.document_id_class(doc_id), doc)
+                for doc_id, doc in tables.get(self.name, {}).items()
+            )
+
+            updater(table)
+
+            changed = table.changed()
+            for doc_id in changed:
+                doc = dict.get(table, doc_id)
+                if doc is not None:
+                    doc[VERSION_FIELD] = doc.get(VERSION_FIELD, 0) + 1
+
+            tables[self.name] = {str(doc_id): doc for doc_id, doc in table.items()}
+            # Storages that only persist the changed documents (see JournalStorage) need to know them
+            mark_dirty = getattr(self._storage, "mark_dirty", None)
+            if mark_dirty is not None:
+                mark_dirty(self.name, changed)
+            self._storage.write(tables)
+            self.clear_cache()
+
+            published = []
+            for doc_id in sorted(changed):
+                doc = dict.get(table, doc_id)
+                for index in self._all_indexes():
+                    index.update(doc_id, doc)
+                # Copies, the stored documents are updated in place by later writes
+                published.append((self.name, PUT, doc_id, dict(doc)) if doc is not None else (self.name, DELETE, doc_id, None))
+            self._storage.changes.publish(published)
+
+
+@dataclass
+class WriteResult:
+    """Outcome of one item of a bulk write."""
+    item: Any
+    accepted: bool
+    reason: str = ""
+
+
+@dataclass
+class Page:
+    """One page of a query result, total is the number of matches over all pages."""
+    items: list
+    total: int
+    offset: int
+    limit: int
+
+
+class SharedTinyDB(TinyDB):
+    table_class = SharedTable
+
+    @property
+    def changes(self) -> ChangeFeed:
+        """Feed of the changes written through this handle (see changes.py)."""
+        return self.storage.changes
+
+    def drop_table(self, name: str) -> None:
+        super().drop_table(name)
+        self.changes.publish([(name, RESET, None, None)])
+
+    def drop_tables(self) -> None:
+        super().drop_tables()
+        self.changes.publish([(None, RESET, None, None)])
+
+    def flush(self) -> None:
+        self.storage.flush()
+
 
 class DatabaseConnector:
     """
     Usage: DatabaseConnector().get_table(<table_name>)
     The information about the actual database file path and the serializer objects has been abstracted away into this class
+
+    There is exactly one TinyDB handle per database file. It keeps the decoded data in memory and
+    writes changes back according to the flush policy (see configure()).
     """
-    # Turns the class into a naive singleton
-    # --> not thread safe and doesn't handle inheritance particularly well
+    # Turns the class into a singleton
+    # --> doesn't handle inheritance particularly well
     __instance = None
-    
+    __lock = threading.Lock()
+
+    # Factories for the storage (chain) below the write-behind cache
+    STORAGES = {
+        "json": make_serializer,
+        "journal": lambda: JournalStorage,
+        "sharded": lambda: ShardedJSONStorage,
+        # Not a TinyDB storage, the tables themselves live in SQLite (see sqlite_store.py)
+        "sqlite": None,
+    }
+
     def __new__(cls):
-        if cls.__instance is None:
-            cls.__instance = super().__new__(cls)
-            cls.__instance.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database.json')
+        with cls.__lock:
+            if cls.__instance is None:
+                cls.__instance = super().__new__(cls)
+                cls.__instance.path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database.json')
+                cls.__instance.flush_every = 1
+                cls.__instance.flush_interval_ms = None
+                cls.__instance.storage = "json"
+                cls.__instance.multiprocess = True
+                cls.__instance._handles = {}
+                atexit.register(cls.__instance.close)
 
         return cls.__instance
-    
+
+    def configure(self, path: Optional[str] = None, flush_every: Optional[int] = None,
+                  flush_interval_ms: Optional[int] = None, storage: Optional[str] = None,
+                  multiprocess: Optional[bool] = None) -> None:
+        """
+        Change the database file, the flush policy and/or the storage backend.
+        flush_every=1 writes every change through to disk, higher values batch changes in memory.
+        flush_interval_ms bounds how long a change may stay in memory only.
+        storage: "json" rewrites the whole file on every flush, "journal" only appends the changes
+        to a log (see JournalStorage). Both use the same file format for the database file itself.
+        "sharded" keeps one file per table, so a write only rewrites the table it touched (see ShardedJSONStorage).
+        "sqlite" keeps the tables in <path without extension>.sqlite, migrating the JSON file on first use.
+        multiprocess (default on): several processes may write the same database. Writes hold a file
+        lock (per table file for "sharded", per database file otherwise, SQLite locks itself) and are
+        written through. Batching (flush_every > 1 or flush_interval_ms) only works within one process,
+        so it turns multiprocess off with a warning unless multiprocess=False is passed as well;
+        multiprocess=True together with batching raises ValueError.
+        Open handles are flushed and closed, so the new settings apply to the next get_table call.
+        """
+        if storage is not None and storage not in self.STORAGES:
+            raise ValueError(f"Unknown storage {storage!r}, expected one of {sorted(self.STORAGES)}")
+        batching = (flush_every is not None and flush_every > 1) or flush_interval_ms is not None
+        if batching and multiprocess:
+            raise ValueError("Write-behind batching keeps changes in memory, it can't be used with multiprocess")
+        self.close()
+        if path is not None:
+            self.path = path
+        if storage is not None:
+            self.storage = storage
+        if flush_every is not None:
+            self.flush_every = flush_every
+        if flush_interval_ms is not None:
+            self.flush_interval_ms = flush_interval_ms
+        if multiprocess is not None:
+            self.multiprocess = multiprocess
+        elif batching and self.multiprocess:
+            warnings.warn(
+                "Write-behind batching turns multiprocess off, other processes must not write this database; "
+                "pass multiprocess=False to silence this warning"
+            )
+            self.multiprocess = False
+
+    def get_db(self) -> TinyDB:
+        """Return the shared TinyDB handle of the configured database file."""
+        with self.__lock:
+            db = self._handles.get(self.path)
+            if db is None:
+                if self.storage == "sqlite":
+                    db = self._open_sqlite()
+                else:
+                    storage = WriteBehindMiddleware(
+                        self.STORAGES[self.storage](), self.flush_every, self.flush_interval_ms, self.multiprocess
+                    )
+                    db = SharedTinyDB(self.path, storage=storage)
+                self._handles[self.path] = db
+            return db
+
+    def _open_sqlite(self) -> SQLiteDatabase:
+        sqlite_path = os.path.splitext(self.path)[0] + ".sqlite"
+        if not os.path.exists(sqlite_path) and os.path.exists(self.path) and os.path.getsize(self.path):
+            migrate_json_to_sqlite(self.path, sqlite_path)
+        return SQLiteDatabase(sqlite_path)
+
     def get_table(self, table_name: str) -> Table:
-        return TinyDB(self.__instance.path, storage=serializer).table(table_name)
\ No newline at end of file
+        return self.get_db().table(table_name)
+
+    @instrumented
+    def next_id(self, table_name: str, id_field: str, count: int = 1) -> int:
+        """
+        Allocate count consecutive numeric ids for table_name and return the first one.
+        The sequence is persisted next to the database (safe against concurrent allocation, also across
+        processes). On first use it starts after the highest numeric id_field value found in the table.
+        """
+        sequences = SequenceAllocator(os.path.splitext(self.path)[0] + "_sequences.json")
+        # Always table lock before sequence lock (seeding reads the table), so processes can't deadlock
+        with self.get_table(table_name).locked():
+            return sequences.allocate(table_name, count, lambda: self._first_free_id(table_name, id_field))
+
+    @instrumented
+    def advance_id(self, table_name: str, id_field: str, ids: Iterable) -> None:
+        """
+        Make sure next_id() only allocates ids above the highest numeric one of ids, which were stored
+        with ids chosen by the caller (e.g. by an import). Ids that aren't numbers are ignored.
+        """
+        highest = None
+        for value in ids:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                continue
+            highest = value if highest is None else max(highest, value)
+        if highest is None:
+            return
+        sequences = SequenceAllocator(os.path.splitext(self.path)[0] + "_sequences.json")
+        with self.get_table(table_name).locked():
+            sequences.advance(table_name, highest + 1, lambda: self._first_free_id(table_name, id_field))
+
+    def _first_free_id(self, table_name: str, id_field: str) -> int:
+        # First id of a new sequence: after the highest numeric id_field value found in the table
+        highest = 0
+        for doc in self.get_table(table_name).raw_values():
+            try:
+                highest = max(highest, int(doc.get(id_field)))
+            except (TypeError, ValueError):
+                continue
+        return highest + 1
+
+    def archive_directory(self, table_name: str) -> str:
+        """Directory for the archive of table_name (see archive.py), next to the database."""
+        return os.path.join(os.path.splitext(self.path)[0] + "_archive", table_name)
+
+    @instrumented
+    def flush(self) -> None:
+        """Write all pending changes to disk."""
+        for db in list(self._handles.values()):
+            db.flush()
+
+    def close(self) -> None:
+        """Flush and close all open handles."""
+        with self.__lock:
+            for db in self._handles.values():
+                db.close()
+            self._handles.clear()
@@ -10,8 +10,13 @@ class DeviceState(Enum):
     INACTIVE = "inactive"
 
 
+# Cheaper than DeviceState(value) when decoding many stored devices
+_STATES_BY_VALUE = {state.value: state for state in DeviceState}
+
+
 class Device(Entity):
     """Device class - represents a device in the business logic."""
+    __slots__ = ("device_name", "managed_by_user_id", "is_active", "state")
 
     def __init__(self, device_name: str, managed_by_user_id: str):
         """Create a new device."""
@@ -38,17 +43,24 @@ class Device(Entity):
     def get_key_field(cls) -> str:
         return "device_name"
 
+    @classmethod
+    def get_index_fields(cls) -> list:
+        return ["managed_by_user_id"]
+
     @classmethod
     def from_dict(cls, data: dict):
-        if "device_name" not in data or "managed_by_user_id" not in data:
+        try:
+            device_name = data["device_name"]
+            managed_by_user_id = data["managed_by_user_id"]
+        except KeyError:
             raise ValueError(f"Invalid data for Device: {data}")
-        device = Device(data["device_name"], data["managed_by_user_id"])
-        if "is_active" in data:
-            device.is_active = data["is_active"]
-        if "created_at" in data:
-            device.created_at = data["created_at"]
-        if "state" in data:
-            device.state = DeviceState(data["state"])
+        device = cls._new()
+        device.device_name = device_name
+        device.managed_by_user_id = managed_by_user_id
+        device.is_active = data.get("is_active", True)
+        device.created_at = data["created_at"] if "created_at" in data else datetime.now()
+        state = data.get("state", DeviceState.AVAILABLE.value)
+        device.state = _STATES_BY_VALUE.get(state) or DeviceState(state)
         return device
 
     def reserve(self):
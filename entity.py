@@ -1,17 +1,53 @@
-import os
-from tinydb import TinyDB, Query
-from tinydb.storages import JSONStorage
-from database import DatabaseConnector
+from collections.abc import Sequence
+from typing import Any, Dict, List, Mapping, Optional
+from tinydb.table import Table
+from async_support import WriteCoalescer, run_blocking
+from instrumentation import instrumented
+from database import VERSION_FIELD, ConflictError, DatabaseConnector, Page, WriteResult
+from queries import In, Plan
+import relations
 from abc import ABC, abstractmethod
 from enum import Enum
 from datetime import datetime
 
 
+# WriteResult.reason of entities that were changed by someone else since they were read
+CONFLICT_REASON = "changed by someone else"
+
+
 class Entity(ABC):
-    """Base class for entities that can be persisted to the database."""
-    
+    """
+    Base class for entities that can be persisted to the database.
+    Subclasses declare their attributes in __slots__, which keeps instances small and
+    defines the fields that are stored (except private ones starting with "_").
+
+    Entities read from the database remember the version of their document; store_data() raises
+    ConflictError instead of overwriting a document someone else changed in the meantime.
+    """
+    __slots__ = ("created_at", "_version")
+
     def __init__(self) -> None:
         self.created_at = datetime.now()
+        # Not read from the database --> store_data() writes unconditionally
+        self._version = None
+
+    @classmethod
+    def _new(cls):
+        """Create an instance without running __init__ (and its side effects), for hydration in from_dict."""
+        return object.__new__(cls)
+
+    @classmethod
+    def get_fields(cls) -> tuple:
+        """All slots of the class hierarchy, base classes first."""
+        fields = cls.__dict__.get("_fields")
+        if fields is None:
+            fields = tuple(
+                f for klass in reversed(cls.__mro__) for f in klass.__dict__.get("__slots__", ())
+                if not f.startswith("_")
+            )
+            # Cached per class (looked up in cls.__dict__, so subclasses compute their own)
+            cls._fields = fields
+        return fields
 
     @abstractmethod
     def __str__(self) -> str:
@@ -35,60 +71,308 @@ class Entity(ABC):
     def from_dict(cls, data: dict):
         pass
 
-    def store_data(self) -> None:
-        """Insert or update this entity in the database."""
-        db = DatabaseConnector().get_table(self.__class__.get_table_name())
-        q = Query()
-        key_field = self.__class__.get_key_field()
-        existing = db.search(q[key_field] == getattr(self, key_field))
-        # Prepare a JSON-serializable copy of the object's dict.
+    @classmethod
+    def _from_stored(cls, data: Mapping):
+        """from_dict for documents read from the table, remembering their version."""
+        entity = cls.from_dict(data)
+        entity._version = data.get(VERSION_FIELD, 0)
+        return entity
+
+    @classmethod
+    def get_index_fields(cls) -> list:
+        """Fields that are indexed in addition to the key field. Override to opt into more indexes."""
+        return []
+
+    @classmethod
+    def get_table(cls) -> Table:
+        """Return the table of this entity with the key field and all index fields indexed."""
+        db = DatabaseConnector().get_table(cls.get_table_name())
+        for field in [cls.get_key_field()] + cls.get_index_fields():
+            db.ensure_index(field)
+        return db
+
+    def to_dict(self) -> dict:
+        """Return a JSON-serializable dict of the object's fields."""
         serializable = {}
-        for k, v in self.__dict__.items():
+        for k in self.__class__.get_fields():
+            if not hasattr(self, k):
+                continue
+            v = getattr(self, k)
             # Convert Enum values to their underlying value (e.g. DeviceState.AVAILABLE -> "available")
             if isinstance(v, Enum):
                 serializable[k] = v.value
             else:
                 serializable[k] = v
+        return serializable
 
-        if existing:
-            db.update(serializable, doc_ids=[existing[0].doc_id])
-        else:
-            db.insert(serializable)
+    @instrumented
+    def store_data(self) -> None:
+        """
+        Insert or update this entity in the database.
+        Raises ConflictError if the entity was read from the database and its document has been
+        changed or removed since; reload the entity and apply the change again (see retry_on_conflict).
+        """
+        db = self.__class__.get_table()
+        key_field = self.__class__.get_key_field()
+        serializable = self.to_dict()
+        version = getattr(self, "_version", None)
+
+        with db.locked():
+            existing = db.lookup(key_field, getattr(self, key_field))
+            if version is not None and (not existing or existing[0].get(VERSION_FIELD, 0) != version):
+                raise ConflictError(f"{self} was changed by someone else")
+            if existing:
+                doc_id = existing[0].doc_id
+                db.update(serializable, doc_ids=[doc_id])
+            else:
+                doc_id = db.insert(serializable)
+            self._version = db.get(doc_id=doc_id).get(VERSION_FIELD, 0)
 
+    @classmethod
+    @instrumented
+    def store_many(cls, entities: list) -> List[WriteResult]:
+        """
+        Insert or update several entities with a single database write.
+        Returns one WriteResult per entity. If the same key occurs more than once, the later entity wins,
+        just like calling store_data() for each of them: a later entity that was read from the database
+        is rejected as a conflict, as the earlier one changes the document it read.
+        """
+        db = cls.get_table()
+        key_field = cls.get_key_field()
+        results = []
+        writes = []
+        # key -> position in writes, so repeated keys update the pending write
+        pending = {}
+        with db.locked():
+            for entity in entities:
+                if not isinstance(entity, cls):
+                    results.append(WriteResult(entity, False, f"not a {cls.__name__}"))
+                    continue
+                key = getattr(entity, key_field, None)
+                if key is None or key == "":
+                    results.append(WriteResult(entity, False, f"missing {key_field}"))
+                    continue
+                existing = db.lookup(key_field, key)
+                version = getattr(entity, "_version", None)
+                # The version after the pending write of the key is one nobody could have read
+                if version is not None and (
+                    key in pending or not existing or existing[0].get(VERSION_FIELD, 0) != version
+                ):
+                    results.append(WriteResult(entity, False, CONFLICT_REASON))
+                    continue
+                if key in pending:
+                    doc_id, data = writes[pending[key]]
+                    data.update(entity.to_dict())
+                else:
+                    pending[key] = len(writes)
+                    writes.append((existing[0].doc_id if existing else None, entity.to_dict()))
+                results.append(WriteResult(entity, True))
+
+            if writes:
+                doc_ids = db.write_many(writes)
+                stored = {doc.doc_id: doc for doc in db.get(doc_ids=doc_ids)}
+                for result in results:
+                    if result.accepted:
+                        entity = result.item
+                        doc_id = doc_ids[pending[getattr(entity, key_field)]]
+                        entity._version = stored[doc_id].get(VERSION_FIELD, 0)
+        return results
+
+    @instrumented
     def delete(self) -> None:
-        """Delete this entity from the database."""
-        db = DatabaseConnector().get_table(self.__class__.get_table_name())
-        q = Query()
+        """
+        Delete this entity from the database, together with the documents referencing it through a
+        CASCADE relation (see relations.py). Raises relations.IntegrityError if documents of a RESTRICT
+        relation still reference it; nothing is deleted then.
+        """
+        db = self.__class__.get_table()
         key_field = self.__class__.get_key_field()
-        existing = db.search(q[key_field] == getattr(self, key_field))
-        if existing:
-            db.remove(doc_ids=[existing[0].doc_id])
+        table_name = self.__class__.get_table_name()
+        with relations.locked(table_name):
+            existing = db.lookup(key_field, getattr(self, key_field))
+            if existing:
+                relations.delete_dependents(table_name, getattr(self, key_field))
+                db.remove(doc_ids=[existing[0].doc_id])
+
+    def count_dependents(self) -> Dict[str, int]:
+        """Table -> number of its documents referencing this entity, from the reverse indexes in O(1)."""
+        return relations.count_dependents(self.__class__.get_table_name(), getattr(self, self.__class__.get_key_field()))
+
+    def has_dependents(self) -> bool:
+        return relations.has_dependents(self.__class__.get_table_name(), getattr(self, self.__class__.get_key_field()))
 
     @classmethod
-    def find_all(cls) -> list:
-        """Find all entities in the database."""
-        db = DatabaseConnector().get_table(cls.get_table_name())
+    @instrumented
+    def find_all(cls, lazy: bool = False):
+        """
+        Find all entities in the database.
+        With lazy=True a LazyEntityList is returned, which only creates the entities that are accessed.
+        """
+        db = cls.get_table()
+        if lazy:
+            # Shallow copies: the stored documents are updated in place by later writes
+            return LazyEntityList(cls, [dict(doc) for doc in db.raw_values()])
         items = []
-        for data in db.all():
+        from_dict = cls._from_stored
+        for data in db.raw_values():
             try:
-                items.append(cls.from_dict(data))
+                items.append(from_dict(data))
             except (KeyError, ValueError):
                 # Skip invalid data entries
                 continue
         return items
 
     @classmethod
+    @instrumented
+    def find_page(cls, offset: int = 0, limit: int = 20, order_by: Optional[str] = None,
+                  filters: Optional[Mapping[str, Any]] = None, descending: bool = False) -> Page:
+        """
+        Find one page of entities ordered by order_by (default: the key field), filtered by field == value.
+        Only the entities of the page are created.
+        """
+        db = cls.get_table()
+        page = db.find_page(offset, limit, order_by or cls.get_key_field(), descending, filters)
+        items = []
+        for data in page.items:
+            try:
+                items.append(cls._from_stored(data))
+            except (KeyError, ValueError):
+                continue
+        page.items = items
+        return page
+
+    @staticmethod
+    def _stored_condition(condition: Any) -> Any:
+        # Enum fields are stored as their values (see to_dict)
+        if isinstance(condition, Enum):
+            return condition.value
+        if isinstance(condition, In):
+            return In(v.value if isinstance(v, Enum) else v for v in condition.values)
+        return condition
+
+    @classmethod
+    @instrumented
+    def find_where(cls, where: Mapping[str, Any], order_by: Optional[str] = None, descending: bool = False,
+                   limit: Optional[int] = None) -> list:
+        """
+        Find the entities fulfilling all conditions of where, field -> value, In(values) or Range(lo, hi),
+        e.g. {"managed_by_user_id": "u1", "state": In([DeviceState.AVAILABLE, DeviceState.RESERVED])}.
+        Ordered by order_by (default: order of storing), at most limit entities.
+        Indexed fields are answered from their index, see explain_where().
+        """
+        where = {field: cls._stored_condition(condition) for field, condition in where.items()}
+        items = []
+        for data in cls.get_table().find_where(where, order_by, descending, limit):
+            try:
+                items.append(cls._from_stored(data))
+            except (KeyError, ValueError):
+                continue
+        return items
+
+    @classmethod
+    def explain_where(cls, where: Mapping[str, Any], order_by: Optional[str] = None,
+                      descending: bool = False) -> Plan:
+        """How find_where() would answer the query (index used, number of candidates)."""
+        where = {field: cls._stored_condition(condition) for field, condition in where.items()}
+        return cls.get_table().explain_where(where, order_by, descending)
+
+    @classmethod
+    @instrumented
     def find_by_attribute(cls, by_attribute: str, attribute_value: str, num_to_return: int = 1):
-        """Find entity/entities by attribute in the database."""
-        db = DatabaseConnector().get_table(cls.get_table_name())
-        q = Query()
-        result = db.search(q[by_attribute] == attribute_value)
+        """
+        Find entity/entities by attribute in the database. Indexed attributes are looked up without a table scan.
+        Returns at most num_to_return entities, find_where() returns all of them.
+        """
+        db = cls.get_table()
+        result = db.lookup(by_attribute, attribute_value)
         if not result:
             return [] if num_to_return > 1 else None
         items = []
         for d in result[:num_to_return]:
             try:
-                items.append(cls.from_dict(d))
+                items.append(cls._from_stored(d))
             except (KeyError, ValueError):
                 continue
         return items if num_to_return > 1 else (items[0] if items else None)
+
+
+    # --- Async API ------------------------------------------------------------------------------
+    # The blocking calls run in the shared executor of async_support, so an event loop can serve
+    # many requests without a thread each.
+
+    @classmethod
+    async def afind_all(cls, lazy: bool = False):
+        return await run_blocking(cls.find_all, lazy)
+
+    @classmethod
+    async def afind_page(cls, offset: int = 0, limit: int = 20, order_by: Optional[str] = None,
+                         filters: Optional[Mapping[str, Any]] = None, descending: bool = False) -> Page:
+        return await run_blocking(cls.find_page, offset, limit, order_by, filters, descending)
+
+    @classmethod
+    async def afind_where(cls, where: Mapping[str, Any], order_by: Optional[str] = None, descending: bool = False,
+                          limit: Optional[int] = None) -> list:
+        return await run_blocking(cls.find_where, where, order_by, descending, limit)
+
+    @classmethod
+    async def afind_by_attribute(cls, by_attribute: str, attribute_value: str, num_to_return: int = 1):
+        return await run_blocking(cls.find_by_attribute, by_attribute, attribute_value, num_to_return)
+
+    @classmethod
+    def _store_coalescer(cls) -> WriteCoalescer:
+        coalescer = cls.__dict__.get("_coalescer")
+        if coalescer is None:
+            # Per class (looked up in cls.__dict__), as store_many writes the table of one class
+            coalescer = WriteCoalescer(cls.store_many)
+            cls._coalescer = coalescer
+        return coalescer
+
+    async def astore_data(self) -> None:
+        """
+        store_data() for async callers. Entities stored within a few milliseconds of each other are
+        written together by one store_many() call. Raises ConflictError like store_data(), also if
+        another copy of the same entity read before this one is stored in the same batch.
+        """
+        result = await self.__class__._store_coalescer().submit(self)
+        if not result.accepted:
+            if result.reason == CONFLICT_REASON:
+                raise ConflictError(f"{self} was changed by someone else")
+            raise ValueError(result.reason)
+
+    @classmethod
+    async def astore_many(cls, entities: list) -> List[WriteResult]:
+        return await run_blocking(cls.store_many, entities)
+
+    async def adelete(self) -> None:
+        await run_blocking(self.delete)
+
+
+class LazyEntityList(Sequence):
+    """
+    Read-only list of entities that are created from their stored documents on first access.
+    column() reads a single field of all documents without creating any entity.
+    Documents without the key field are left out, other invalid documents raise on access.
+    The documents are kept as they are, so they must not be changed afterwards (pass copies of stored ones).
+    """
+
+    def __init__(self, entity_class, documents: List[Mapping]) -> None:
+        key_field = entity_class.get_key_field()
+        self._entity_class = entity_class
+        self._documents = [doc for doc in documents if key_field in doc]
+        self._entities = [None] * len(self._documents)
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        entity = self._entities[index]
+        if entity is None:
+            entity = self._entity_class._from_stored(self._documents[index])
+            self._entities[index] = entity
+        return entity
+
+    def column(self, field: str) -> list:
+        """The values of one field, in the same order as the entities."""
+        return [doc.get(field) for doc in self._documents]
@@ -0,0 +1,226 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Set, Tuple
+
+
+class HashIndex:
+    """
+    Maps the values of one document field to the ids of the documents holding them.
+    hits/misses count the lookups that did/didn't find a document.
+    """
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self._buckets: Dict[Any, Set[int]] = {}
+        # Remember the indexed value per document, so updates can remove the old entry
+        self._values: Dict[int, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def clear(self) -> None:
+        self._buckets.clear()
+        self._values.clear()
+
+    def rebuild(self, raw_table: Mapping[str, Mapping]) -> None:
+        self.clear()
+        for doc_id, doc in raw_table.items():
+            self.update(int(doc_id), doc)
+
+    def update(self, doc_id: int, doc: Optional[Mapping]) -> None:
+        """(Re-)index a document. Pass doc=None if it was removed."""
+        if doc_id in self._values:
+            old = self._values.pop(doc_id)
+            bucket = self._buckets[old]
+            bucket.discard(doc_id)
+            if not bucket:
+                del self._buckets[old]
+        if doc is None or self.field not in doc:
+            return
+        value = doc[self.field]
+        try:
+            self._buckets.setdefault(value, set()).add(doc_id)
+        except TypeError:
+            # Unhashable values (lists, dicts) can't be looked up by equality anyway
+            return
+        self._values[doc_id] = value
+
+    def lookup(self, value: Any) -> Set[int]:
+        try:
+            doc_ids = self._buckets.get(value)
+        except TypeError:
+            doc_ids = None
+        if doc_ids:
+            self.hits += 1
+            return doc_ids
+        self.misses += 1
+        return set()
+
+    def count(self, value: Any) -> int:
+        """Number of documents holding value, O(1)."""
+        try:
+            return len(self._buckets.get(value, ()))
+        except TypeError:
+            return 0
+
+
+class IntervalIndex:
+    """
+    Keeps the [start, end) intervals of the documents sorted by start, separately per group
+    (e.g. per device). Overlap queries bisect into the sorted list and cost O(log n + k).
+    """
+
+    def __init__(self, group_field: str, start_field: str, end_field: str) -> None:
+        self.group_field = group_field
+        self.start_field = start_field
+        self.end_field = end_field
+        # group -> sorted list of (start, end, doc_id)
+        self._groups: Dict[Any, List[Tuple[Any, Any, int]]] = {}
+        # group -> sorted lengths of its intervals, the last one bounds how far back an overlap can start.
+        # Kept sorted (not just the maximum) so removing the longest interval narrows the bound again.
+        self._lengths: Dict[Any, List[Any]] = {}
+        self._entries: Dict[int, Tuple[Any, Tuple[Any, Any, int]]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._groups.clear()
+        self._lengths.clear()
+        self._entries.clear()
+
+    def rebuild(self, raw_table: Mapping[str, Mapping]) -> None:
+        self.clear()
+        for doc_id, doc in raw_table.items():
+            self.update(int(doc_id), doc)
+
+    def update(self, doc_id: int, doc: Optional[Mapping]) -> None:
+        """(Re-)index a document. Pass doc=None if it was removed."""
+        if doc_id in self._entries:
+            group, entry = self._entries.pop(doc_id)
+            intervals = self._groups[group]
+            del intervals[bisect_left(intervals, entry)]
+            lengths = self._lengths[group]
+            del lengths[bisect_left(lengths, entry[1] - entry[0])]
+            if not intervals:
+                del self._groups[group]
+                del self._lengths[group]
+        if doc is None:
+            return
+        try:
+            group, start, end = doc[self.group_field], doc[self.start_field], doc[self.end_field]
+            length = end - start
+        except (KeyError, TypeError):
+            # Incomplete documents or values that can't be ordered are not indexed
+            return
+        entry = (start, end, doc_id)
+        insort(self._groups.setdefault(group, []), entry)
+        insort(self._lengths.setdefault(group, []), length)
+        self._entries[doc_id] = (group, entry)
+
+    def overlapping(self, group: Any, start: Any, end: Any) -> List[int]:
+        """Ids of the intervals of group overlapping [start, end), ordered by start."""
+        intervals = self._groups.get(group)
+        doc_ids = []
+        if intervals:
+            # An interval starting before start - max_length has ended before start
+            lo = bisect_left(intervals, (start - self._lengths[group][-1],))
+            hi = bisect_left(intervals, (end,))
+            doc_ids = [doc_id for i_start, i_end, doc_id in intervals[lo:hi] if i_end > start]
+        if doc_ids:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return doc_ids
+
+    def longest(self) -> Any:
+        """Upper bound for the length of all indexed intervals, None if there are none."""
+        return max((lengths[-1] for lengths in self._lengths.values()), default=None)
+
+    def covering(self, group: Any, at: Any) -> List[int]:
+        """Ids of the intervals of group with start <= at < end."""
+        intervals = self._groups.get(group)
+        doc_ids = []
+        if intervals:
+            lo = bisect_left(intervals, (at - self._lengths[group][-1],))
+            hi = bisect_left(intervals, (at,))
+            # (at,) sorts before the intervals starting exactly at `at`, which cover it as well
+            while hi < len(intervals) and intervals[hi][0] == at:
+                hi += 1
+            doc_ids = [doc_id for i_start, i_end, doc_id in intervals[lo:hi] if i_end > at]
+        if doc_ids:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return doc_ids
+
+
+class SortedIndex:
+    """
+    Keeps the (value, doc_id) pairs of one field sorted, so ordered pages and range scans cost
+    O(log n + page size). Documents without the field (or with values that can't be ordered) are left out.
+    """
+
+    def __init__(self, field: str) -> None:
+        self.field = field
+        self._entries: List[Tuple[Any, int]] = []
+        self._values: Dict[int, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._values.clear()
+
+    def rebuild(self, raw_table: Mapping[str, Mapping]) -> None:
+        self.clear()
+        entries = []
+        for doc_id, doc in raw_table.items():
+            value = doc.get(self.field)
+            if value is not None:
+                entries.append((value, int(doc_id)))
+        try:
+            entries.sort()
+        except TypeError:
+            # Mixed types, fall back to inserting one by one and skipping what doesn't fit
+            for value, doc_id in entries:
+                self.update(doc_id, {self.field: value})
+            return
+        self._entries = entries
+        self._values = {doc_id: value for value, doc_id in entries}
+
+    def update(self, doc_id: int, doc: Optional[Mapping]) -> None:
+        """(Re-)index a document. Pass doc=None if it was removed."""
+        if doc_id in self._values:
+            entry = (self._values.pop(doc_id), doc_id)
+            del self._entries[bisect_left(self._entries, entry)]
+        if doc is None or doc.get(self.field) is None:
+            return
+        entry = (doc[self.field], doc_id)
+        try:
+            insort(self._entries, entry)
+        except TypeError:
+            return
+        self._values[doc_id] = entry[0]
+
+    def bounds(self, lo: Any = None, hi: Any = None) -> Tuple[int, int]:
+        """Positions of the entries with lo <= value < hi (None = unbounded)."""
+        start = 0 if lo is None else bisect_left(self._entries, (lo,))
+        end = len(self._entries) if hi is None else bisect_left(self._entries, (hi,))
+        return start, max(start, end)
+
+    def position_after(self, value: Any, doc_id: int) -> int:
+        """Position of the first entry after (value, doc_id), for continuing an interrupted walk."""
+        return bisect_right(self._entries, (value, doc_id))
+
+    def doc_ids(self, start: int, end: int, descending: bool = False) -> Iterator[int]:
+        """Ids of the entries between the positions start and end, in index order (or reversed)."""
+        self.hits += 1
+        positions = range(end - 1, start - 1, -1) if descending else range(start, end)
+        return (self._entries[i][1] for i in positions)
@@ -0,0 +1,193 @@
+"""
+Lightweight instrumentation of the storage layer: call counts, wall time, rows scanned, bytes read and
+written and file opens per operation.
+
+Operations nest (e.g. Device.find_all -> storage.read), statistics are kept per call path, so it shows
+which call caused a file read. Like the wall time, the counters of an operation include those of the
+operations it called. Everything is recorded for the whole process (PROCESS) and, if one was started
+in the current context, for a scope such as one Streamlit rerun (see begin_scope()).
+
+Disabled by default, then the decorated methods cost one flag check. Enable it with enable() or the
+environment variable DB_INSTRUMENTATION=1; DB_INSTRUMENTATION_DUMP=<file> also dumps the process
+statistics to that file on exit.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, fields
+from functools import wraps
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+
+@dataclass
+class OpStats:
+    calls: int = 0
+    wall_ms: float = 0.0
+    max_ms: float = 0.0
+    rows_scanned: int = 0
+    bytes_read: int = 0
+    bytes_written: int = 0
+    file_opens: int = 0
+
+
+#: The counters that count() accepts
+COUNTERS = ("rows_scanned", "bytes_read", "bytes_written", "file_opens")
+
+
+class Recorder:
+    """Statistics per call path, e.g. ("Device.find_all", "storage.read"), in the order of their first call."""
+
+    def __init__(self) -> None:
+        self.started_at = time.time()
+        self._stats: Dict[Tuple[str, ...], OpStats] = {}
+        self._lock = threading.Lock()
+
+    def add(self, path: Tuple[str, ...], wall_ms: float, counters: Dict[str, int]) -> None:
+        with self._lock:
+            stats = self._stats.get(path)
+            if stats is None:
+                stats = self._stats[path] = OpStats()
+            stats.calls += 1
+            stats.wall_ms += wall_ms
+            stats.max_ms = max(stats.max_ms, wall_ms)
+            for name, value in counters.items():
+                setattr(stats, name, getattr(stats, name) + value)
+
+    def by_path(self) -> Dict[Tuple[str, ...], OpStats]:
+        with self._lock:
+            return {path: OpStats(**asdict(stats)) for path, stats in self._stats.items()}
+
+    def by_operation(self) -> Dict[str, OpStats]:
+        """Statistics per operation name, summed over all paths the operation was called from."""
+        totals: Dict[str, OpStats] = {}
+        for path, stats in self.by_path().items():
+            total = totals.setdefault(path[-1], OpStats())
+            for field in fields(OpStats):
+                if field.name == "max_ms":
+                    total.max_ms = max(total.max_ms, stats.max_ms)
+                else:
+                    setattr(total, field.name, getattr(total, field.name) + getattr(stats, field.name))
+        return totals
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self.started_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "started_at": self.started_at,
+            "operations": [{"path": list(path), **asdict(stats)} for path, stats in self.by_path().items()],
+        }
+
+
+class _Frame:
+    __slots__ = ("path", "counters")
+
+    def __init__(self, path: Tuple[str, ...]) -> None:
+        self.path = path
+        self.counters: Dict[str, int] = {}
+
+
+#: Statistics of all operations of this process
+PROCESS = Recorder()
+
+_enabled = os.environ.get("DB_INSTRUMENTATION", "") not in ("", "0")
+_scope: ContextVar[Optional[Recorder]] = ContextVar("instrumentation_scope", default=None)
+_stack: ContextVar[Tuple[_Frame, ...]] = ContextVar("instrumentation_stack", default=())
+
+
+def enable(enabled: bool = True) -> None:
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def begin_scope() -> Recorder:
+    """
+    Start a new scope in the current context (e.g. at the top of a Streamlit script run) and return it.
+    Until the next begin_scope(), operations of this context are recorded there as well as in PROCESS.
+    """
+    recorder = Recorder()
+    _scope.set(recorder)
+    return recorder
+
+
+@contextmanager
+def scope() -> Iterator[Recorder]:
+    """Like begin_scope(), limited to a with block."""
+    recorder = Recorder()
+    token = _scope.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _scope.reset(token)
+
+
+@contextmanager
+def operation(name: str) -> Iterator[None]:
+    """Record the block as one call of the operation name, nested into the operation running it."""
+    if not _enabled:
+        yield
+        return
+    stack = _stack.get()
+    frame = _Frame((stack[-1].path if stack else ()) + (name,))
+    token = _stack.set(stack + (frame,))
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall_ms = (time.perf_counter() - start) * 1000
+        _stack.reset(token)
+        PROCESS.add(frame.path, wall_ms, frame.counters)
+        recorder = _scope.get()
+        if recorder is not None:
+            recorder.add(frame.path, wall_ms, frame.counters)
+
+
+def count(**counters: int) -> None:
+    """Add to the counters (see COUNTERS) of the running operations, e.g. count(file_opens=1)."""
+    if not _enabled:
+        return
+    for frame in _stack.get():
+        for name, value in counters.items():
+            frame.counters[name] = frame.counters.get(name, 0) + value
+
+
+def instrumented(method: Callable) -> Callable:
+    """
+    Decorator recording every call of a method as the operation "<class>.<method>", named after the
+    class it was called on (so User.find_all and Device.find_all are told apart).
+    """
+    @wraps(method)
+    def wrapper(self_or_cls, *args, **kwargs):
+        if not _enabled:
+            return method(self_or_cls, *args, **kwargs)
+        owner = self_or_cls if isinstance(self_or_cls, type) else type(self_or_cls)
+        with operation(f"{owner.__name__}.{method.__name__}"):
+            return method(self_or_cls, *args, **kwargs)
+    return wrapper
+
+
+def dump(path: str, recorder: Optional[Recorder] = None) -> None:
+    """Append the statistics of recorder (default: PROCESS) as one JSON line to the file at path."""
+    record = {"timestamp": time.time(), "pid": os.getpid(), **(recorder or PROCESS).to_dict()}
+    with open(path, "a", encoding="utf-8") as handle:
+        handle.write(json.dumps(record) + "\n")
+
+
+def dump_at_exit(path: str) -> None:
+    """Dump the process statistics to path when the interpreter exits."""
+    atexit.register(dump, path)
+
+
+if os.environ.get("DB_INSTRUMENTATION_DUMP"):
+    enable()
+    dump_at_exit(os.environ["DB_INSTRUMENTATION_DUMP"])
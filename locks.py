@@ -0,0 +1,86 @@
+import os
+import threading
+
+from instrumentation import count
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class _LockState:
+    def __init__(self) -> None:
+        self.thread_lock = threading.RLock()
+        self.handle = None
+        self.depth = 0
+
+
+class FileLock:
+    """
+    Exclusive, reentrant lock on a lock file, shared by all threads and processes using the same path.
+    Usage: with FileLock(<path>): ...
+    """
+
+    # The OS lock belongs to the process, so the threads of a process are serialized by a thread lock
+    # per path, and nested acquisitions only count up instead of locking the file again
+    _states = {}
+    _states_guard = threading.Lock()
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(path)
+        with FileLock._states_guard:
+            self._state = FileLock._states.setdefault(self.path, _LockState())
+
+    def __enter__(self) -> "FileLock":
+        state = self._state
+        state.thread_lock.acquire()
+        try:
+            if state.depth == 0:
+                handle = open(self.path, "a+")
+                count(file_opens=1)
+                try:
+                    self._lock_file(handle)
+                except BaseException:
+                    handle.close()
+                    raise
+                state.handle = handle
+            state.depth += 1
+        except BaseException:
+            state.thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        state = self._state
+        try:
+            state.depth -= 1
+            if state.depth == 0:
+                self._unlock_file(state.handle)
+                state.handle.close()
+                state.handle = None
+        finally:
+            state.thread_lock.release()
+
+    @staticmethod
+    def _lock_file(handle) -> None:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            return
+        handle.seek(0)
+        while True:
+            try:
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after ~10 seconds, keep waiting
+                continue
+
+    @staticmethod
+    def _unlock_file(handle) -> None:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
@@ -1,46 +1,97 @@
 import streamlit as st
 import datetime as dt
+import io
+import tempfile
 
 # Backend-Klassen importieren
 from users import User
 from devices import Device, DeviceState
 from maintenance import Maintenance, MaintenanceManager
-from reservations import Reservation, ReservationManager
+from reservations import RecurringReservation, Reservation, ReservationManager
+from read_cache import TableCache
+from snapshots import DeviceRecord, Snapshot, UserRecord
+from database import ConflictError, Page, retry_on_conflict
+import instrumentation
+import transfer
+import relations
 
 # --------------------------------------------------------------------------------
 # CONFIG & MANAGERS
 # --------------------------------------------------------------------------------
 st.set_page_config(page_title="Administrator-Portal", layout="wide")
 
+# Datenbankzugriffe messen (Performance-Panel in der Sidebar): pro Durchlauf und für den ganzen Prozess.
+# Die letzten Durchläufe bleiben in der Session, auch solche, die durch st.rerun() abgebrochen wurden.
+METRICS_DUMP_PATH = "performance_metrics.jsonl"
+instrumentation.enable()
+run_metrics = instrumentation.begin_scope()
+metrics_history = st.session_state.setdefault("metrics_history", [])
+metrics_history.append(run_metrics)
+del metrics_history[:-10]
+
 # Instanzen einmalig anlegen
 reservation_manager = ReservationManager()
 maintenance_manager = MaintenanceManager()
 
+# Beendete Reservierungen vergangener Monate regelmäßig ins Archiv verschieben (ein Thread pro Prozess),
+# damit die Tabelle und ihre Indizes klein bleiben
+@st.cache_resource
+def start_reservation_archiver() -> ReservationManager:
+    manager = ReservationManager()
+    manager.start_archiving()
+    return manager
+
+start_reservation_archiver()
+
 # --------------------------------------------------------------------------------
 # CACHE / HELPER
 # --------------------------------------------------------------------------------
-def load_users_cached() -> list[User]:
-    if "users_cache" not in st.session_state:
-        st.session_state["users_cache"] = User.find_all()
-    return st.session_state["users_cache"]
-
-def load_devices_cached() -> list[Device]:
-    if "devices_cache" not in st.session_state:
-        st.session_state["devices_cache"] = Device.find_all()
-    return st.session_state["devices_cache"]
-
-def invalidate_users_cache():
-    if "users_cache" in st.session_state:
-        del st.session_state["users_cache"]
-
-def invalidate_devices_cache():
-    if "devices_cache" in st.session_state:
-        del st.session_state["devices_cache"]
+# Ein Cache für alle Sessions des Prozesses: er folgt dem Änderungs-Feed der Tabellen, nach einem Speichern
+# werden nur die geänderten Einträge neu umgewandelt, komplett neu geladen wird nur, wenn ein anderer Prozess
+# geschrieben hat (kein manuelles Invalidieren nötig). Reservierungen und Wartungen werden nicht gecacht,
+# sie werden seitenweise über die Indizes gelesen.
+# Nutzer und Geräte sind unveränderliche Snapshots, die alle Durchläufe und Sessions teilen: nach einem
+# Speichern entsteht ein neuer Snapshot, in dem nur der geänderte Eintrag neu erzeugt wird
+@st.cache_resource
+def get_table_cache() -> TableCache:
+    return TableCache()
+
+table_cache = get_table_cache()
+
+def load_users_cached() -> Snapshot:
+    return table_cache.get_snapshot(UserRecord)
+
+def load_devices_cached() -> Snapshot:
+    return table_cache.get_snapshot(DeviceRecord)
+
+def load_series_ids_cached() -> frozenset:
+    # IDs der Serienreservierungen, nach einem Speichern wird nur die geänderte Serie neu umgewandelt
+    return table_cache.get_live(
+        "recurring_reservations", RecurringReservation.from_dict,
+        lambda rules: frozenset(rule.reservation_id for rule in rules),
+    )
+
+def user_labels_of(snapshot: Snapshot) -> tuple:
+    # "Name (ID)" für die Auswahllisten, einmal pro Snapshot berechnet
+    return snapshot.derive("labels", lambda rows: tuple(f"{u.name} ({u.id})" for u in rows))
 
 def label_to_id(label: str) -> str:
     # Format "Name (ID)" -> nur ID zurückgeben
     return label.split(" (")[1].rstrip(")")
 
+def paged(loader, key: str) -> Page:
+    # Blättern: es wird nur die aktuelle Seite geladen, loader(offset, limit) -> Page
+    c1, c2 = st.columns(2)
+    page_size = c1.selectbox("Pro Seite", [10, 25, 50], key=f"{key}_size")
+    page_no = c2.number_input("Seite", min_value=1, step=1, key=f"{key}_page")
+    page = loader((page_no - 1) * page_size, page_size)
+    if page.total and page.offset >= page.total:
+        # Seite existiert (nach Löschen/Filtern) nicht mehr -> letzte Seite zeigen
+        page = loader((page.total - 1) // page_size * page_size, page_size)
+    pages = max(1, -(-page.total // page_size))
+    st.caption(f"Seite {page.offset // page_size + 1}/{pages} · {page.total} Einträge")
+    return page
+
 # Initialer Load
 users = load_users_cached()
 devices = load_devices_cached()
@@ -61,6 +112,9 @@ def go_to_state_reservation_system():
 def go_to_state_maintenance_system():
     st.session_state["state"] = "state_maintenance_system"
 
+def go_to_state_fleet_overview():
+    st.session_state["state"] = "state_fleet_overview"
+
 # --------------------------------------------------------------------------------
 # SIDEBAR
 # --------------------------------------------------------------------------------
@@ -70,9 +124,51 @@ with st.sidebar:
     st.button("Nutzer-Verwaltung", on_click=go_to_state_user_management, use_container_width=True)
     st.button("Reservierungssystem", on_click=go_to_state_reservation_system, use_container_width=True)
     st.button("Wartungssystem", on_click=go_to_state_maintenance_system, use_container_width=True)
+    st.button("Flottenübersicht", on_click=go_to_state_fleet_overview, use_container_width=True)
     
     st.markdown("---")
 
+    with st.expander("Import / Export"):
+        TABLE_LABELS = {
+            "users": "Nutzer", "devices": "Geräte", "reservations": "Reservierungen",
+            "recurring_reservations": "Serienreservierungen", "maintenances": "Wartungen",
+        }
+        t_table = st.selectbox("Tabelle", list(transfer.FIELDS), format_func=TABLE_LABELS.get, key="transfer_table")
+
+        # Die Datei wird zeilenweise gelesen und in Blöcken gespeichert, Fortschritt nach jedem Block
+        upload = st.file_uploader("Datei (CSV/JSONL)", type=["csv", "jsonl", "ndjson"], key="transfer_upload")
+        if upload is not None and st.button("Importieren", key="transfer_import", use_container_width=True):
+            bar = st.progress(0.0, text="Importiere …")
+
+            def show_progress(report: transfer.ImportReport):
+                bar.progress(min(upload.tell() / max(upload.size, 1), 1.0), text=f"{report.rows} Zeilen gelesen")
+
+            report = transfer.import_file(
+                t_table, io.TextIOWrapper(upload, encoding="utf-8-sig", newline=""),
+                transfer.format_of(upload.name), progress=show_progress,
+            )
+            bar.progress(1.0, text=f"{report.imported} von {report.rows} Zeilen importiert")
+            if report.failed:
+                st.warning(f"{report.failed} Zeilen abgelehnt")
+                st.dataframe(
+                    [{"Zeile": e.line, "Grund": e.reason} for e in report.errors],
+                    hide_index=True, use_container_width=True,
+                )
+
+        t_format = st.radio("Format", transfer.FORMATS, horizontal=True, key="transfer_format")
+        if st.button("Export erstellen", key="transfer_export", use_container_width=True):
+            # Zeilen kommen direkt aus dem Speicher, ohne vorher alle Objekte zu laden (inkl. Archiv),
+            # und werden in eine temporäre Datei geschrieben statt als ein String im Arbeitsspeicher
+            with tempfile.TemporaryFile() as export:
+                text = io.TextIOWrapper(export, encoding="utf-8", newline="")
+                written = transfer.export_table(t_table, text, t_format, include_archive=True)
+                text.detach()
+                export.seek(0)
+                st.download_button(
+                    f"Herunterladen ({written} Zeilen)", export, file_name=f"{t_table}.{t_format}",
+                    key="transfer_download", use_container_width=True,
+                )
+
 
 # --------------------------------------------------------------------------------
 # MAIN ROUTING
@@ -91,8 +187,8 @@ elif st.session_state["state"] == "state_device_management":
     col1, col2, col3 = st.columns(3)
 
     # Hilfslisten für Dropdowns
-    dnames = [d.device_name for d in devices]
-    user_labels = [f"{u.name} ({u.id})" for u in users]
+    dnames = devices.column("device_name")
+    user_labels = user_labels_of(users)
 
     # --- Spalte 1: Detailansicht & Status-Check ---
     with col1:
@@ -104,17 +200,12 @@ elif st.session_state["state"] == "state_device_management":
             if dev:
                 is_live_reserved = False
                 active_res_info = ""
-                
-                
-                all_res = reservation_manager.find_all()
-                now = dt.datetime.now()
-                
-                for r in all_res:
-                    if r.device_name == dev.device_name:
-                        if r.start <= now <= r.end:
-                            is_live_reserved = True
-                            active_res_info = f"User: {r.user_id} (bis {r.end.strftime('%H:%M')})"
-                            break
+
+                # Nur die Reservierungen dieses Geräts über den Intervall-Index prüfen
+                r = reservation_manager.current_reservation(dev.device_name, dt.datetime.now())
+                if r:
+                    is_live_reserved = True
+                    active_res_info = f"User: {r.user_id} (bis {r.end.strftime('%H:%M')})"
                 
                 # Status-Anzeige
                 if is_live_reserved:
@@ -133,9 +224,13 @@ elif st.session_state["state"] == "state_device_management":
                 st.write(f"Verwalter-ID: {dev.managed_by_user_id}")
                 
                 st.markdown("---")
+                # Reservierungen und Wartungen des Geräts werden mitgelöscht (Zählung über die Rückwärts-Indizes)
+                deps = dev.count_dependents()
+                n_res = deps.get("reservations", 0) + deps.get("recurring_reservations", 0)
+                if n_res or deps.get("maintenances"):
+                    st.caption(f"Löscht auch {n_res} Reservierungen und {deps.get('maintenances', 0)} Wartungen")
                 if st.button("Gerät löschen", type="primary"):
                     dev.delete()
-                    invalidate_devices_cache()
                     st.success("Gerät gelöscht!")
                     st.rerun()
 
@@ -155,7 +250,6 @@ elif st.session_state["state"] == "state_device_management":
                         selected_user_id = label_to_id(selected_user_label)
                         dev = Device(new_device_name.strip(), selected_user_id)
                         dev.store_data()
-                        invalidate_devices_cache()
                         st.success("Erstellt!")
                         st.rerun()
                     else:
@@ -170,11 +264,20 @@ elif st.session_state["state"] == "state_device_management":
                 mgr_assign = st.selectbox("Neuer Verwalter", user_labels)
                 
                 if st.form_submit_button("Zuweisen"):
-                    dev = Device.find_by_attribute("device_name", dev_assign)
+                    def assign():
+                        dev = Device.find_by_attribute("device_name", dev_assign)
+                        if dev:
+                            dev.set_managed_by_user_id(label_to_id(mgr_assign))
+                            dev.store_data()
+                        return dev
+
+                    # Hat jemand anderes das Gerät gerade geändert: neu laden und nochmal zuweisen
+                    try:
+                        dev = retry_on_conflict(assign)
+                    except ConflictError:
+                        dev = None
+                        st.error("Gerät wird gerade von jemand anderem geändert, bitte erneut versuchen.")
                     if dev:
-                        dev.set_managed_by_user_id(label_to_id(mgr_assign))
-                        dev.store_data()
-                        invalidate_devices_cache()
                         st.success("Zugewiesen!")
                         st.rerun()
 
@@ -189,12 +292,13 @@ elif st.session_state["state"] == "state_user_management":
     with col1:
         st.subheader("Details")
         if users:
-            sel_uid = st.selectbox("User ID", [u.id for u in users])
-            u = User.find_by_attribute("id", sel_uid)
+            sel_uid = st.selectbox("User ID", users.column("id"))
+            u = users.get(sel_uid)
             if u:
                 st.write(f"Name: **{u.name}**")
-                assigned_devs = Device.find_by_attribute("managed_by_user_id", u.id, num_to_return=100)
-                st.caption(f"Verwaltet {len(assigned_devs) if assigned_devs else 0} Geräte")
+                deps = relations.count_dependents("users", u.id)
+                n_res = deps["reservations"] + deps["recurring_reservations"]
+                st.caption(f"Verwaltet {deps['devices']} Geräte · {n_res} Reservierungen")
         else:
             st.info("Keine Nutzer.")
 
@@ -208,7 +312,6 @@ elif st.session_state["state"] == "state_user_management":
                 if uid and uname:
                     u = User(uid.strip(), uname.strip())
                     u.store_data()
-                    invalidate_users_cache()
                     st.success("Gespeichert!")
                     st.rerun()
                 else:
@@ -218,16 +321,25 @@ elif st.session_state["state"] == "state_user_management":
     with col3:
         st.subheader("Löschen")
         if users:
-            del_uid = st.selectbox("User löschen", [u.id for u in users])
-            if st.button("Endgültig löschen", type="primary"):
+            del_uid = st.selectbox("User löschen", users.column("id"))
+            # Reservierungen und Serien des Users werden mitgelöscht (CASCADE) -> nur nach Bestätigung
+            del_deps = relations.count_dependents("users", del_uid)
+            n_del_res = del_deps["reservations"] + del_deps["recurring_reservations"]
+            confirmed = True
+            if n_del_res:
+                st.warning(
+                    f"Löscht auch {del_deps['reservations']} Reservierungen und "
+                    f"{del_deps['recurring_reservations']} Serienreservierungen"
+                )
+                confirmed = st.checkbox(f"{n_del_res} Reservierungen mitlöschen", key=f"confirm_del_{del_uid}")
+            if st.button("Endgültig löschen", type="primary", disabled=not confirmed):
                 u = User.find_by_attribute("id", del_uid)
-                # Schutz: User darf keine Geräte verwalten
-                assigned = Device.find_by_attribute("managed_by_user_id", u.id, num_to_return=1)
-                if assigned:
+                # Schutz: User darf keine Geräte verwalten (RESTRICT), seine Reservierungen werden mitgelöscht
+                try:
+                    u.delete()
+                except relations.IntegrityError:
                     st.error("User verwaltet noch Geräte! Erst ändern.")
                 else:
-                    u.delete()
-                    invalidate_users_cache()
                     st.success("Gelöscht.")
                     st.rerun()
 
@@ -238,23 +350,42 @@ elif st.session_state["state"] == "state_reservation_system":
     st.header("Reservierungssystem")
     col1, col2, col3 = st.columns(3)
     
-    reservations = reservation_manager.find_all()
-    
-    if reservations:
-        try:
-            next_id = max(int(r.reservation_id) for r in reservations) + 1
-        except ValueError:
-            next_id = len(reservations) + 1
-    else:
-        next_id = 1
-
     # --- Spalte 1: Übersicht ---
     with col1:
         st.subheader("Liste")
+        f_dev = st.selectbox("Gerät", ["Alle", *devices.column("device_name")], key="res_filter_dev")
+        f_user = st.selectbox("User", ["Alle", *user_labels_of(users)], key="res_filter_user")
+        f_dates = st.date_input("Zeitraum (Start)", value=(), key="res_filter_dates")
+        # Vergangene Monate liegen im Archiv, das nur bei Bedarf geladen wird
+        f_archive = st.checkbox("Archiv einbeziehen", key="res_filter_archive")
+
+        filters = {}
+        if f_dev != "Alle":
+            filters["device_name"] = f_dev
+        if f_user != "Alle":
+            filters["user_id"] = label_to_id(f_user)
+        date_range = None
+        # Während der Auswahl ist erst ein Datum gesetzt
+        if len(f_dates) == 2:
+            date_range = (
+                dt.datetime.combine(f_dates[0], dt.time.min),
+                dt.datetime.combine(f_dates[1] + dt.timedelta(days=1), dt.time.min),
+            )
+
+        page = paged(
+            lambda offset, limit: reservation_manager.find_page(
+                offset, limit, filters=filters, date_range=date_range, include_archive=f_archive
+            ),
+            "res",
+        )
+        reservations = page.items
+        # Termine wiederkehrender Reservierungen haben die ID ihrer Serie
+        series_ids = load_series_ids_cached()
         if not reservations:
             st.info("Leer.")
         for r in reservations:
-            with st.expander(f"{r.device_name} ({r.start.strftime('%d.%m')})"):
+            series = " · Serie" if r.reservation_id in series_ids else ""
+            with st.expander(f"{r.device_name} ({r.start.strftime('%d.%m')}){series}"):
                 st.write(f"User: {r.user_id}")
                 st.write(f"Von: {r.start}")
                 st.write(f"Bis: {r.end}")
@@ -264,17 +395,75 @@ elif st.session_state["state"] == "state_reservation_system":
     with col2:
         st.subheader("Neue Reservierung")
         if devices and users:
+            # Vorbelegung des Formulars, wird von der Terminsuche überschrieben
+            st.session_state.setdefault("res_d_start", dt.date.today())
+            st.session_state.setdefault("res_t_start", dt.time(9, 0))
+            st.session_state.setdefault("res_d_end", dt.date.today())
+            st.session_state.setdefault("res_t_end", dt.time(17, 0))
+
+            def apply_slot(device_name: str, start: dt.datetime, end: dt.datetime):
+                st.session_state["res_dev"] = device_name
+                st.session_state["res_d_start"], st.session_state["res_t_start"] = start.date(), start.time()
+                st.session_state["res_d_end"], st.session_state["res_t_end"] = end.date(), end.time()
+
+            with st.expander("Freien Termin finden"):
+                tab_slots, tab_devices = st.tabs(["Zeitfenster eines Geräts", "Freie Geräte"])
+
+                with tab_slots:
+                    s_dev = st.selectbox("Gerät", devices.column("device_name"), key="slot_dev")
+                    c1, c2 = st.columns(2)
+                    s_from = c1.date_input("Von", key="slot_from")
+                    s_to = c2.date_input("Bis", key="slot_to")
+                    s_hours = st.number_input("Mindestdauer (h)", min_value=0.0, value=1.0, step=0.5, key="slot_hours")
+                    min_duration = dt.timedelta(hours=s_hours)
+                    slots = reservation_manager.find_free_slots(
+                        s_dev,
+                        dt.datetime.combine(s_from, dt.time.min),
+                        dt.datetime.combine(s_to + dt.timedelta(days=1), dt.time.min),
+                        min_duration,
+                    )
+                    if slots:
+                        slot = st.selectbox(
+                            "Freie Zeitfenster", slots,
+                            format_func=lambda x: f"{x[0].strftime('%d.%m. %H:%M')} – {x[1].strftime('%d.%m. %H:%M')}",
+                        )
+                        # Übernommen wird der Anfang des Fensters mit der Mindestdauer
+                        slot_end = slot[0] + min_duration if min_duration else slot[1]
+                        st.button("Übernehmen", key="apply_slot", on_click=apply_slot, args=(s_dev, slot[0], slot_end))
+                    else:
+                        st.info("Kein freies Zeitfenster.")
+
+                with tab_devices:
+                    c1, c2 = st.columns(2)
+                    a_start = dt.datetime.combine(
+                        c1.date_input("Start", key="avail_d_start"), c2.time_input("Start Zeit", dt.time(9, 0), key="avail_t_start")
+                    )
+                    a_end = dt.datetime.combine(
+                        c1.date_input("Ende", key="avail_d_end"), c2.time_input("End Zeit", dt.time(17, 0), key="avail_t_end")
+                    )
+                    free = reservation_manager.find_available_devices(a_start, a_end)
+                    if free:
+                        a_dev = st.selectbox(f"Freie Geräte ({len(free)})", free, key="avail_dev")
+                        st.button("Übernehmen", key="apply_device", on_click=apply_slot, args=(a_dev, a_start, a_end))
+                    else:
+                        st.info("Kein Gerät frei.")
+
             with st.form("new_res"):
-                st.text_input("ID", value=str(next_id), disabled=True)
-                r_dev = st.selectbox("Gerät", [d.device_name for d in devices])
-                r_user_label = st.selectbox("User", [f"{u.name} ({u.id})" for u in users])
+                # Die ID wird beim Speichern vergeben
+                st.text_input("ID", value="automatisch", disabled=True)
+                r_dev = st.selectbox("Gerät", devices.column("device_name"), key="res_dev")
+                r_user_label = st.selectbox("User", user_labels_of(users))
                 
                 c1, c2 = st.columns(2)
-                d_start = c1.date_input("Start")
-                t_start = c2.time_input("Start Zeit", value=dt.time(9,0))
-                d_end = c1.date_input("Ende")
-                t_end = c2.time_input("End Zeit", value=dt.time(17,0))
+                d_start = c1.date_input("Start", key="res_d_start")
+                t_start = c2.time_input("Start Zeit", key="res_t_start")
+                d_end = c1.date_input("Ende", key="res_d_end")
+                t_end = c2.time_input("End Zeit", key="res_t_end")
                 note = st.text_input("Notiz")
+                # Eine Serie wird als eine Regel gespeichert, nicht als einzelne Buchungen
+                c1, c2 = st.columns(2)
+                weekly = c1.checkbox("Wöchentlich wiederholen")
+                d_until = c2.date_input("Bis einschließlich", value=dt.date.today() + dt.timedelta(weeks=12))
 
                 if st.form_submit_button("Buchen"):
                     start_dt = dt.datetime.combine(d_start, t_start)
@@ -282,13 +471,24 @@ elif st.session_state["state"] == "state_reservation_system":
                     
                     if end_dt <= start_dt:
                         st.error("Ende vor Start!")
+                    elif weekly:
+                        rule = RecurringReservation(
+                            None, r_dev, label_to_id(r_user_label), start_dt, end_dt, dt.timedelta(weeks=1),
+                            dt.datetime.combine(d_until + dt.timedelta(days=1), dt.time.min), note,
+                        )
+                        result = reservation_manager.create_recurring(rule)
+                        if result.accepted:
+                            st.success(f"Serie gebucht! (ID {rule.reservation_id}, {len(rule)} Termine)")
+                            st.rerun()
+                        else:
+                            st.error(f"Nicht gebucht: {result.reason}")
                     else:
-                        r = Reservation(str(next_id), r_dev, label_to_id(r_user_label), start_dt, end_dt, note)
+                        r = Reservation(None, r_dev, label_to_id(r_user_label), start_dt, end_dt, note)
                         if reservation_manager.create(r):
-                            st.success("Gebucht!")
+                            st.success(f"Gebucht! (ID {r.reservation_id})")
                             st.rerun()
                         else:
-                            st.error("Konflikt oder ID belegt.")
+                            st.error("Konflikt mit bestehender Reservierung.")
         else:
             st.warning("Keine Geräte/Nutzer.")
 
@@ -296,7 +496,8 @@ elif st.session_state["state"] == "state_reservation_system":
     with col3:
         st.subheader("Stornieren")
         if reservations:
-            del_rid = st.selectbox("Wähle ID", [r.reservation_id for r in reservations])
+            # Auswahl aus der angezeigten Seite, bei einer Serie wird die ganze Serie gelöscht
+            del_rid = st.selectbox("Wähle ID", list(dict.fromkeys(r.reservation_id for r in reservations)))
             if st.button("Löschen", key="del_res"):
                 reservation_manager.delete_by_id(del_rid)
                 st.success("Gelöscht.")
@@ -309,21 +510,21 @@ elif st.session_state["state"] == "state_maintenance_system":
     st.header("Wartungssystem")
     col1, col2, col3 = st.columns(3)
     
-    maints = maintenance_manager.find_all()
-    
-    if maints:
-        try:
-            next_mid = max(int(m.maintenance_id) for m in maints) + 1
-        except ValueError:
-            next_mid = len(maints) + 1
-    else:
-        next_mid = 1
+    # Kosten aus den laufend gepflegten Summen, ohne alle Wartungen zu laden
+    costs = maintenance_manager.cost_summary()
 
     # --- Spalte 1: Logs ---
     with col1:
         st.subheader("Historie")
-        if maints:
-            for m in maints:
+        m_filter = st.selectbox("Gerät", ["Alle", *devices.column("device_name")], key="maint_filter_dev")
+        m_filters = {"device_name": m_filter} if m_filter != "Alle" else None
+        # Neueste Einträge zuerst
+        page = paged(
+            lambda offset, limit: maintenance_manager.find_page(offset, limit, filters=m_filters, descending=True),
+            "maint",
+        )
+        if page.items:
+            for m in page.items:
                 st.markdown(f"**{m.device_name}** ({m.cost}€)")
                 st.caption(f"ID: {m.maintenance_id} | {m.description}")
                 st.markdown("---")
@@ -335,14 +536,15 @@ elif st.session_state["state"] == "state_maintenance_system":
         st.subheader("Eintragen")
         if devices:
             with st.form("new_maint"):
-                st.text_input("ID", value=str(next_mid), disabled=True)
-                m_dev = st.selectbox("Gerät", [d.device_name for d in devices])
+                st.text_input("ID", value="automatisch", disabled=True)
+                m_dev = st.selectbox("Gerät", devices.column("device_name"))
                 desc = st.text_area("Beschreibung")
                 cost = st.number_input("Kosten (€)", min_value=0.0, step=10.0)
+                m_date = st.date_input("Datum")
                 
                 if st.form_submit_button("Speichern"):
                     if desc:
-                        m = Maintenance(str(next_mid), m_dev, desc, cost)
+                        m = Maintenance(None, m_dev, desc, cost, dt.datetime.combine(m_date, dt.time.min))
                         maintenance_manager.upsert(m)
                         st.success("Gespeichert!")
                         st.rerun()
@@ -354,13 +556,104 @@ elif st.session_state["state"] == "state_maintenance_system":
     # --- Spalte 3: Stats & Delete ---
     with col3:
         st.subheader("Verwaltung")
-        if maints:
-            total = sum(m.cost for m in maints)
-            st.metric("Gesamtkosten", f"{total:.2f} €")
+        if costs.count:
+            st.metric("Gesamtkosten", f"{costs.total:.2f} €")
+            st.caption(f"{costs.count} Wartungen")
+
+            # Kosten pro Gerät und Monat
+            st.dataframe(
+                [
+                    {"Gerät": name, "Wartungen": costs.count_per_device[name], "Kosten (€)": round(total, 2)}
+                    for name, total in sorted(costs.per_device.items())
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+            if costs.per_month:
+                st.bar_chart({"Kosten (€)": costs.per_month})
             
             st.markdown("---")
-            del_mid = st.selectbox("Löschen ID", [m.maintenance_id for m in maints])
+        if page.items:
+            # Auswahl aus der angezeigten Seite
+            del_mid = st.selectbox("Löschen ID", [m.maintenance_id for m in page.items])
             if st.button("Löschen", key="del_maint"):
                 maintenance_manager.delete_by_id(del_mid)
                 st.success("Gelöscht.")
-                st.rerun()
\ No newline at end of file
+                st.rerun()
+
+# ==============================================================================
+# VIEW: FLOTTE
+# ==============================================================================
+elif st.session_state["state"] == "state_fleet_overview":
+    st.header("Flottenübersicht")
+
+    c1, c2, c3 = st.columns(3)
+    f_date = c1.date_input("Datum", key="fleet_date")
+    f_time = c2.time_input("Uhrzeit", value=dt.datetime.now().time().replace(second=0, microsecond=0), key="fleet_time")
+    f_states = c3.multiselect("Status", [s.value for s in DeviceState], key="fleet_states")
+
+    # Status aller Geräte in einem Durchlauf über die Reservierungen
+    fleet = reservation_manager.fleet_status(dt.datetime.combine(f_date, f_time))
+
+    counts = {s: 0 for s in DeviceState}
+    for status in fleet.values():
+        counts[status.state] += 1
+    for col, state in zip(st.columns(len(DeviceState)), DeviceState):
+        col.metric(state.value, counts[state])
+
+    rows = [
+        {
+            "Gerät": status.device_name,
+            "Status": status.state.value,
+            "Belegt durch": status.holder or "",
+            "Reservierung": status.reservation_id or "",
+            "Frei ab": status.free_at.strftime("%d.%m.%Y %H:%M") if status.free_at else "",
+        }
+        for status in fleet.values()
+        if not f_states or status.state.value in f_states
+    ]
+    if rows:
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+    else:
+        st.info("Keine Geräte.")
+
+# --------------------------------------------------------------------------------
+# PERFORMANCE-PANEL
+# --------------------------------------------------------------------------------
+def metrics_rows(stats: dict) -> list[dict]:
+    return [
+        {
+            "Operation": " › ".join(key) if isinstance(key, tuple) else key,
+            "Aufrufe": s.calls,
+            "Zeit (ms)": round(s.wall_ms, 2),
+            "Max (ms)": round(s.max_ms, 2),
+            "Zeilen": s.rows_scanned,
+            "Gelesen (KiB)": round(s.bytes_read / 1024, 1),
+            "Geschrieben (KiB)": round(s.bytes_written / 1024, 1),
+            "Dateien geöffnet": s.file_opens,
+        }
+        for key, s in stats.items()
+    ]
+
+with st.sidebar:
+    with st.expander("Performance"):
+        m_scope = st.radio("Messung", ["Durchlauf", "Prozess"], horizontal=True, key="metrics_scope")
+        if m_scope == "Durchlauf":
+            runs = list(reversed(metrics_history))
+            run_no = st.selectbox(
+                "Durchlauf", range(len(runs)), key="metrics_run",
+                format_func=lambda i: "aktuell" if i == 0 else f"vor {i} Durchl.",
+            )
+            recorder = runs[min(run_no, len(runs) - 1)]
+        else:
+            recorder = instrumentation.PROCESS
+        # Aufrufpfad zeigt, welcher Aufruf (und damit welches Widget) einen Dateizugriff ausgelöst hat
+        by_path = st.checkbox("Nach Aufrufpfad", value=True, key="metrics_by_path")
+        stats = recorder.by_path() if by_path else recorder.by_operation()
+        if stats:
+            st.dataframe(metrics_rows(stats), hide_index=True, use_container_width=True)
+        else:
+            st.caption("Keine Datenbankzugriffe.")
+        if st.button("In Datei speichern", key="metrics_dump", use_container_width=True):
+            instrumentation.dump(METRICS_DUMP_PATH, recorder)
+            st.success(f"Gespeichert in {METRICS_DUMP_PATH}")
@@ -1,65 +1,316 @@
-import os
-from dataclasses import dataclass, asdict
-from typing import Any, List
+import math
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional
 
-from tinydb import TinyDB, Query
-from tinydb.storages import JSONStorage
+from database import VERSION_FIELD, ConflictError, DatabaseConnector, Page, WriteResult
+from entity import CONFLICT_REASON
+from instrumentation import instrumented
+from queries import Plan
 
 
-def _db_path(filename: str = "database.json") -> str:
-    return os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
-
-
-@dataclass
+@dataclass(slots=True)
 class Maintenance:
-    maintenance_id: str
+    # None/"" --> an id is assigned by MaintenanceManager.upsert
+    maintenance_id: Optional[str]
     device_name: str
     description: str
     cost: float = 0.0
+    # Optional date of the maintenance, entries with a date are counted in the monthly costs
+    performed_at: Optional[datetime] = None
+    # Version of the stored entry this one was read from (None: not read), see MaintenanceManager.upsert
+    version: Optional[int] = field(default=None, compare=False, repr=False)
+
+
+@dataclass
+class CostSummary:
+    """Maintenance costs, overall and per device; per_month maps "YYYY-MM" to the costs of dated entries."""
+    total: float = 0.0
+    count: int = 0
+    per_device: Dict[str, float] = field(default_factory=dict)
+    count_per_device: Dict[str, int] = field(default_factory=dict)
+    per_month: Dict[str, float] = field(default_factory=dict)
 
 
 class MaintenanceManager:
     def __init__(self) -> None:
-        self._db = TinyDB(_db_path("database.json"), storage=JSONStorage)
-        self._table = self._db.table("maintenances")
+        self._table = DatabaseConnector().get_table("maintenances")
+        self._table.ensure_index("maintenance_id")
+        self._table.ensure_index("device_name")
+        # Date range queries (find_where)
+        self._table.ensure_sorted_index("performed_at")
+        # Running cost aggregates, one document per device: count, total and per-month totals
+        self._costs = DatabaseConnector().get_table("maintenance_costs")
+        self._costs.ensure_index("device_name")
+        if not len(self._costs) and len(self._table):
+            self.rebuild_costs()
+
+    @contextmanager
+    def _locked(self):
+        # Entries and cost aggregates change together, always locked in this order
+        with self._table.locked(), self._costs.locked():
+            yield
 
+    def next_ids(self, count: int = 1) -> List[str]:
+        """Allocate count unused maintenance ids (e.g. for an import)."""
+        first = DatabaseConnector().next_id("maintenances", "maintenance_id", count)
+        return [str(i) for i in range(first, first + count)]
+
+    def _new_ids(self, count: int, taken: Iterable[str] = ()) -> List[str]:
+        """
+        next_ids(count) without the ids that are already used, e.g. by entries stored with an id of
+        their own by another program. Call it under the table lock.
+        """
+        taken = set(taken)
+        ids = []
+        while len(ids) < count:
+            ids += [
+                i for i in self.next_ids(count - len(ids))
+                if i not in taken and not self._table.lookup("maintenance_id", i)
+            ]
+        return ids
+
+    def _advance_ids(self, ids: Iterable[Optional[str]]) -> None:
+        # Ids chosen by the caller (e.g. imported ones) must not be allocated again
+        DatabaseConnector().advance_id("maintenances", "maintenance_id", [i for i in ids if i])
+
+    @staticmethod
+    def _invalid_reason(m: Maintenance) -> str:
+        """Why the entry can't be stored, "" if it is valid."""
+        if not m.device_name:
+            return "missing device_name"
+        try:
+            cost = float(m.cost)
+        except (TypeError, ValueError):
+            return f"invalid cost {m.cost!r}"
+        if not math.isfinite(cost):
+            return f"invalid cost {m.cost!r}"
+        if cost < 0:
+            return "negative cost"
+        return ""
+
+    @staticmethod
+    def _document(m: Maintenance) -> dict:
+        """The document of a valid entry (see _invalid_reason)."""
+        doc = asdict(m)
+        # Stored by the table itself (VERSION_FIELD)
+        del doc["version"]
+        # Costs may be given as text (e.g. from a form or an import), they are stored as numbers
+        doc["cost"] = float(m.cost)
+        return doc
+
+    @instrumented
     def upsert(self, m: Maintenance) -> None:
-        q = Query()
-        existing = self._table.get(q.maintenance_id == m.maintenance_id)
-        if existing is None:
-            self._table.insert(asdict(m))
-        else:
-            self._table.update(asdict(m), doc_ids=[existing.doc_id])
+        """
+        Insert or update the entry. Raises ValueError if it is invalid (see upsert_many) and ConflictError
+        if it was read from the database and its entry has been changed or removed since; nothing is
+        written then.
+        """
+        with self._locked():
+            reason = self._invalid_reason(m)
+            if reason:
+                raise ValueError(reason)
+            if m.maintenance_id:
+                self._advance_ids([m.maintenance_id])
+            else:
+                m.maintenance_id = self._new_ids(1)[0]
+            existing = self._table.lookup("maintenance_id", m.maintenance_id)
+            if m.version is not None and (not existing or existing[0].get(VERSION_FIELD, 0) != m.version):
+                raise ConflictError(f"Maintenance {m.maintenance_id} was changed by someone else")
+            doc = self._document(m)
+            if not existing:
+                doc_id = self._table.insert(doc)
+            else:
+                doc_id = existing[0].doc_id
+                self._table.update(doc, doc_ids=[doc_id])
+            m.version = self._table.get(doc_id=doc_id).get(VERSION_FIELD, 0)
+            deltas = {}
+            if existing:
+                self._add_cost(deltas, existing[0], -1)
+            self._add_cost(deltas, doc, 1)
+            self._apply_costs(deltas)
+
+    @instrumented
+    def upsert_many(self, items: List[Maintenance]) -> List[WriteResult]:
+        """
+        Insert or update several maintenance entries with a single database write.
+        Returns one WriteResult per entry, later entries with the same id win. Entries read from the
+        database whose entry was changed since (also by an earlier entry of the batch) are rejected
+        with CONFLICT_REASON, like Entity.store_many.
+        """
+        with self._locked():
+            results = []
+            valid = []
+            for m in items:
+                reason = self._invalid_reason(m)
+                results.append(WriteResult(m, not reason, reason))
+                if not reason:
+                    valid.append((len(results) - 1, m))
 
+            self._advance_ids(m.maintenance_id for _, m in valid)
+            # One block of ids for all new entries
+            without_id = [m for _, m in valid if not m.maintenance_id]
+            if without_id:
+                taken = {m.maintenance_id for _, m in valid}
+                for m, new_id in zip(without_id, self._new_ids(len(without_id), taken)):
+                    m.maintenance_id = new_id
+
+            writes = []
+            pending = {}
+            deltas = {}
+            for position, m in valid:
+                existing = None if m.maintenance_id in pending else self._table.lookup("maintenance_id", m.maintenance_id)
+                if m.version is not None and (
+                    existing is None or not existing or existing[0].get(VERSION_FIELD, 0) != m.version
+                ):
+                    results[position] = WriteResult(m, False, CONFLICT_REASON)
+                    continue
+                doc = self._document(m)
+                if m.maintenance_id in pending:
+                    writes[pending[m.maintenance_id]][1].update(doc)
+                else:
+                    if existing:
+                        self._add_cost(deltas, existing[0], -1)
+                    pending[m.maintenance_id] = len(writes)
+                    writes.append((existing[0].doc_id if existing else None, doc))
+
+            if writes:
+                doc_ids = self._table.write_many(writes)
+                for doc_id, doc in writes:
+                    self._add_cost(deltas, doc, 1)
+                self._apply_costs(deltas)
+                stored = {doc.doc_id: doc for doc in self._table.get(doc_ids=doc_ids)}
+                for result in results:
+                    if result.accepted:
+                        doc_id = doc_ids[pending[result.item.maintenance_id]]
+                        result.item.version = stored[doc_id].get(VERSION_FIELD, 0)
+        return results
+
+    @instrumented
     def delete_by_id(self, maintenance_id: str) -> bool:
-        q = Query()
-        existing = self._table.get(q.maintenance_id == maintenance_id)
-        if existing is None:
-            return False
-        self._table.remove(doc_ids=[existing.doc_id])
+        with self._locked():
+            existing = self._table.lookup("maintenance_id", maintenance_id)
+            if not existing:
+                return False
+            self._table.remove(doc_ids=[existing[0].doc_id])
+            deltas = {}
+            self._add_cost(deltas, existing[0], -1)
+            self._apply_costs(deltas)
         return True
 
+    # --- Cost aggregates ---
+
+    @staticmethod
+    def _add_cost(deltas: dict, doc: Mapping, sign: int) -> None:
+        """Add (sign=1) or subtract (sign=-1) the cost of a maintenance document to the pending deltas."""
+        delta = deltas.setdefault(doc["device_name"], {"count": 0, "total": 0.0, "months": {}})
+        cost = float(doc.get("cost") or 0.0)
+        delta["count"] += sign
+        delta["total"] += sign * cost
+        performed_at = doc.get("performed_at")
+        if isinstance(performed_at, datetime):
+            month = delta["months"].setdefault(performed_at.strftime("%Y-%m"), {"count": 0, "total": 0.0})
+            month["count"] += sign
+            month["total"] += sign * cost
+
+    def _apply_costs(self, deltas: dict) -> None:
+        """Add the deltas to the per-device aggregates, touching only the devices involved."""
+        writes = []
+        removed = []
+        for device_name, delta in deltas.items():
+            existing = self._costs.lookup("device_name", device_name)
+            if existing:
+                doc = dict(existing[0])
+                doc["months"] = {key: dict(value) for key, value in doc.get("months", {}).items()}
+            else:
+                doc = {"device_name": device_name, "count": 0, "total": 0.0, "months": {}}
+            doc["count"] += delta["count"]
+            doc["total"] += delta["total"]
+            for key, month_delta in delta["months"].items():
+                month = doc["months"].setdefault(key, {"count": 0, "total": 0.0})
+                month["count"] += month_delta["count"]
+                month["total"] += month_delta["total"]
+                if month["count"] <= 0:
+                    del doc["months"][key]
+            if doc["count"] <= 0:
+                # Dropping empty aggregates also drops the rounding errors of the subtractions
+                if existing:
+                    removed.append(existing[0].doc_id)
+                continue
+            writes.append((existing[0].doc_id if existing else None, doc))
+        if writes:
+            self._costs.write_many(writes)
+        if removed:
+            self._costs.remove(doc_ids=removed)
+
+    @instrumented
+    def rebuild_costs(self) -> None:
+        """Recompute the cost aggregates from all maintenance entries (e.g. after importing old data)."""
+        with self._locked():
+            deltas = {}
+            for doc in self._table.raw_values():
+                self._add_cost(deltas, doc, 1)
+            self._costs.truncate()
+            self._apply_costs(deltas)
+
+    @instrumented
+    def cost_summary(self, device_name: Optional[str] = None) -> CostSummary:
+        """
+        Return the maintenance costs from the stored aggregates, in O(devices) and without reading
+        the maintenance entries. With device_name only that device is summarized.
+        """
+        if device_name is not None:
+            docs = self._costs.lookup("device_name", device_name)
+        else:
+            docs = self._costs.raw_values()
+        summary = CostSummary()
+        for doc in docs:
+            summary.per_device[doc["device_name"]] = doc["total"]
+            summary.count_per_device[doc["device_name"]] = doc["count"]
+            summary.total += doc["total"]
+            summary.count += doc["count"]
+            for key, month in doc.get("months", {}).items():
+                summary.per_month[key] = summary.per_month.get(key, 0.0) + month["total"]
+        summary.per_month = dict(sorted(summary.per_month.items()))
+        return summary
+
+    @staticmethod
+    def _to_maintenance(r) -> Maintenance:
+        return Maintenance(
+            r["maintenance_id"], r["device_name"], r["description"], float(r.get("cost", 0.0)), r.get("performed_at"),
+            r.get(VERSION_FIELD, 0),
+        )
+
+    @instrumented
     def find_all(self) -> List[Maintenance]:
-        return [
-            Maintenance(
-                r["maintenance_id"],
-                r["device_name"],
-                r["description"],
-                float(r.get("cost", 0.0)),
-            )
-            for r in self._table.all()
-        ]
+        return [self._to_maintenance(r) for r in self._table.raw_values()]
+
+    @instrumented
+    def find_page(self, offset: int = 0, limit: int = 20, order_by: Optional[str] = None,
+                  filters: Optional[Mapping[str, Any]] = None, descending: bool = False) -> Page:
+        """
+        Return one page of maintenance entries ordered by order_by (default: order of entry).
+        filters: field -> value, e.g. {"device_name": "Drucker"}.
+        """
+        page = self._table.find_page(offset, limit, order_by, descending, filters)
+        page.items = [self._to_maintenance(r) for r in page.items]
+        return page
+
+    @instrumented
+    def find_where(self, where: Mapping[str, Any], order_by: Optional[str] = None, descending: bool = False,
+                   limit: Optional[int] = None) -> List[Maintenance]:
+        """
+        Maintenance entries fulfilling all conditions of where, field -> value, In(values) or Range(lo, hi),
+        e.g. the entries of the devices a user manages: {"device_name": In(names)}.
+        """
+        return [self._to_maintenance(r) for r in self._table.find_where(where, order_by, descending, limit)]
+
+    def explain_where(self, where: Mapping[str, Any], order_by: Optional[str] = None, descending: bool = False) -> Plan:
+        return self._table.explain_where(where, order_by, descending)
 
+    @instrumented
     def find_by_attribute(self, attr: str, value: Any, num_to_return: int = 100) -> List[Maintenance]:
-        q = Query()
-        res = self._table.search(q[attr] == value)
+        res = self._table.lookup(attr, value)
         res = res[:num_to_return] if num_to_return else res
-        return [
-            Maintenance(
-                r["maintenance_id"],
-                r["device_name"],
-                r["description"],
-                float(r.get("cost", 0.0)),
-            )
-            for r in res
-        ]
+        return [self._to_maintenance(r) for r in res]
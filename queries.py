@@ -0,0 +1,54 @@
+from dataclasses import dataclass
+from typing import Any, Iterable, Mapping, Optional
+
+
+@dataclass(frozen=True)
+class In:
+    """Condition of find_where: the field has one of the values."""
+    values: tuple
+
+    def __init__(self, values: Iterable) -> None:
+        object.__setattr__(self, "values", tuple(values))
+
+
+@dataclass(frozen=True)
+class Range:
+    """Condition of find_where: lo <= field < hi, None for an open end (datetimes, numbers, strings)."""
+    lo: Any = None
+    hi: Any = None
+
+
+@dataclass
+class Plan:
+    """
+    How find_where answers a query, see explain_where().
+    - strategy: "index" (hash index lookup), "range" (sorted index range), "scan" (all documents)
+      or "sql" (SQLite picks the index itself, detail holds its query plan)
+    - index: field of the index used
+    - candidates: documents the strategy yields, all of them are checked against every condition
+    - ordered: the candidates come in the requested order, so limit stops the walk early
+    """
+    strategy: str
+    index: Optional[str] = None
+    candidates: Optional[int] = None
+    ordered: bool = False
+    detail: str = ""
+
+
+def condition_matches(value: Any, condition: Any) -> bool:
+    if isinstance(condition, In):
+        return value in condition.values
+    if isinstance(condition, Range):
+        if value is None:
+            return False
+        try:
+            return (condition.lo is None or value >= condition.lo) and (condition.hi is None or value < condition.hi)
+        except TypeError:
+            # Values that can't be compared with the bounds (e.g. a string in a date range) don't match
+            return False
+    return value == condition
+
+
+def matches(doc: Mapping, where: Mapping[str, Any]) -> bool:
+    """True if the document fulfills all conditions of where (field -> value, In or Range)."""
+    return all(condition_matches(doc.get(field), condition) for field, condition in where.items())
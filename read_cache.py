@@ -0,0 +1,99 @@
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from changes import DELETE, RESET, ChangeFeed
+from database import DatabaseConnector
+from snapshots import Snapshot
+
+
+@dataclass
+class _LiveEntry:
+    feed: ChangeFeed
+    # Sequence number of the last change applied
+    cursor: int
+    # doc_id -> converted document, in doc_id order
+    items: Dict[int, Any] = field(default_factory=dict)
+    result: Any = None
+
+
+class TableCache:
+    """
+    Process-wide cache of loaded tables, shared by all sessions (see get_snapshot()).
+    Entries follow the change feed of their table: checking them is O(1), after a write only the
+    written documents are converted again, the table is only reloaded after a RESET (e.g. another
+    process wrote). The cached results are shared, callers must not modify them.
+    """
+
+    def __init__(self) -> None:
+        # (table name, convert) -> entry, so several read models of one table don't mix
+        self._live: Dict[Tuple[str, Callable], _LiveEntry] = {}
+        self._lock = threading.Lock()
+
+    def get_live(self, table_name: str, convert: Callable[[Any], Any], wrap: Callable[[list], Any] = list) -> Any:
+        """
+        Return wrap([convert(doc) for every document of the table]), kept up to date by applying the
+        changes of the table to the cached documents. Documents convert() raises KeyError or ValueError
+        for are left out.
+        """
+        table = DatabaseConnector().get_table(table_name)
+        # Lets the table notice writes of other processes, they are published as a RESET
+        table.refresh()
+        feed = table.changes
+        key = (table_name, convert)
+        entry = self._live.get(key)
+        if entry is not None and entry.feed is feed and entry.cursor == feed.cursor:
+            return entry.result
+        with self._lock:
+            entry = self._live.get(key)
+            if entry is not None and entry.feed is feed:
+                cursor = feed.cursor
+                changes = feed.since(entry.cursor, table_name)
+                if changes is not None and all(change.op != RESET for change in changes):
+                    added = False
+                    for change in changes:
+                        item = None if change.op == DELETE else self._convert(convert, change.value)
+                        if item is None:
+                            entry.items.pop(change.doc_id, None)
+                        else:
+                            added = added or change.doc_id not in entry.items
+                            entry.items[change.doc_id] = item
+                    if added:
+                        # New ids are usually the largest ones, sorting is then a single linear pass
+                        entry.items = dict(sorted(entry.items.items()))
+                    entry.cursor = max(cursor, changes[-1].seq if changes else 0)
+                    entry.result = wrap(list(entry.items.values()))
+                    return entry.result
+            # Unknown changes: load the table, changes written meanwhile are applied again next time
+            entry = _LiveEntry(feed, feed.cursor)
+            # The stored documents as they are, convert() copies what it keeps
+            for doc_id, doc in table.raw_items():
+                item = self._convert(convert, doc)
+                if item is not None:
+                    entry.items[doc_id] = item
+            entry.result = wrap(list(entry.items.values()))
+            self._live[key] = entry
+            return entry.result
+
+    @staticmethod
+    def _convert(convert: Callable[[Any], Any], doc: Any) -> Optional[Any]:
+        try:
+            return convert(doc)
+        except (KeyError, ValueError):
+            # Skip invalid data entries
+            return None
+
+    def get_snapshot(self, record_class) -> Snapshot:
+        """
+        Snapshot of the table of record_class (e.g. snapshots.UserRecord), kept up to date like
+        get_live(): after a write only the written documents become new records, the new snapshot
+        shares all others with the previous one. Unchanged tables return the same snapshot object.
+        """
+        return self.get_live(
+            record_class.table, record_class.from_document,
+            lambda records: Snapshot(record_class.table, record_class.key_field, records),
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._live.clear()
@@ -0,0 +1,153 @@
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Mapping
+
+from database import DatabaseConnector
+
+# What deleting a parent does to the documents referencing it
+RESTRICT = "restrict"
+CASCADE = "cascade"
+
+
+class IntegrityError(Exception):
+    """A document can't be deleted because documents of a RESTRICT relation still reference it."""
+
+
+@dataclass(frozen=True)
+class Relation:
+    """child_table.field holds the key (KEY_FIELDS) of a document of parent_table."""
+    child_table: str
+    field: str
+    parent_table: str
+    on_delete: str = RESTRICT
+
+
+# Key field per table, the value the relations refer to
+KEY_FIELDS: Dict[str, str] = {
+    "users": "id",
+    "devices": "device_name",
+    "reservations": "reservation_id",
+    "recurring_reservations": "reservation_id",
+    "maintenances": "maintenance_id",
+    "maintenance_costs": "device_name",
+}
+
+# Archived reservations are history and not part of any relation
+RELATIONS: List[Relation] = [
+    Relation("devices", "managed_by_user_id", "users", RESTRICT),
+    Relation("reservations", "device_name", "devices", CASCADE),
+    Relation("reservations", "user_id", "users", CASCADE),
+    Relation("recurring_reservations", "device_name", "devices", CASCADE),
+    Relation("recurring_reservations", "user_id", "users", CASCADE),
+    Relation("maintenances", "device_name", "devices", CASCADE),
+    # The cost aggregate of a device goes together with all its maintenance entries
+    Relation("maintenance_costs", "device_name", "devices", CASCADE),
+]
+
+
+def relations_to(parent_table: str) -> List[Relation]:
+    return [relation for relation in RELATIONS if relation.parent_table == parent_table]
+
+
+def relations_from(child_table: str) -> List[Relation]:
+    return [relation for relation in RELATIONS if relation.child_table == child_table]
+
+
+def _child_table(relation: Relation):
+    # The hash index on the foreign key is the reverse index of the relation
+    table = DatabaseConnector().get_table(relation.child_table)
+    table.ensure_index(relation.field)
+    return table
+
+
+def count_dependents(parent_table: str, key) -> Dict[str, int]:
+    """Child table -> number of its documents referencing key, O(1) per relation."""
+    counts: Dict[str, int] = {}
+    for relation in relations_to(parent_table):
+        n = _child_table(relation).count_lookup(relation.field, key)
+        counts[relation.child_table] = counts.get(relation.child_table, 0) + n
+    return counts
+
+
+def has_dependents(parent_table: str, key) -> bool:
+    return any(_child_table(relation).count_lookup(relation.field, key) for relation in relations_to(parent_table))
+
+
+def missing_references(child_table: str, doc: Mapping) -> List[Relation]:
+    """The relations of child_table whose parent the document references doesn't exist, O(1) each."""
+    missing = []
+    for relation in relations_from(child_table):
+        value = doc.get(relation.field)
+        if value is None:
+            continue
+        parents = DatabaseConnector().get_table(relation.parent_table)
+        parents.ensure_index(KEY_FIELDS[relation.parent_table])
+        if not parents.count_lookup(KEY_FIELDS[relation.parent_table], value):
+            missing.append(relation)
+    return missing
+
+
+def _tables_below(parent_table: str) -> List[str]:
+    """parent_table and the tables deleting one of its documents may cascade to, parents first."""
+    tables = [parent_table]
+    for table in tables:
+        for relation in relations_to(table):
+            if relation.child_table not in tables:
+                tables.append(relation.child_table)
+    return tables
+
+
+@contextmanager
+def locked(parent_table: str) -> Iterator[None]:
+    """
+    Lock parent_table and every table a delete may check or cascade to, parents first, so no
+    dependent is added between the checks and the delete.
+    """
+    with ExitStack() as stack:
+        for name in _tables_below(parent_table):
+            stack.enter_context(DatabaseConnector().get_table(name).locked())
+        yield
+
+
+def check_delete(parent_table: str, key) -> None:
+    """
+    Raise IntegrityError if deleting the document with key would leave documents of a RESTRICT
+    relation dangling, including the documents a cascade would delete. O(dependents).
+    """
+    for relation in relations_to(parent_table):
+        table = _child_table(relation)
+        if relation.on_delete == RESTRICT:
+            n = table.count_lookup(relation.field, key)
+            if n:
+                raise IntegrityError(
+                    f"{parent_table} {key!r} is still referenced by {n} {relation.child_table} ({relation.field})"
+                )
+        elif relations_to(relation.child_table):
+            key_field = KEY_FIELDS[relation.child_table]
+            for doc in table.lookup(relation.field, key):
+                check_delete(relation.child_table, doc[key_field])
+
+
+def delete_dependents(parent_table: str, key) -> Dict[str, int]:
+    """
+    Delete the documents of the CASCADE relations referencing key (recursively), after checking the
+    RESTRICT relations with check_delete(). Call it under locked(parent_table) together with deleting
+    the document itself. Returns the number of deleted documents per table, O(dependents).
+    """
+    check_delete(parent_table, key)
+    deleted: Dict[str, int] = {}
+    for relation in relations_to(parent_table):
+        if relation.on_delete != CASCADE:
+            continue
+        table = _child_table(relation)
+        docs = table.lookup(relation.field, key)
+        if not docs:
+            continue
+        if relations_to(relation.child_table):
+            key_field = KEY_FIELDS[relation.child_table]
+            for doc in docs:
+                for name, n in delete_dependents(relation.child_table, doc[key_field]).items():
+                    deleted[name] = deleted.get(name, 0) + n
+        table.remove(doc_ids=[doc.doc_id for doc in docs])
+        deleted[relation.child_table] = deleted.get(relation.child_table, 0) + len(docs)
+    return deleted
@@ -1,85 +1,690 @@
-import os
+import heapq
+import math
+import threading
+import time
+import warnings
 from dataclasses import dataclass, asdict
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
 
-from tinydb import TinyDB, Query
-from serializer import serializer
+from archive import PartitionedArchive
+from database import DatabaseConnector, Page, WriteResult
+from devices import Device, DeviceState
+from indexes import IntervalIndex
+from instrumentation import instrumented
+from queries import Plan, Range, matches
 
 
-def _db_path(filename: str = "database.json") -> str:
-    return os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+@dataclass(slots=True)
+class Reservation:
+    # None/"" --> an id is assigned by ReservationManager.create
+    reservation_id: Optional[str]
+    device_name: str
+    user_id: str
+    start: datetime
+    end: datetime
+    note: str = ""
 
 
-@dataclass
-class Reservation:
-    reservation_id: str
+@dataclass(slots=True)
+class RecurringReservation:
+    """
+    A reservation repeating every `every`, e.g. every Tuesday 9-12 for a semester: the first occurrence
+    is [start, end), the last one starts before until. Stored as one rule record, occurrences are
+    computed from it when needed and never stored.
+    """
+    # None/"" --> an id is assigned by ReservationManager.create_recurring
+    reservation_id: Optional[str]
     device_name: str
     user_id: str
     start: datetime
     end: datetime
+    every: timedelta
+    until: datetime
     note: str = ""
 
+    def to_dict(self) -> dict:
+        doc = asdict(self)
+        # Stored in seconds, the serializer only knows dates and times
+        doc["every"] = self.every.total_seconds()
+        return doc
+
+    @classmethod
+    def from_dict(cls, doc: Mapping) -> "RecurringReservation":
+        return cls(
+            doc["reservation_id"], doc["device_name"], doc["user_id"], doc["start"], doc["end"],
+            timedelta(seconds=doc["every"]), doc["until"], doc.get("note", ""),
+        )
+
+    def __len__(self) -> int:
+        """Number of occurrences."""
+        # ceil((until - start) / every)
+        return max(0, -((self.start - self.until) // self.every))
+
+    @property
+    def last_end(self) -> datetime:
+        """End of the last occurrence."""
+        return self.end + (len(self) - 1) * self.every
+
+    def _indexes(self, lo: Optional[datetime], hi: Optional[datetime]) -> range:
+        # Occurrence k is [start + k * every, end + k * every); the ones overlapping [lo, hi) have
+        # end + k * every > lo and start + k * every < hi
+        first = 0 if lo is None else max(0, (lo - self.end) // self.every + 1)
+        stop = len(self) if hi is None else min(len(self), -((self.start - hi) // self.every))
+        return range(first, stop)
+
+    def _start_indexes(self, lo: Optional[datetime], hi: Optional[datetime]) -> range:
+        # The occurrences with lo <= start + k * every < hi
+        first = 0 if lo is None else max(0, -((self.start - lo) // self.every))
+        stop = len(self) if hi is None else min(len(self), -((self.start - hi) // self.every))
+        return range(first, stop)
+
+    def occurrences(self, lo: Optional[datetime] = None, hi: Optional[datetime] = None) -> Iterator[Tuple[datetime, datetime]]:
+        """The occurrences (start, end) overlapping [lo, hi) (None = unbounded), oldest first, computed lazily."""
+        for k in self._indexes(lo, hi):
+            yield self.start + k * self.every, self.end + k * self.every
+
+    def occurrences_starting(self, lo: Optional[datetime] = None, hi: Optional[datetime] = None,
+                             descending: bool = False) -> Iterator[Tuple[datetime, datetime]]:
+        """The occurrences (start, end) with lo <= start < hi (None = unbounded) by start, computed lazily."""
+        indexes = self._start_indexes(lo, hi)
+        for k in (reversed(indexes) if descending else indexes):
+            yield self.start + k * self.every, self.end + k * self.every
+
+    def count_starting(self, lo: Optional[datetime] = None, hi: Optional[datetime] = None) -> int:
+        """Number of occurrences with lo <= start < hi, without computing them."""
+        return len(self._start_indexes(lo, hi))
+
+    def count_between(self, lo: Optional[datetime] = None, hi: Optional[datetime] = None) -> int:
+        """Number of occurrences overlapping [lo, hi), without computing them."""
+        return len(self._indexes(lo, hi))
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        """True if an occurrence overlaps [start, end). O(1)."""
+        return bool(self._indexes(start, end))
+
+    def overlaps_series(self, other: "RecurringReservation") -> bool:
+        """
+        True if an occurrence of this series overlaps one of other. The start offsets of the two
+        series' occurrences take every multiple of gcd(every, other.every) plus their initial offset, so
+        over a common span of at least lcm(every, other.every) a single modulo answers it. Shorter
+        spans compare the occurrences of one series with the other one in O(1) each.
+        """
+        lo, hi = max(self.start, other.start), min(self.last_end, other.last_end)
+        if lo >= hi:
+            return False
+        unit = timedelta(microseconds=1)
+        a, b = self.every // unit, other.every // unit
+        gcd = math.gcd(a, b)
+        duration, other_duration = self.end - self.start, other.end - other.start
+        if hi - lo >= (a // gcd * b) * unit + 2 * (duration + other_duration):
+            offset = (other.start - self.start) % (gcd * unit)
+            return offset < duration or gcd * unit - offset < other_duration
+        shorter, longer = sorted((self, other), key=lambda series: series.count_between(lo, hi))
+        return any(longer.overlaps(start, end) for start, end in shorter.occurrences(lo, hi))
+
+
+# Fields that are the same for all occurrences of a recurring reservation
+_SERIES_FIELDS = ("reservation_id", "device_name", "user_id", "note")
+
+# find_available_devices checks up to this many candidates one by one, an interval index lookup each.
+# For more, one sweep over the reservations that can overlap the slot is cheaper.
+_MAX_SEPARATE_CHECKS = 8
+
+
+@dataclass(slots=True)
+class DeviceStatus:
+    """Effective status of a device at one point in time, see ReservationManager.fleet_status."""
+    device_name: str
+    state: DeviceState
+    # User and reservation holding the device, None if it isn't reserved
+    holder: Optional[str] = None
+    reservation_id: Optional[str] = None
+    # End of the current reservation, extended by reservations following it without a gap
+    free_at: Optional[datetime] = None
+
 
 class ReservationManager:
+    """
+    Reservations live in the table "reservations". Finished ones can be moved to a monthly
+    partitioned archive (see archive()), which keeps the table and its indexes small. Availability
+    checks and time-based queries consult the archive only if their time range reaches into it;
+    the listing methods include it on request (include_archive=True).
+    Recurring reservations are rule records in the table "recurring_reservations". Availability
+    checks, time-based queries, find_by_device and find_page include their occurrences, which are
+    only computed for the time range asked for.
+    """
+
     def __init__(self) -> None:
-        self._db = TinyDB(_db_path("database.json"), storage=serializer)
-        self._table = self._db.table("reservations")
+        self._table = DatabaseConnector().get_table("reservations")
+        self._table.ensure_index("reservation_id")
+        self._table.ensure_index("device_name")
+        self._table.ensure_index("user_id")
+        # Sorted reservation intervals per device for availability checks
+        self._table.ensure_interval_index("device_name", "start", "end")
+        # Reservations ordered by start for the paged list
+        self._table.ensure_sorted_index("start")
+        self._archive = PartitionedArchive(DatabaseConnector().archive_directory("reservations"), "reservation_id")
+        self._archiver = None
+        self._rules = DatabaseConnector().get_table("recurring_reservations")
+        self._rules.ensure_index("reservation_id")
+        self._rules.ensure_index("device_name")
+
+    def next_ids(self, count: int = 1) -> List[str]:
+        """Allocate count unused reservation ids (e.g. for an import)."""
+        first = DatabaseConnector().next_id("reservations", "reservation_id", count)
+        return [str(i) for i in range(first, first + count)]
+
+    def _new_ids(self, count: int, taken: Iterable[str] = ()) -> List[str]:
+        """
+        next_ids(count) without the ids that are already used, e.g. by reservations stored with an id of
+        their own by another program. Call it under the table lock.
+        """
+        taken = set(taken)
+        ids = []
+        while len(ids) < count:
+            ids += [i for i in self.next_ids(count - len(ids)) if i not in taken and not self._id_taken(i)]
+        return ids
+
+    def _advance_ids(self, ids: Iterable[Optional[str]]) -> None:
+        # Ids chosen by the caller (e.g. imported ones) must not be allocated again
+        DatabaseConnector().advance_id("reservations", "reservation_id", [i for i in ids if i])
 
     @staticmethod
     def _overlaps(a_start: datetime, a_end: datetime, b_start: datetime, b_end: datetime) -> bool:
         # Überlappung, falls nicht (a endet vor b startet) und nicht (b endet vor a startet)
         return not (a_end <= b_start or b_end <= a_start)
 
+    @staticmethod
+    def _to_reservation(r) -> Reservation:
+        return Reservation(
+            r["reservation_id"], r["device_name"], r["user_id"],
+            r["start"], r["end"], r.get("note", "")
+        )
+
+    @staticmethod
+    def _merge(docs: List[Mapping], archived: Iterable[Mapping]) -> List[Mapping]:
+        # A reservation is only in both after an interrupted archive(), the table's copy is the current one
+        ids = {doc["reservation_id"] for doc in docs}
+        return list(docs) + [doc for doc in archived if doc["reservation_id"] not in ids]
+
+    def _combined(self, docs: List[Mapping], archived: List[Mapping], order_by: Optional[str],
+                  descending: bool) -> List[Mapping]:
+        """Table and archive results in one order, by order_by or else archive (the older ones) first."""
+        merged = self._merge(docs, archived)
+        if order_by is None:
+            merged = merged[len(docs):] + merged[:len(docs)]
+            return merged[::-1] if descending else merged
+        # Like the table queries, reservations without a value for order_by are left out
+        merged = [doc for doc in merged if doc.get(order_by) is not None]
+        merged.sort(key=lambda doc: doc[order_by], reverse=descending)
+        return merged
+
+    def _recurring(self, device_name: Optional[str] = None) -> List[RecurringReservation]:
+        """The recurring reservations of the device (default: of all devices)."""
+        docs = self._rules.raw_values() if device_name is None else self._rules.lookup("device_name", device_name)
+        return [RecurringReservation.from_dict(doc) for doc in docs]
+
+    @staticmethod
+    def _occurrence_doc(rule: RecurringReservation, start: datetime, end: datetime) -> dict:
+        return {
+            "reservation_id": rule.reservation_id, "device_name": rule.device_name, "user_id": rule.user_id,
+            "start": start, "end": end, "note": rule.note,
+        }
+
+    def _occurrence_docs(self, rule: RecurringReservation, lo: Optional[datetime] = None,
+                         hi: Optional[datetime] = None) -> Iterator[dict]:
+        """The occurrences of rule overlapping [lo, hi) as reservation documents, oldest first."""
+        for start, end in rule.occurrences(lo, hi):
+            yield self._occurrence_doc(rule, start, end)
+
+    def _occurrences_starting(self, rule: RecurringReservation, lo: Optional[datetime] = None,
+                              hi: Optional[datetime] = None, descending: bool = False) -> Iterator[dict]:
+        """The occurrences of rule with lo <= start < hi as reservation documents, ordered by start."""
+        for start, end in rule.occurrences_starting(lo, hi, descending):
+            yield self._occurrence_doc(rule, start, end)
+
+    def _overlapping(self, device_name: str, start: datetime, end: datetime, recurring: bool = True) -> List[Mapping]:
+        """
+        Reservations of the device overlapping [start, end) from table and archive and, with recurring,
+        the occurrences of its recurring reservations, ordered by start.
+        """
+        docs = self._table.find_overlapping("device_name", device_name, start, end)
+        archived = [doc for doc in self._archive.overlapping(start, end) if doc["device_name"] == device_name]
+        if recurring:
+            archived += [doc for rule in self._recurring(device_name) for doc in self._occurrence_docs(rule, start, end)]
+        if not archived:
+            return docs
+        return sorted(self._merge(docs, archived), key=lambda doc: doc["start"])
+
+    def _occurrence_streams(self, where: Mapping[str, Any], order_by: Optional[str] = "start",
+                            descending: bool = False) -> Tuple[List[Iterator[dict]], int]:
+        """
+        One lazy stream per recurring reservation of the occurrences matching where (conditions on the
+        series' fields and a Range on start), each ordered by order_by, and their total number. Only
+        the occurrences that are read from the streams are computed; the total is O(1) per recurring
+        reservation unless where has other conditions on start or end, which are checked one by one.
+        """
+        if order_by is not None and order_by not in _SERIES_FIELDS + ("start", "end"):
+            # Occurrences have no other fields, like documents without order_by they are left out
+            return [], 0
+        start = where.get("start")
+        lo, hi = (start.lo, start.hi) if isinstance(start, Range) else (None, None)
+        series_where = {field: condition for field, condition in where.items() if field in _SERIES_FIELDS}
+        other = {
+            field: condition for field, condition in where.items()
+            if field not in _SERIES_FIELDS and not (field == "start" and isinstance(condition, Range))
+        }
+        device_name = where.get("device_name")
+        streams = []
+        total = 0
+        for rule in self._recurring(device_name if isinstance(device_name, str) else None):
+            if not matches(rule.to_dict(), series_where):
+                continue
+            if other:
+                count = sum(1 for doc in self._occurrences_starting(rule, lo, hi) if matches(doc, other))
+            else:
+                count = rule.count_starting(lo, hi)
+            if not count:
+                continue
+            total += count
+            docs = self._occurrences_starting(rule, lo, hi, descending)
+            streams.append((doc for doc in docs if matches(doc, other)) if other else docs)
+        return streams, total
+
+    def _archived(self, where: Mapping[str, Any]) -> List[Mapping]:
+        """Archived reservations matching where, only opening the partitions its start range reaches."""
+        start = where.get("start")
+        lo, hi = (start.lo, start.hi) if isinstance(start, Range) else (None, None)
+        if isinstance(start, datetime):
+            lo, hi = start, start + timedelta(microseconds=1)
+        return [
+            doc for key in self._archive.partitions(lo, hi) for doc in self._archive.load(key)
+            if matches(doc, where)
+        ]
+
+    @instrumented
     def is_available(self, device_name: str, start: datetime, end: datetime) -> bool:
         if end <= start:
             return False
+        # O(1) per recurring reservation, its occurrences aren't computed
+        if any(rule.overlaps(start, end) for rule in self._recurring(device_name)):
+            return False
+        return not self._overlapping(device_name, start, end, recurring=False)
 
-        q = Query()
-        existing = self._table.search(q.device_name == device_name)
-        for r in existing:
-            r_start = r["start"]
-            r_end = r["end"]
-            if self._overlaps(start, end, r_start, r_end):
-                return False
-        return True
+    @instrumented
+    def current_reservation(self, device_name: str, at: Optional[datetime] = None) -> Optional[Reservation]:
+        """Return the reservation holding the device at the given time (default: now), if any."""
+        if at is None:
+            at = datetime.now()
+        res = self._table.find_covering("device_name", device_name, at)
+        if not res:
+            # [at, at + 1µs) is overlapped exactly by the reservations covering at
+            res = [
+                doc for doc in self._archive.overlapping(at, at + timedelta(microseconds=1))
+                if doc["device_name"] == device_name
+            ]
+        if not res:
+            res = [
+                doc for rule in self._recurring(device_name)
+                for doc in self._occurrence_docs(rule, at, at + timedelta(microseconds=1))
+            ]
+        return self._to_reservation(res[0]) if res else None
+
+    @instrumented
+    def fleet_status(self, at: Optional[datetime] = None) -> Dict[str, DeviceStatus]:
+        """
+        Return the effective status of every device at the given time (default: now).
+        A device with an active reservation is RESERVED, unless it is in maintenance or inactive.
+        All devices are answered by a single sweep over the reservations ordered by start, beginning
+        at the earliest start an active reservation can have and stopping once no reservation can
+        hold or extend a device any more.
+        """
+        if at is None:
+            at = datetime.now()
+        status = {d.device_name: DeviceStatus(d.device_name, d.state) for d in Device.find_all()}
+        longest = self._table.longest_interval("device_name")
+        reservations = self._table.iter_sorted("start", lo=at - longest) if longest is not None else iter(())
+        # Archived reservations ending after at (only when looking into the past)
+        archived = sorted(self._archive.overlapping(at, None), key=lambda doc: doc["start"])
+        # Occurrences of the recurring reservations, computed one by one as the sweep advances
+        occurrences = [self._occurrence_docs(rule, at) for rule in self._recurring()]
+        if archived or occurrences:
+            reservations = heapq.merge(reservations, archived, *occurrences, key=lambda doc: doc["start"])
+
+        free_at: Dict[str, datetime] = {}
+        # Latest free_at of all devices, later reservations can't affect any device
+        horizon = None
+        for r in reservations:
+            start, end, device_name = r["start"], r["end"], r["device_name"]
+            if start > at and (horizon is None or start > horizon):
+                break
+            if start <= at < end:
+                current = status.get(device_name)
+                if current is not None:
+                    current.holder = r["user_id"]
+                    current.reservation_id = r["reservation_id"]
+                    if current.state not in (DeviceState.MAINTENANCE, DeviceState.INACTIVE):
+                        current.state = DeviceState.RESERVED
+            elif not (start > at and device_name in free_at and start <= free_at[device_name]):
+                continue
+            free_at[device_name] = max(free_at.get(device_name, end), end)
+            horizon = free_at[device_name] if horizon is None else max(horizon, free_at[device_name])
 
+        for device_name, end in free_at.items():
+            if device_name in status:
+                status[device_name].free_at = end
+        return status
+
+    @instrumented
+    def reservations_between(self, device_name: str, start: datetime, end: datetime) -> List[Reservation]:
+        """Return the reservations of the device overlapping [start, end), ordered by start."""
+        return [self._to_reservation(r) for r in self._overlapping(device_name, start, end)]
+
+    @instrumented
+    def find_free_slots(self, device_name: str, window_start: datetime, window_end: datetime,
+                        min_duration: timedelta = timedelta(0)) -> List[Tuple[datetime, datetime]]:
+        """
+        Return the gaps of at least min_duration between the reservations of the device within
+        [window_start, window_end), ordered by start.
+        """
+        slots = []
+        free_from = window_start
+        # Ordered by start, so one sweep merges overlapping and adjacent reservations
+        for r in self._overlapping(device_name, window_start, window_end):
+            if r["start"] > free_from and r["start"] - free_from >= min_duration:
+                slots.append((free_from, r["start"]))
+            free_from = max(free_from, r["end"])
+        if window_end > free_from and window_end - free_from >= min_duration:
+            slots.append((free_from, window_end))
+        return slots
+
+    @instrumented
+    def find_available_devices(self, start: datetime, end: datetime,
+                               candidates: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Return the devices without a reservation overlapping [start, end), in the order of candidates
+        (default: all devices that are neither in maintenance nor inactive).
+        Instead of checking every device separately, the reservations that can overlap the slot are
+        collected in one sweep; only a few explicit candidates are checked one by one.
+        """
+        if end <= start:
+            return []
+        if candidates is None:
+            devices = Device.find_all(lazy=True)
+            candidates = [
+                name for name, state in zip(devices.column("device_name"), devices.column("state"))
+                if state not in (DeviceState.MAINTENANCE.value, DeviceState.INACTIVE.value)
+            ]
+        else:
+            candidates = list(candidates)
+        if len(candidates) <= _MAX_SEPARATE_CHECKS:
+            return [name for name in candidates if self.is_available(name, start, end)]
+
+        busy = set()
+        longest = self._table.longest_interval("device_name")
+        if longest is not None:
+            for r in self._table.iter_sorted("start", lo=start - longest, hi=end):
+                if r["end"] > start:
+                    busy.add(r["device_name"])
+        busy.update(doc["device_name"] for doc in self._archive.overlapping(start, end))
+        busy.update(rule.device_name for rule in self._recurring() if rule.overlaps(start, end))
+        return [name for name in candidates if name not in busy]
+
+    @instrumented
     def create(self, res: Reservation) -> bool:
-        # ID eindeutig?
-        q = Query()
-        if self._table.get(q.reservation_id == res.reservation_id) is not None:
-            return False
+        return self.create_many([res])[0].accepted
 
-        if not self.is_available(res.device_name, res.start, res.end):
-            return False
+    @instrumented
+    def create_many(self, reservations: List[Reservation]) -> List[WriteResult]:
+        """
+        Create several reservations with a single database write.
+        Every reservation is checked against the table and against the reservations accepted
+        before it in the same batch. Returns one WriteResult per reservation.
+        """
+        # Checks and insert under the table lock, so no other process books the slot in between
+        with self._table.locked():
+            results = []
+            accepted = []
+            batch_ids = set()
+            # Intervals accepted so far in this batch, per device
+            batch_intervals = IntervalIndex("device_name", "start", "end")
+            for res in reservations:
+                reason = ""
+                doc = asdict(res)
+                if not res.device_name:
+                    reason = "missing device_name"
+                elif res.end <= res.start:
+                    reason = "end is not after start"
+                # ID eindeutig?
+                elif res.reservation_id and (
+                    res.reservation_id in batch_ids or self._id_taken(res.reservation_id)
+                ):
+                    reason = f"reservation_id {res.reservation_id} already taken"
+                elif not self.is_available(res.device_name, res.start, res.end):
+                    reason = "conflicts with an existing reservation"
+                elif batch_intervals.overlapping(res.device_name, res.start, res.end):
+                    reason = "conflicts with another reservation in this batch"
 
-        self._table.insert(asdict(res))
-        return True
+                if reason:
+                    results.append(WriteResult(res, False, reason))
+                    continue
+                batch_ids.add(res.reservation_id)
+                batch_intervals.update(len(accepted), doc)
+                accepted.append((res, doc))
+                results.append(WriteResult(res, True))
+
+            # One block of ids for all accepted reservations without one
+            without_id = [(res, doc) for res, doc in accepted if not res.reservation_id]
+            if without_id:
+                for (res, doc), new_id in zip(without_id, self._new_ids(len(without_id), batch_ids)):
+                    res.reservation_id = doc["reservation_id"] = new_id
 
+            if accepted:
+                self._table.insert_multiple([doc for res, doc in accepted])
+                self._advance_ids(batch_ids)
+        return results
+
+    def _id_taken(self, reservation_id: str) -> bool:
+        # Single, archived and recurring reservations share the ids
+        return bool(
+            self._table.lookup("reservation_id", reservation_id)
+            or self._rules.lookup("reservation_id", reservation_id)
+            or reservation_id in self._archive
+        )
+
+    @instrumented
+    def create_recurring(self, rule: RecurringReservation) -> WriteResult:
+        """
+        Store a recurring reservation if none of its occurrences conflicts with a single or another
+        recurring reservation of the device. The single reservations are only read within the span of
+        the series and compared in O(1) each, other series by interval arithmetic (see
+        RecurringReservation.overlaps_series); the occurrences are never listed.
+        """
+        reason = ""
+        with self._table.locked():
+            if not rule.device_name:
+                reason = "missing device_name"
+            elif rule.end <= rule.start:
+                reason = "end is not after start"
+            elif rule.every < rule.end - rule.start:
+                reason = "occurrences overlap each other"
+            elif rule.until <= rule.start:
+                reason = "until is not after start"
+            elif rule.reservation_id and self._id_taken(rule.reservation_id):
+                reason = f"reservation_id {rule.reservation_id} already taken"
+            elif any(
+                rule.overlaps(doc["start"], doc["end"])
+                for doc in self._overlapping(rule.device_name, rule.start, rule.last_end, recurring=False)
+            ):
+                reason = "conflicts with an existing reservation"
+            elif any(rule.overlaps_series(other) for other in self._recurring(rule.device_name)):
+                reason = "conflicts with an existing recurring reservation"
+            if reason:
+                return WriteResult(rule, False, reason)
+            if rule.reservation_id:
+                self._advance_ids([rule.reservation_id])
+            else:
+                rule.reservation_id = self._new_ids(1)[0]
+            self._rules.insert(rule.to_dict())
+        return WriteResult(rule, True)
+
+    def find_recurring(self, device_name: Optional[str] = None) -> List[RecurringReservation]:
+        """The recurring reservations (rule records) of the device, default: of all devices."""
+        return self._recurring(device_name)
+
+    @instrumented
     def delete_by_id(self, reservation_id: str) -> bool:
-        q = Query()
-        existing = self._table.get(q.reservation_id == reservation_id)
-        if existing is None:
-            return False
-        self._table.remove(doc_ids=[existing.doc_id])
+        """Delete a single reservation or a recurring one with all its occurrences."""
+        with self._table.locked():
+            existing = self._table.lookup("reservation_id", reservation_id)
+            if not existing:
+                rules = self._rules.lookup("reservation_id", reservation_id)
+                if rules:
+                    self._rules.remove(doc_ids=[rules[0].doc_id])
+                    return True
+                return self._archive.remove(reservation_id)
+            self._table.remove(doc_ids=[existing[0].doc_id])
         return True
 
-    def find_all(self) -> List[Reservation]:
-        return [
-            Reservation(
-                r["reservation_id"], r["device_name"], r["user_id"],
-                r["start"], r["end"], r.get("note", "")
-            )
-            for r in self._table.all()
-        ]
+    @instrumented
+    def archive(self, before: Optional[datetime] = None) -> int:
+        """
+        Move the reservations that ended by `before` (default: the start of the current month) to the
+        archive. Works one month at a time and holds the table lock only while moving one month,
+        so bookings wait at most that long. Returns the number of archived reservations.
+        """
+        if before is None:
+            before = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        archived = 0
+        month = None
+        while True:
+            with self._table.locked():
+                first = next(self._table.iter_sorted("start", lo=month, hi=before), None)
+                if first is None:
+                    return archived
+                month = first["start"].replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+                month_end = (month + timedelta(days=32)).replace(day=1)
+                docs = [
+                    r for r in self._table.iter_sorted("start", lo=month, hi=min(month_end, before))
+                    if r["end"] <= before
+                ]
+                if docs:
+                    # Archive first: a crash in between leaves a copy in both, which reads tolerate
+                    self._archive.add(docs)
+                    self._table.remove(doc_ids=[r.doc_id for r in docs])
+                    archived += len(docs)
+                month = month_end
 
-    def find_by_device(self, device_name: str) -> List[Reservation]:
-        q = Query()
-        res = self._table.search(q.device_name == device_name)
-        return [
-            Reservation(
-                r["reservation_id"], r["device_name"], r["user_id"],
-                r["start"], r["end"], r.get("note", "")
+    def start_archiving(self, interval_s: float = 3600) -> threading.Thread:
+        """Run archive() in a background thread every interval_s seconds (started once per manager)."""
+        if self._archiver is None:
+            def run() -> None:
+                while True:
+                    try:
+                        self.archive()
+                    except OSError as e:
+                        warnings.warn(f"Archiving reservations failed: {e}")
+                    time.sleep(interval_s)
+
+            self._archiver = threading.Thread(target=run, name="reservation-archiver", daemon=True)
+            self._archiver.start()
+        return self._archiver
+
+    def archive_size(self) -> int:
+        """Number of archived reservations."""
+        return len(self._archive)
+
+    def iter_archived(self) -> Iterator[Mapping]:
+        """The archived reservations, oldest partition first, loading one partition at a time."""
+        for key in self._archive.partitions():
+            yield from self._archive.load(key)
+
+    @instrumented
+    def find_all(self, include_archive: bool = False) -> List[Reservation]:
+        docs = self._table.raw_values()
+        if include_archive:
+            docs = self._combined(docs, self._archived({}), None, False)
+        return [self._to_reservation(r) for r in docs]
+
+    @instrumented
+    def find_page(self, offset: int = 0, limit: int = 20, order_by: str = "start",
+                  filters: Optional[Mapping[str, Any]] = None, descending: bool = False,
+                  date_range: Optional[Tuple[Optional[datetime], Optional[datetime]]] = None,
+                  include_archive: bool = False) -> Page:
+        """
+        Return one page of reservations ordered by order_by.
+        filters: field -> value, e.g. {"device_name": "Drucker", "user_id": "u1"}.
+        date_range: (from, to) limits the start of the reservations to from <= start < to, None for an open end.
+        include_archive: page over the archived reservations as well (loads the archive partitions in date_range).
+        The occurrences of recurring reservations are included. The first offset + limit reservations of
+        the table are merged with the occurrences, which are computed one by one as the merge advances.
+        Cost: without recurring reservations (matching where) and archive, a page is one indexed read of
+        limit documents. With them every page reads and merges everything before it, O(offset + limit),
+        so deep pages get slower; narrow date_range to the dates wanted instead of paging far.
+        """
+        if date_range is not None and order_by != "start":
+            raise ValueError("date_range is only supported when ordering by start")
+        where = dict(filters or {})
+        if date_range is not None:
+            where["start"] = Range(*date_range)
+        archived = self._archived(where) if include_archive else []
+        occurrences, occurrence_total = self._occurrence_streams(where, order_by, descending)
+        if not archived and not occurrences:
+            page = self._table.find_page(offset, limit, order_by, descending, filters, date_range)
+            page.items = [self._to_reservation(r) for r in page.items]
+            return page
+
+        # Later pages only contain reservations of the table that come before offset + limit
+        first = self._table.find_page(0, offset + limit, order_by, descending, filters, date_range)
+        # A reservation is only in both after an interrupted archive(), the table's copy is the current one
+        archived = [doc for doc in archived if not self._table.count_lookup("reservation_id", doc["reservation_id"])]
+        if order_by is None:
+            # Order of storing: the archive holds the older reservations, occurrences aren't stored
+            sources = [archived, first.items, *occurrences]
+            if descending:
+                sources = [*reversed(occurrences), first.items, archived[::-1]]
+            docs = chain(*sources)
+        else:
+            archived = sorted(
+                (doc for doc in archived if doc.get(order_by) is not None),
+                key=lambda doc: doc[order_by], reverse=descending,
             )
-            for r in res
-        ]
+            docs = heapq.merge(first.items, archived, *occurrences, key=lambda doc: doc[order_by], reverse=descending)
+        items = [self._to_reservation(r) for r in islice(docs, offset, offset + limit)]
+        return Page(items, first.total + len(archived) + occurrence_total, offset, limit)
+
+    @instrumented
+    def find_where(self, where: Mapping[str, Any], order_by: Optional[str] = None, descending: bool = False,
+                   limit: Optional[int] = None, include_archive: bool = False) -> List[Reservation]:
+        """
+        Reservations fulfilling all conditions of where, field -> value, In(values) or Range(lo, hi),
+        e.g. the reservations of a user next week: {"user_id": "u1", "start": Range(monday, next_monday)}.
+        include_archive: search the archive as well (without order_by, archived reservations come first).
+        """
+        archived = self._archived(where) if include_archive else []
+        if not archived:
+            return [self._to_reservation(r) for r in self._table.find_where(where, order_by, descending, limit)]
+        docs = self._combined(self._table.find_where(where), archived, order_by, descending)
+        return [self._to_reservation(r) for r in docs[:limit]]
+
+    def explain_where(self, where: Mapping[str, Any], order_by: Optional[str] = None, descending: bool = False) -> Plan:
+        return self._table.explain_where(where, order_by, descending)
+
+    @instrumented
+    def find_by_device(self, device_name: str, include_archive: bool = False,
+                       date_range: Optional[Tuple[Optional[datetime], Optional[datetime]]] = None) -> List[Reservation]:
+        """
+        The reservations of the device, followed by the occurrences of its recurring reservations by start.
+        date_range: (from, to) limits the start of the reservations to from <= start < to, None for an
+        open end. Occurrences are only computed within it, without one every series is listed up to its until.
+        """
+        where = {"device_name": device_name}
+        if date_range is not None:
+            where["start"] = Range(*date_range)
+        res = self._table.find_where(where)
+        if include_archive:
+            res = self._combined(res, self._archived(where), None, False)
+        occurrences, _ = self._occurrence_streams(where)
+        return [self._to_reservation(r) for r in chain(res, heapq.merge(*occurrences, key=lambda doc: doc["start"]))]
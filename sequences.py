@@ -0,0 +1,65 @@
+import json
+import os
+from typing import Callable, Optional
+
+from instrumentation import count
+from locks import FileLock
+
+
+class SequenceAllocator:
+    """
+    Persisted id sequences, one per table, stored in a small JSON file of their own.
+    Allocation holds a file lock, so concurrent threads and processes never get the same id.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = FileLock(path + ".lock")
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as handle:
+                count(file_opens=1, bytes_read=os.fstat(handle.fileno()).st_size)
+                return json.load(handle)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, data: dict) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(data, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+            count(file_opens=1, bytes_written=os.fstat(handle.fileno()).st_size)
+        os.replace(tmp_path, self.path)
+
+    def allocate(self, name: str, count: int = 1, seed: Optional[Callable[[], int]] = None) -> int:
+        """
+        Reserve count consecutive ids of the sequence name and return the first one.
+        seed() computes the first id of a sequence that doesn't exist yet (default: 1).
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        with self._lock:
+            data = self._read()
+            start = data.get(name)
+            if start is None:
+                start = seed() if seed is not None else 1
+            data[name] = start + count
+            self._write(data)
+        return start
+
+    def advance(self, name: str, minimum: int, seed: Optional[Callable[[], int]] = None) -> None:
+        """
+        Make sure the sequence name doesn't hand out ids below minimum, e.g. after documents were
+        stored with ids chosen by the caller. Doesn't write if the sequence is already past it.
+        """
+        with self._lock:
+            data = self._read()
+            start = data.get(name)
+            if start is None:
+                start = seed() if seed is not None else 1
+            elif start >= minimum:
+                return
+            data[name] = max(start, minimum)
+            self._write(data)
@@ -25,7 +25,49 @@ class TimeSerializer(Serializer):
         return time.fromisoformat(s)
 
 
-serializer = SerializationMiddleware(JSONStorage)
-serializer.register_serializer(DateTimeSerializer(), 'TinyDateTime')
-serializer.register_serializer(DateSerializer(), 'TinyDate')
-serializer.register_serializer(TimeSerializer(), 'TinyTime')
\ No newline at end of file
+# Registered in this order, datetime has to come before date as it is a subclass of it
+SERIALIZERS = [
+    ('TinyDateTime', DateTimeSerializer()),
+    ('TinyDate', DateSerializer()),
+    ('TinyTime', TimeSerializer()),
+]
+
+
+def make_serializer(storage_cls=JSONStorage) -> SerializationMiddleware:
+    """Create a fresh middleware with the datetime, date and time serializers registered."""
+    # Middlewares keep a reference to the storage they wrap, so every TinyDB handle needs its own instance
+    middleware = SerializationMiddleware(storage_cls)
+    for name, obj_serializer in SERIALIZERS:
+        middleware.register_serializer(obj_serializer, name)
+    return middleware
+
+
+def encode_value(value):
+    """Encode a single document (or value) the same way the serialization middleware does."""
+    if isinstance(value, dict):
+        return {k: encode_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(v) for v in value]
+    for name, obj_serializer in SERIALIZERS:
+        if isinstance(value, obj_serializer.OBJ_CLASS):
+            return '{%s}:%s' % (name, obj_serializer.encode(value))
+    return value
+
+
+def decode_value(value):
+    """Reverse of encode_value."""
+    if isinstance(value, str):
+        if value.startswith('{'):
+            for name, obj_serializer in SERIALIZERS:
+                tag = '{%s}:' % name
+                if value.startswith(tag):
+                    return obj_serializer.decode(value[len(tag):])
+        return value
+    if isinstance(value, dict):
+        return {k: decode_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    return value
+
+
+serializer = make_serializer()
\ No newline at end of file
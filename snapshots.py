@@ -0,0 +1,109 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, ClassVar, Dict, Iterable, Iterator, Mapping, Optional
+
+from database import VERSION_FIELD
+from devices import Device, DeviceState
+from users import User
+
+
+@dataclass(frozen=True, slots=True)
+class UserRecord:
+    """Immutable read model of a user, see Snapshot."""
+    table: ClassVar[str] = "users"
+    key_field: ClassVar[str] = "id"
+
+    id: str
+    name: str
+    created_at: Optional[datetime] = None
+    # Version of the stored document, to_entity() passes it on for the conflict check of store_data()
+    version: int = 0
+
+    @classmethod
+    def from_document(cls, doc: Mapping) -> "UserRecord":
+        return cls(doc["id"], doc["name"], doc.get("created_at"), doc.get(VERSION_FIELD, 0))
+
+    def to_entity(self) -> User:
+        """A User to modify and store; store_data() raises ConflictError if it changed since this record."""
+        doc = {"id": self.id, "name": self.name, VERSION_FIELD: self.version}
+        if self.created_at is not None:
+            doc["created_at"] = self.created_at
+        return User._from_stored(doc)
+
+
+@dataclass(frozen=True, slots=True)
+class DeviceRecord:
+    """Immutable read model of a device, see Snapshot."""
+    table: ClassVar[str] = "devices"
+    key_field: ClassVar[str] = "device_name"
+
+    device_name: str
+    managed_by_user_id: str
+    is_active: bool = True
+    state: DeviceState = DeviceState.AVAILABLE
+    created_at: Optional[datetime] = None
+    version: int = 0
+
+    @classmethod
+    def from_document(cls, doc: Mapping) -> "DeviceRecord":
+        return cls(
+            doc["device_name"], doc["managed_by_user_id"], doc.get("is_active", True),
+            DeviceState(doc.get("state", DeviceState.AVAILABLE.value)), doc.get("created_at"),
+            doc.get(VERSION_FIELD, 0),
+        )
+
+    def to_entity(self) -> Device:
+        """A Device to modify and store; store_data() raises ConflictError if it changed since this record."""
+        doc = {
+            "device_name": self.device_name, "managed_by_user_id": self.managed_by_user_id,
+            "is_active": self.is_active, "state": self.state.value, VERSION_FIELD: self.version,
+        }
+        if self.created_at is not None:
+            doc["created_at"] = self.created_at
+        return Device._from_stored(doc)
+
+
+class Snapshot(Sequence):
+    """
+    Immutable view of a table at one point in time: a tuple of frozen records in doc_id order.
+    It can be shared by all reruns, sessions and threads without copying. TableCache.get_snapshot()
+    builds a new snapshot only when the table changed, and that snapshot reuses the record objects
+    of all unchanged documents.
+    Lookups by key, columns and derived values are computed on first use and kept with the snapshot.
+    Concurrent first uses may compute them twice, with the same result.
+    """
+
+    __slots__ = ("table", "key_field", "_rows", "_derived")
+
+    def __init__(self, table: str, key_field: str, records: Iterable) -> None:
+        self.table = table
+        self.key_field = key_field
+        self._rows = tuple(records)
+        self._derived: Dict[Any, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        return self._rows[index]
+
+    def __iter__(self) -> Iterator:
+        return iter(self._rows)
+
+    def derive(self, name: Any, build: Callable[[tuple], Any]) -> Any:
+        """build(records), computed once per snapshot (e.g. the labels of a select box). Must be immutable."""
+        try:
+            return self._derived[name]
+        except KeyError:
+            value = self._derived[name] = build(self._rows)
+            return value
+
+    def get(self, key: Any) -> Optional[Any]:
+        """The record with key (the table's key field), O(1) after the first call."""
+        by_key = self.derive(("by", self.key_field), lambda rows: {getattr(r, self.key_field): r for r in rows})
+        return by_key.get(key)
+
+    def column(self, field: str) -> tuple:
+        """The values of one field, in the order of the records."""
+        return self.derive(("column", field), lambda rows: tuple(getattr(r, field) for r in rows))
@@ -0,0 +1,599 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from tinydb import TinyDB
+from tinydb.table import Document
+from changes import DELETE, PUT, RESET, ChangeFeed
+from instrumentation import count
+from queries import In, Plan, Range
+from serializer import decode_value, encode_value, make_serializer
+from storage import VERSION_FIELD
+
+
+# Real columns per table: (column, type). Fields that aren't listed end up in the JSON column "extra".
+# "datetime" columns are stored as ISO strings with a fixed width, so they sort chronologically.
+SCHEMAS: Dict[str, List[Tuple[str, str]]] = {
+    "users": [("id", "text"), ("name", "text"), ("created_at", "datetime")],
+    "devices": [
+        ("device_name", "text"), ("managed_by_user_id", "text"), ("is_active", "bool"),
+        ("state", "text"), ("created_at", "datetime"),
+    ],
+    "reservations": [
+        ("reservation_id", "text"), ("device_name", "text"), ("user_id", "text"),
+        ("start", "datetime"), ("end", "datetime"), ("note", "text"),
+    ],
+    "maintenances": [
+        ("maintenance_id", "text"), ("device_name", "text"), ("description", "text"), ("cost", "real"),
+        ("performed_at", "datetime"),
+    ],
+    "recurring_reservations": [
+        ("reservation_id", "text"), ("device_name", "text"), ("user_id", "text"),
+        ("start", "datetime"), ("end", "datetime"), ("every", "real"), ("until", "datetime"), ("note", "text"),
+    ],
+    # The per-month aggregates ("months") stay in the JSON column
+    "maintenance_costs": [("device_name", "text"), ("count", "int"), ("total", "real")],
+}
+
+# Indexes on the key and foreign-key fields, created together with the tables
+SCHEMA_INDEXES: Dict[str, List[Tuple[str, ...]]] = {
+    "users": [("id",)],
+    "devices": [("device_name",), ("managed_by_user_id",)],
+    "reservations": [("reservation_id",), ("device_name", "start"), ("device_name", "end"), ("user_id",)],
+    "maintenances": [("maintenance_id",), ("device_name",), ("performed_at",)],
+    "recurring_reservations": [("reservation_id",), ("device_name", "until"), ("user_id",)],
+    "maintenance_costs": [("device_name",)],
+}
+
+SQL_TYPES = {"text": "TEXT", "datetime": "TEXT", "bool": "INTEGER", "int": "INTEGER", "real": "REAL"}
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _to_sql(kind: str, value: Any) -> Any:
+    if value is None:
+        return None
+    if kind == "datetime" and isinstance(value, datetime):
+        return value.isoformat(timespec="microseconds")
+    if kind == "bool":
+        return int(bool(value))
+    return value
+
+
+def _from_sql(kind: str, value: Any) -> Any:
+    if value is None:
+        return None
+    if kind == "datetime":
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            return value
+    if kind == "bool":
+        return bool(value)
+    return value
+
+
+class SQLiteTable:
+    """
+    A table of a SQLiteDatabase, offering the same interface as the TinyDB tables in database.py.
+    Lookups and interval queries are answered by SQL on indexed columns instead of loading the table.
+    """
+
+    def __init__(self, db: "SQLiteDatabase", name: str) -> None:
+        self._db = db
+        self._name = name
+        self._columns = SCHEMAS.get(name, [])
+        self._kinds = dict(self._columns)
+        # Number of searches that had to load the whole table (TinyDB queries can't be translated to SQL)
+        self.scans = 0
+        self._interval_fields: Dict[str, Tuple[str, str]] = {}
+        self._data_version = None
+        self._create()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def _create(self) -> None:
+        columns = "".join(f", {_quote(c)} {SQL_TYPES[kind]}" for c, kind in self._columns)
+        with self._db.lock:
+            self._db.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {_quote(self._name)} "
+                f"(doc_id INTEGER PRIMARY KEY{columns}, extra TEXT NOT NULL DEFAULT '{{}}')"
+            )
+            self._add_missing_columns()
+            for fields in SCHEMA_INDEXES.get(self._name, []):
+                self._create_index(fields)
+            self._db.connection.commit()
+
+    def _add_missing_columns(self) -> None:
+        """
+        Add the columns SCHEMAS gained since the table was created and move their values out of the
+        JSON column, so files written by older versions can use the new indexes.
+        """
+        def missing_columns():
+            rows = self._db.connection.execute(f"PRAGMA table_info({_quote(self._name)})").fetchall()
+            existing = {row["name"] for row in rows}
+            return [(c, kind) for c, kind in self._columns if c not in existing]
+
+        if not missing_columns():
+            return
+        with self._db.transaction():
+            # Checked again under the write lock, another process may have migrated the table meanwhile
+            missing = missing_columns()
+            if not missing:
+                return
+            for c, kind in missing:
+                self._db.connection.execute(f"ALTER TABLE {_quote(self._name)} ADD COLUMN {_quote(c)} {SQL_TYPES[kind]}")
+            assignments = ", ".join([f"{_quote(c)} = ?" for c, _ in self._columns] + ["extra = ?"])
+            for doc in self._select():
+                values, extra = self._to_row(doc)
+                self._db.connection.execute(
+                    f"UPDATE {_quote(self._name)} SET {assignments} WHERE doc_id = ?", values + [extra, doc.doc_id]
+                )
+
+    def _expression(self, field: str) -> str:
+        if field in self._kinds:
+            return _quote(field)
+        # Other fields live in the JSON column, expression indexes make them indexable as well
+        return "json_extract(extra, '$.\"" + field.replace("'", "''").replace('"', '') + "\"')"
+
+    def _create_index(self, fields: Tuple[str, ...]) -> None:
+        name = f"idx_{self._name}_{'_'.join(fields)}"
+        expressions = ", ".join(self._expression(f) for f in fields)
+        self._db.connection.execute(f"CREATE INDEX IF NOT EXISTS {_quote(name)} ON {_quote(self._name)} ({expressions})")
+
+    def _value(self, field: str, value: Any) -> Any:
+        if field in self._kinds:
+            return _to_sql(self._kinds[field], value)
+        return encode_value(value)
+
+    def _to_row(self, document: Mapping) -> Tuple[list, str]:
+        values = [_to_sql(kind, document.get(c)) for c, kind in self._columns]
+        extra = {k: v for k, v in document.items() if k not in self._kinds}
+        return values, json.dumps(encode_value(extra))
+
+    def _to_document(self, row: sqlite3.Row) -> Document:
+        doc = {}
+        for c, kind in self._columns:
+            value = row[c]
+            # Columns a document never had are NULL, don't invent fields for them
+            if value is not None:
+                doc[c] = _from_sql(kind, value)
+        doc.update(decode_value(json.loads(row["extra"])))
+        return Document(doc, row["doc_id"])
+
+    def _select(self, where: str = "", params: tuple = (), order: str = "doc_id",
+                limit: Optional[int] = None, offset: int = 0) -> List[Document]:
+        sql = f"SELECT * FROM {_quote(self._name)}"
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" ORDER BY {order}"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = tuple(params) + (limit, offset)
+        with self._db.lock:
+            rows = self._db.connection.execute(sql, params).fetchall()
+        count(rows_scanned=len(rows))
+        return [self._to_document(row) for row in rows]
+
+    def refresh(self) -> None:
+        """Same as SharedTable.refresh: commits of other connections (processes) are published as a RESET."""
+        with self._db.lock:
+            # data_version changes when another connection committed to the database
+            data_version = self._db.connection.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                if self._data_version is not None:
+                    self._db.changes.publish([(self._name, RESET, None, None)])
+                self._data_version = data_version
+
+    @property
+    def changes(self) -> ChangeFeed:
+        """Feed of the writes to all tables of the database, see changes.py."""
+        return self._db.changes
+
+    # --- Reading -------------------------------------------------------------------------------
+
+    def all(self) -> List[Document]:
+        return self._select()
+
+    def raw_values(self) -> List[Mapping]:
+        return self.all()
+
+    def raw_items(self) -> List[Tuple[int, Mapping]]:
+        return [(doc.doc_id, doc) for doc in self._select()]
+
+    def __iter__(self) -> Iterator[Document]:
+        return iter(self.all())
+
+    def __len__(self) -> int:
+        with self._db.lock:
+            return self._db.connection.execute(f"SELECT COUNT(*) FROM {_quote(self._name)}").fetchone()[0]
+
+    def get(self, cond=None, doc_id: Optional[int] = None, doc_ids: Optional[list] = None):
+        if doc_id is not None:
+            docs = self._select("doc_id = ?", (doc_id,))
+            return docs[0] if docs else None
+        if doc_ids is not None:
+            return self._select(f"doc_id IN ({','.join('?' * len(doc_ids))})", tuple(doc_ids))
+        if cond is not None:
+            docs = self.search(cond)
+            return docs[0] if docs else None
+        raise RuntimeError('You have to pass either cond or doc_id or doc_ids')
+
+    def search(self, cond) -> List[Document]:
+        self.scans += 1
+        return [doc for doc in self.all() if cond(doc)]
+
+    def lookup(self, field: str, value) -> List[Document]:
+        """Return all documents with document[field] == value."""
+        return self._select(f"{self._expression(field)} = ?", (self._value(field, value),))
+
+    def count_lookup(self, field: str, value) -> int:
+        """Number of documents lookup(field, value) returns, counted on the index of field."""
+        with self._db.lock:
+            return self._db.connection.execute(
+                f"SELECT COUNT(*) FROM {_quote(self._name)} WHERE {self._expression(field)} = ?",
+                (self._value(field, value),),
+            ).fetchone()[0]
+
+    def find_overlapping(self, group_field: str, group_value, start, end) -> List[Document]:
+        """Documents of group_value whose interval overlaps [start, end), ordered by start."""
+        start_field, end_field = self._interval_fields[group_field]
+        return self._select(
+            f"{self._expression(group_field)} = ? AND {self._expression(start_field)} < ? "
+            f"AND {self._expression(end_field)} > ?",
+            (self._value(group_field, group_value), self._value(start_field, end), self._value(end_field, start)),
+            order=self._expression(start_field),
+        )
+
+    def find_covering(self, group_field: str, group_value, at) -> List[Document]:
+        """Documents of group_value whose interval contains the point in time at."""
+        start_field, end_field = self._interval_fields[group_field]
+        return self._select(
+            f"{self._expression(group_field)} = ? AND {self._expression(start_field)} <= ? "
+            f"AND {self._expression(end_field)} > ?",
+            (self._value(group_field, group_value), self._value(start_field, at), self._value(end_field, at)),
+            order=self._expression(start_field),
+        )
+
+    def longest_interval(self, group_field: str) -> Any:
+        """Upper bound for end - start of the documents of the interval index of group_field (None if empty)."""
+        start_field, end_field = self._interval_fields[group_field]
+        start, end = self._expression(start_field), self._expression(end_field)
+        datetimes = self._kinds.get(start_field) == "datetime"
+        length = f"julianday({end}) - julianday({start})" if datetimes else f"{end} - {start}"
+        with self._db.lock:
+            longest = self._db.connection.execute(f"SELECT MAX({length}) FROM {_quote(self._name)}").fetchone()[0]
+        if longest is None or not datetimes:
+            return longest
+        # julianday is a float of days, round up generously to stay an upper bound
+        return timedelta(days=longest, seconds=1)
+
+    def iter_documents(self, chunk_size: int = 256) -> Iterator[Document]:
+        """Same as SharedTable.iter_documents, reading chunks by keyset pagination on doc_id."""
+        after = 0
+        while True:
+            docs = self._select("doc_id > ?", (after,), limit=chunk_size)
+            if not docs:
+                return
+            yield from docs
+            after = docs[-1].doc_id
+
+    def iter_sorted(self, field: str, lo: Any = None, hi: Any = None, chunk_size: int = 256) -> Iterator[Document]:
+        """Same as SharedTable.iter_sorted, reading chunks by keyset pagination on the index of field."""
+        column = self._expression(field)
+        conditions, params = [f"{column} IS NOT NULL"], []
+        if lo is not None:
+            conditions.append(f"{column} >= ?")
+            params.append(self._value(field, lo))
+        if hi is not None:
+            conditions.append(f"{column} < ?")
+            params.append(self._value(field, hi))
+        after = ()
+        while True:
+            where = " AND ".join(conditions)
+            if after:
+                where += f" AND ({column} > ? OR ({column} = ? AND doc_id > ?))"
+            docs = self._select(where, tuple(params) + after, order=f"{column}, doc_id", limit=chunk_size)
+            if not docs:
+                return
+            yield from docs
+            value = self._value(field, docs[-1][field])
+            after = (value, value, docs[-1].doc_id)
+
+    def find_page(self, offset: int = 0, limit: int = 20, order_by: Optional[str] = None,
+                  descending: bool = False, filters: Optional[Mapping[str, Any]] = None,
+                  value_range: Optional[Tuple[Any, Any]] = None):
+        """Same as SharedTable.find_page, answered by LIMIT/OFFSET on an index of order_by."""
+        # database.py imports this module, so Page can only be imported here
+        from database import Page
+
+        conditions, params = [], []
+        for field, value in (filters or {}).items():
+            conditions.append(f"{self._expression(field)} = ?")
+            params.append(self._value(field, value))
+        direction = "DESC" if descending else "ASC"
+        order = f"doc_id {direction}"
+        if order_by is not None:
+            column = self._expression(order_by)
+            conditions.append(f"{column} IS NOT NULL")
+            lo, hi = value_range if value_range is not None else (None, None)
+            if lo is not None:
+                conditions.append(f"{column} >= ?")
+                params.append(self._value(order_by, lo))
+            if hi is not None:
+                conditions.append(f"{column} < ?")
+                params.append(self._value(order_by, hi))
+            order = f"{column} {direction}, {order}"
+        elif value_range is not None:
+            raise ValueError("value_range needs order_by")
+        where = " AND ".join(conditions) or "1"
+        with self._db.lock:
+            total = self._db.connection.execute(
+                f"SELECT COUNT(*) FROM {_quote(self._name)} WHERE {where}", tuple(params)
+            ).fetchone()[0]
+        items = self._select(where, tuple(params), order=order, limit=limit, offset=offset)
+        return Page(items, total, offset, limit)
+
+    def _where_sql(self, where: Mapping[str, Any], order_by: Optional[str], descending: bool) -> Tuple[str, tuple, str]:
+        conditions, params = [], []
+        for field, condition in where.items():
+            column = self._expression(field)
+            if isinstance(condition, In):
+                if not condition.values:
+                    conditions.append("0")
+                    continue
+                conditions.append(f"{column} IN ({','.join('?' * len(condition.values))})")
+                params.extend(self._value(field, value) for value in condition.values)
+            elif isinstance(condition, Range):
+                conditions.append(f"{column} IS NOT NULL")
+                if condition.lo is not None:
+                    conditions.append(f"{column} >= ?")
+                    params.append(self._value(field, condition.lo))
+                if condition.hi is not None:
+                    conditions.append(f"{column} < ?")
+                    params.append(self._value(field, condition.hi))
+            else:
+                conditions.append(f"{column} = ?")
+                params.append(self._value(field, condition))
+        direction = "DESC" if descending else "ASC"
+        order = f"doc_id {direction}"
+        if order_by is not None:
+            column = self._expression(order_by)
+            conditions.append(f"{column} IS NOT NULL")
+            order = f"{column} {direction}, {order}"
+        return " AND ".join(conditions) or "1", tuple(params), order
+
+    def find_where(self, where: Mapping[str, Any], order_by: Optional[str] = None, descending: bool = False,
+                   limit: Optional[int] = None) -> List[Document]:
+        """Same as SharedTable.find_where, translated to one SQL query."""
+        sql_where, params, order = self._where_sql(where, order_by, descending)
+        return self._select(sql_where, params, order=order, limit=limit)
+
+    def explain_where(self, where: Mapping[str, Any], order_by: Optional[str] = None,
+                      descending: bool = False) -> Plan:
+        """The Plan of find_where(): SQLite's own query plan, strategy "sql" (or "scan" if it uses no index)."""
+        sql_where, params, order = self._where_sql(where, order_by, descending)
+        with self._db.lock:
+            rows = self._db.connection.execute(
+                f"EXPLAIN QUERY PLAN SELECT * FROM {_quote(self._name)} WHERE {sql_where} ORDER BY {order}", params
+            ).fetchall()
+        detail = "; ".join(row[-1] for row in rows)
+        index = next((word for word in detail.split() if word.startswith("idx_")), None)
+        return Plan("sql" if index is not None else "scan", index, None, "TEMP B-TREE" not in detail, detail)
+
+    # --- Indexes -------------------------------------------------------------------------------
+
+    def ensure_index(self, field: str) -> None:
+        with self._db.lock:
+            self._create_index((field,))
+            self._db.connection.commit()
+
+    def ensure_sorted_index(self, field: str) -> None:
+        # A B-tree index is ordered anyway
+        self.ensure_index(field)
+
+    def ensure_interval_index(self, group_field: str, start_field: str, end_field: str) -> None:
+        with self._db.lock:
+            self._create_index((group_field, start_field))
+            self._create_index((group_field, end_field))
+            self._db.connection.commit()
+        self._interval_fields[group_field] = (start_field, end_field)
+
+    def index_stats(self) -> Dict[str, Dict[str, int]]:
+        # SQLite picks its indexes itself, there is nothing to count here
+        return {}
+
+    # --- Writing -------------------------------------------------------------------------------
+
+    def locked(self):
+        """
+        Same as SharedTable.locked. SQLite locks the whole database for writing, so this is a write
+        transaction (committed at the end of the block, rolled back on an exception).
+        """
+        return self._db.transaction()
+
+    def _insert_row(self, document: Mapping, doc_id: Optional[int] = None) -> int:
+        document = dict(document)
+        document[VERSION_FIELD] = document.get(VERSION_FIELD, 0) + 1
+        values, extra = self._to_row(document)
+        columns = ", ".join(["doc_id"] + [_quote(c) for c, _ in self._columns] + ["extra"])
+        placeholders = ", ".join("?" * (len(values) + 2))
+        cursor = self._db.connection.execute(
+            f"INSERT INTO {_quote(self._name)} ({columns}) VALUES ({placeholders})", [doc_id] + values + [extra]
+        )
+        self._db.pending_changes.append((self._name, PUT, cursor.lastrowid, document))
+        return cursor.lastrowid
+
+    def _replace_row(self, doc_id: int, document: Mapping) -> None:
+        document = dict(document)
+        document[VERSION_FIELD] = document.get(VERSION_FIELD, 0) + 1
+        values, extra = self._to_row(document)
+        assignments = ", ".join([f"{_quote(c)} = ?" for c, _ in self._columns] + ["extra = ?"])
+        self._db.connection.execute(
+            f"UPDATE {_quote(self._name)} SET {assignments} WHERE doc_id = ?", values + [extra, doc_id]
+        )
+        self._db.pending_changes.append((self._name, PUT, doc_id, document))
+
+    def insert(self, document: Mapping) -> int:
+        with self._db.transaction():
+            doc_id = getattr(document, "doc_id", None) if isinstance(document, Document) else None
+            doc_id = self._insert_row(document, doc_id)
+        return doc_id
+
+    def insert_multiple(self, documents) -> List[int]:
+        with self._db.transaction():
+            doc_ids = [self._insert_row(document) for document in documents]
+        return doc_ids
+
+    def write_many(self, documents: List[Tuple[Optional[int], Mapping]]) -> List[int]:
+        """Insert (doc_id None) or update several documents in a single transaction."""
+        doc_ids = []
+        with self._db.transaction():
+            for doc_id, document in documents:
+                if doc_id is None:
+                    doc_id = self._insert_row(document)
+                else:
+                    current = self.get(doc_id=doc_id)
+                    current.update(document)
+                    self._replace_row(doc_id, current)
+                doc_ids.append(doc_id)
+        return doc_ids
+
+    def update(self, fields, cond=None, doc_ids: Optional[list] = None) -> List[int]:
+        with self._db.transaction():
+            if doc_ids is not None:
+                docs = self.get(doc_ids=doc_ids)
+            elif cond is not None:
+                docs = self.search(cond)
+            else:
+                docs = self.all()
+            for doc in docs:
+                if callable(fields):
+                    fields(doc)
+                else:
+                    doc.update(fields)
+                self._replace_row(doc.doc_id, doc)
+        return [doc.doc_id for doc in docs]
+
+    def remove(self, cond=None, doc_ids: Optional[list] = None) -> List[int]:
+        if doc_ids is None:
+            if cond is None:
+                raise RuntimeError('Use truncate() to remove all documents')
+            doc_ids = [doc.doc_id for doc in self.search(cond)]
+        with self._db.transaction():
+            self._db.connection.executemany(
+                f"DELETE FROM {_quote(self._name)} WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids]
+            )
+            self._db.pending_changes.extend((self._name, DELETE, doc_id, None) for doc_id in doc_ids)
+        return list(doc_ids)
+
+    def truncate(self) -> None:
+        with self._db.transaction():
+            self._db.connection.execute(f"DELETE FROM {_quote(self._name)}")
+            self._db.pending_changes.append((self._name, RESET, None, None))
+
+    def clear_cache(self) -> None:
+        pass
+
+
+class SQLiteDatabase:
+    """Stands in for the TinyDB handle when DatabaseConnector is configured with storage="sqlite"."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # One connection shared by all threads, serialized by the lock
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Nesting depth of transaction()
+        self._depth = 0
+        self._tables: Dict[str, SQLiteTable] = {}
+        self.changes = ChangeFeed()
+        # Changes of the open transaction, published when it commits
+        self.pending_changes: List[tuple] = []
+
+    @contextmanager
+    def transaction(self):
+        """
+        Write transaction, nested blocks join the outermost one. BEGIN IMMEDIATE takes the database's
+        write lock right away, so other processes wait instead of failing when they commit.
+        """
+        with self.lock:
+            if self._depth == 0:
+                self.connection.execute("BEGIN IMMEDIATE")
+            self._depth += 1
+            try:
+                yield
+            except BaseException:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.connection.rollback()
+                    self.pending_changes = []
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.connection.commit()
+                pending, self.pending_changes = self.pending_changes, []
+                self.changes.publish(pending)
+
+    def table(self, name: str) -> SQLiteTable:
+        with self.lock:
+            if name not in self._tables:
+                self._tables[name] = SQLiteTable(self, name)
+            return self._tables[name]
+
+    def tables(self) -> set:
+        with self.lock:
+            rows = self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        return {row["name"] for row in rows}
+
+    def flush(self) -> None:
+        with self.lock:
+            # Inside transaction() the commit is up to its outermost block
+            if self._depth == 0:
+                self.connection.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+
+def migrate_json_to_sqlite(json_path: str, sqlite_path: str) -> Dict[str, int]:
+    """
+    Copy all tables of a TinyDB JSON database into a SQLite database, keeping the document ids.
+    Returns the number of migrated documents per table.
+    """
+    source = TinyDB(json_path, storage=make_serializer(), access_mode="r")
+    target = SQLiteDatabase(sqlite_path)
+    counts = {}
+    try:
+        for name in source.tables():
+            table = target.table(name)
+            with target.lock, target.connection:
+                for doc in source.table(name).all():
+                    table._insert_row(doc, doc.doc_id)
+            counts[name] = len(source.table(name))
+    finally:
+        source.close()
+        target.close()
+    return counts
+
+
+if __name__ == "__main__":
+    # Usage: python sqlite_store.py [database.json] [database.sqlite]
+    here = os.path.dirname(os.path.abspath(__file__))
+    json_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, "database.json")
+    sqlite_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(json_path)[0] + ".sqlite"
+    for table_name, n in migrate_json_to_sqlite(json_path, sqlite_path).items():
+        print(f"{table_name}: {n} documents")
@@ -0,0 +1,466 @@
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Dict, Optional
+
+from tinydb.middlewares import Middleware
+from tinydb.storages import Storage, touch
+from changes import RESET, ChangeFeed
+from instrumentation import count, operation
+from locks import FileLock
+from serializer import decode_value, encode_value
+
+
+#: Field holding the version stamp of a stored document, incremented by every write of the document
+VERSION_FIELD = "_version"
+
+
+def stamp(path: str) -> None:
+    """
+    Give a just written file a modification time of its own. File times are only updated once per
+    clock tick, two writes of the same size within one tick would look unchanged to other processes.
+    """
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+class WriteBehindMiddleware(Middleware):
+    """
+    Keeps the decoded database in memory and writes it back to the wrapped storage lazily.
+
+    - flush_every: write to disk after this many changes (1 = write-through)
+    - flush_interval_ms: write pending changes to disk at the latest after this many milliseconds
+    - multiprocess: other processes use the same files. Writers hold the file lock of table_lock()
+      and every change is written through; reloads hold the lock as well, so they never see a half
+      written file.
+
+    Reads are answered from memory. As long as there are no pending changes, the cache
+    is reloaded when the file on disk was changed by someone else.
+
+    changes is the ChangeFeed of the handle: the tables publish their writes there, a reload
+    publishes a RESET of all tables.
+    """
+
+    def __init__(self, storage_cls, flush_every: int = 1, flush_interval_ms: Optional[int] = None,
+                 multiprocess: bool = False):
+        super().__init__(storage_cls)
+        self.multiprocess = multiprocess
+        # Batching would keep changes from the other processes
+        self.flush_every = 1 if multiprocess else max(1, flush_every)
+        self.flush_interval_ms = None if multiprocess else flush_interval_ms
+        # Reentrant, because tables hold it around a whole read-modify-write cycle
+        self.lock = threading.RLock()
+        self._path = None
+        self._cache = None
+        self._loaded = False
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._file_signature = None
+        self._timer = None
+        # Incremented whenever the data is (re-)loaded from disk, so derived structures know to rebuild
+        self.generation = 0
+        self.changes = ChangeFeed()
+
+    def __call__(self, *args, **kwargs):
+        # The first positional argument of the file based storages is the path
+        self._path = args[0] if args else kwargs.get("path")
+        return super().__call__(*args, **kwargs)
+
+    def _signature(self):
+        signature = getattr(self.storage, "signature", None)
+        if signature is not None:
+            return signature()
+        if self._path is None:
+            return None
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _loaded_signature(self):
+        # Storages locking per table know best which state they hold: the signature right after a write
+        # may already include another process's change to a table that was never read
+        loaded_signature = getattr(self.storage, "loaded_signature", None)
+        if loaded_signature is not None:
+            return loaded_signature()
+        return self._signature()
+
+    def lock_path(self, table: Optional[str] = None) -> Optional[str]:
+        """
+        Lock file guarding table (None: guarding reads of the whole database, None if reads need no lock).
+        Storages that keep tables in files of their own decide themselves, otherwise the database file is locked.
+        """
+        lock_path = getattr(self.storage, "lock_path", None)
+        if lock_path is not None:
+            return lock_path(table)
+        return self._path + ".lock" if self._path is not None else None
+
+    def table_lock(self, table: str):
+        """Cross-process lock for writing table, a no-op unless multiprocess is set."""
+        path = self.lock_path(table) if self.multiprocess else None
+        return FileLock(path) if path is not None else nullcontext()
+
+    def read(self):
+        with self.lock:
+            if self._loaded and self._pending == 0 and self._signature() != self._file_signature:
+                # Changed on disk behind our back (e.g. another process)
+                self._loaded = False
+            if not self._loaded:
+                path = self.lock_path() if self.multiprocess else None
+                with FileLock(path) if path is not None else nullcontext(), operation("storage.read"):
+                    self._cache = self.storage.read()
+                    self._file_signature = self._loaded_signature()
+                    self._count_plain_file(bytes_read=True)
+                self._loaded = True
+                if self.generation:
+                    # Someone else changed the file, which documents changed is unknown
+                    self.changes.publish([(None, RESET, None, None)])
+                self.generation += 1
+            return self._cache
+
+    def write(self, data):
+        with self.lock:
+            self._cache = data
+            self._loaded = True
+            self._pending += 1
+            interval_elapsed = (
+                self.flush_interval_ms is not None
+                and (time.monotonic() - self._last_flush) * 1000 >= self.flush_interval_ms
+            )
+            if self._pending >= self.flush_every or interval_elapsed:
+                self.flush()
+            elif self.flush_interval_ms is not None and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval_ms / 1000, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self) -> None:
+        """Write all pending changes to the wrapped storage."""
+        with self.lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._pending > 0:
+                with operation("storage.write"):
+                    self.storage.write(self._cache)
+                    if getattr(self.storage, "signature", None) is None and self._path is not None:
+                        stamp(self._path)
+                    self._pending = 0
+                    self._file_signature = self._loaded_signature()
+                    self._count_plain_file(bytes_read=False)
+            self._last_flush = time.monotonic()
+
+    def _count_plain_file(self, bytes_read: bool) -> None:
+        # The storages of this module count their file accesses themselves. TinyDB's JSON storage
+        # keeps its file open and always reads or writes all of it, the file size is in the signature.
+        if getattr(self.storage, "signature", None) is None and self._file_signature is not None:
+            count(**{"bytes_read" if bytes_read else "bytes_written": self._file_signature[1]})
+
+    def close(self) -> None:
+        self.flush()
+        self.storage.close()
+
+
+class JournalStorage(Storage):
+    """
+    Append-only storage: every write appends the changed documents to a log (<path>.log) instead of
+    rewriting the whole file. The snapshot at <path> has the same format as the JSON storage.
+
+    On open the snapshot is loaded and the log is replayed. Once the log holds more than
+    COMPACT_AFTER records, a background thread folds it into a new snapshot.
+    A torn record at the end of the log (crash mid-append) is ignored and cut off.
+    Several processes may share the files as long as they write under the lock of lock_path().
+    """
+
+    #: The number of log records after which the log is compacted into the snapshot
+    COMPACT_AFTER = 1000
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self.log_path = path + ".log"
+        self._lock = threading.Lock()
+        # table -> ids of the documents changed since the last write, reported by the tables
+        self._dirty: Dict[str, set] = {}
+        self._tables = set()
+        self._records = 0
+        self._compactor = None
+        touch(self.path, create_dirs=False)
+        touch(self.log_path, create_dirs=False)
+        self._log = open(self.log_path, "a", encoding="utf-8")
+
+    def signature(self):
+        stats = []
+        for path in (self.path, self.log_path):
+            try:
+                stat = os.stat(path)
+                stats.append((stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stats.append(None)
+        return tuple(stats)
+
+    def lock_path(self, table: Optional[str] = None) -> str:
+        # Snapshot and log are shared by all tables
+        return self.path + ".lock"
+
+    def mark_dirty(self, table: str, doc_ids) -> None:
+        """Called by the tables before writing, so only the changed documents are appended."""
+        with self._lock:
+            self._dirty.setdefault(table, set()).update(doc_ids)
+
+    def read(self):
+        with self._lock:
+            data, records, good_offset, size = self._load()
+            if good_offset < size:
+                # Torn final record --> cut it off, so the next append starts on a clean line
+                self._log.close()
+                with open(self.log_path, "r+", encoding="utf-8") as handle:
+                    handle.truncate(good_offset)
+                self._log = open(self.log_path, "a", encoding="utf-8")
+                count(file_opens=2)
+            self._records = records
+            self._tables = set(data)
+            self._dirty.clear()
+        if not data:
+            return None
+        return {table: {doc_id: decode_value(doc) for doc_id, doc in docs.items()} for table, docs in data.items()}
+
+    def _load(self, log_end: Optional[int] = None):
+        """Load the encoded snapshot and replay the log (up to log_end)."""
+        with open(self.path, encoding="utf-8") as handle:
+            content = handle.read()
+            snapshot_size = os.fstat(handle.fileno()).st_size
+        data = json.loads(content) if content.strip() else {}
+
+        with open(self.log_path, "rb") as handle:
+            raw = handle.read() if log_end is None else handle.read(log_end)
+        count(file_opens=2, bytes_read=snapshot_size + len(raw))
+        # Every complete record ends with a newline, whatever follows the last one was torn by a crash
+        complete = raw.split(b"\n")[:-1]
+        records = 0
+        good_offset = 0
+        for i, line in enumerate(complete):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if i == len(complete) - 1:
+                    break
+                raise ValueError(f"Corrupt record in {self.log_path} at byte {good_offset}")
+            self._apply(data, record)
+            records += 1
+            good_offset += len(line) + 1
+        return data, records, good_offset, len(raw)
+
+    @staticmethod
+    def _apply(data: dict, record: dict) -> None:
+        op = record["op"]
+        if op == "put":
+            data.setdefault(record["table"], {})[record["id"]] = record["doc"]
+        elif op == "del":
+            data.get(record["table"], {}).pop(record["id"], None)
+        elif op == "drop":
+            data.pop(record["table"], None)
+        elif op == "full":
+            data.clear()
+            data.update(record["data"])
+
+    def write(self, data) -> None:
+        with self._lock:
+            records = []
+            if self._dirty:
+                for table, doc_ids in self._dirty.items():
+                    docs = data.get(table, {})
+                    for doc_id in doc_ids:
+                        doc = docs.get(str(doc_id))
+                        if doc is None:
+                            records.append({"op": "del", "table": table, "id": str(doc_id)})
+                        else:
+                            records.append({"op": "put", "table": table, "id": str(doc_id), "doc": encode_value(doc)})
+                for table in self._tables - set(data):
+                    records.append({"op": "drop", "table": table})
+            else:
+                # Change not reported by a table (e.g. drop_tables) --> log the complete state
+                records.append({"op": "full", "data": encode_value(data)})
+            self._dirty.clear()
+            self._tables = set(data)
+
+            if os.fstat(self._log.fileno()).st_ino != os.stat(self.log_path).st_ino:
+                # Another process compacted and replaced the log
+                self._log.close()
+                self._log = open(self.log_path, "a", encoding="utf-8")
+                count(file_opens=1)
+            # json.dumps escapes non-ASCII characters, the length is the number of bytes
+            payload = "".join(json.dumps(record) + "\n" for record in records)
+            self._log.write(payload)
+            count(bytes_written=len(payload))
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._records += len(records)
+
+            if self._records > self.COMPACT_AFTER and self._compactor is None:
+                self._compactor = threading.Thread(target=self.compact, daemon=True)
+                self._compactor.start()
+
+    def compact(self) -> None:
+        """Fold the log into a new snapshot. Appends can continue while the snapshot is written."""
+        with self._lock:
+            self._log.flush()
+            log_end = os.path.getsize(self.log_path)
+            log_inode = os.stat(self.log_path).st_ino
+        # Per process, several processes may compact at the same time
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            # Another process may be appending, the snapshot ends with the last complete record
+            data, _, log_end, _ = self._load(log_end)
+            with open(tmp_path, "w", encoding="utf-8") as handle:
+                json.dump(data, handle)
+                handle.flush()
+                os.fsync(handle.fileno())
+                count(file_opens=1, bytes_written=os.fstat(handle.fileno()).st_size)
+
+            with FileLock(self.lock_path()), self._lock:
+                if os.stat(self.log_path).st_ino != log_inode:
+                    # Another process compacted in the meantime, its snapshot already has our records
+                    os.remove(tmp_path)
+                    return
+                # Records appended while the snapshot was written stay in the log
+                with open(self.log_path, "rb") as handle:
+                    handle.seek(log_end)
+                    tail = handle.read()
+                with open(self.log_path + ".tmp", "wb") as handle:
+                    handle.write(tail)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                # A crash between the two renames replays records already in the snapshot, which is harmless
+                os.replace(tmp_path, self.path)
+                self._log.close()
+                os.replace(self.log_path + ".tmp", self.log_path)
+                self._log = open(self.log_path, "a", encoding="utf-8")
+                self._records = tail.count(b"\n")
+                count(file_opens=3, bytes_read=len(tail), bytes_written=len(tail))
+        finally:
+            self._compactor = None
+
+    def close(self) -> None:
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        # Leave a plain snapshot behind, so the file can be opened with the JSON storage as well
+        if self._records:
+            self.compact()
+        self._log.close()
+
+
+class ShardedJSONStorage(Storage):
+    """
+    Stores every table in its own JSON file (<path without extension>_tables/<table>.json),
+    so a write only re-encodes and rewrites the tables that changed.
+    An existing single-file database at <path> is split up on first use and kept as <path>.bak.
+    Every table has a lock file of its own, so processes writing different tables don't wait for each other.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self.directory = os.path.splitext(path)[0] + "_tables"
+        self._lock = threading.Lock()
+        self._dirty = set()
+        # table -> (file signature, decoded table) as last read or written
+        self._shards: Dict[str, tuple] = {}
+        if not os.path.isdir(self.directory):
+            self._migrate()
+
+    def _migrate(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.path.exists(self.path) or not os.path.getsize(self.path):
+            return
+        with open(self.path, encoding="utf-8") as handle:
+            data = json.load(handle)
+        count(file_opens=1, bytes_read=os.path.getsize(self.path))
+        # The single file is already encoded, the tables can be copied as they are
+        for table, docs in data.items():
+            self._write_file(table, docs)
+        os.replace(self.path, self.path + ".bak")
+
+    def _file(self, table: str) -> str:
+        return os.path.join(self.directory, table + ".json")
+
+    def _write_file(self, table: str, encoded: dict) -> None:
+        tmp_path = f"{self._file(table)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(encoded, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+            count(file_opens=1, bytes_written=os.fstat(handle.fileno()).st_size)
+        stamp(tmp_path)
+        os.replace(tmp_path, self._file(table))
+
+    def lock_path(self, table: Optional[str] = None) -> Optional[str]:
+        # Files are replaced atomically, reading them needs no lock
+        if table is None:
+            return None
+        return os.path.join(self.directory, table + ".lock")
+
+    @staticmethod
+    def _file_signature(path: str):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _table_files(self) -> Dict[str, str]:
+        return {
+            name[:-len(".json")]: os.path.join(self.directory, name)
+            for name in os.listdir(self.directory) if name.endswith(".json")
+        }
+
+    def signature(self):
+        return tuple(sorted((table, self._file_signature(path)) for table, path in self._table_files().items()))
+
+    def loaded_signature(self):
+        """signature() of the table files as last read or written by this process."""
+        with self._lock:
+            return tuple(sorted((table, cached[0]) for table, cached in self._shards.items()))
+
+    def mark_dirty(self, table: str, doc_ids) -> None:
+        with self._lock:
+            self._dirty.add(table)
+
+    def read(self):
+        with self._lock:
+            data = {}
+            for table, path in self._table_files().items():
+                signature = self._file_signature(path)
+                cached = self._shards.get(table)
+                if cached is not None and cached[0] == signature:
+                    # Unchanged since we last read or wrote it
+                    data[table] = cached[1]
+                    continue
+                with open(path, encoding="utf-8") as handle:
+                    docs = json.load(handle)
+                count(file_opens=1, bytes_read=signature[1])
+                data[table] = {doc_id: decode_value(doc) for doc_id, doc in docs.items()}
+                self._shards[table] = (signature, data[table])
+            for table in set(self._shards) - set(data):
+                del self._shards[table]
+            self._dirty.clear()
+        return data or None
+
+    def write(self, data) -> None:
+        with self._lock:
+            # Without hints from the tables (e.g. drop_tables) every table is written
+            changed = self._dirty & set(data) if self._dirty else set(data)
+            for table in changed:
+                self._write_file(table, encode_value(data[table]))
+                self._shards[table] = (self._file_signature(self._file(table)), data[table])
+            for table in set(self._shards) - set(data):
+                os.remove(self._file(table))
+                del self._shards[table]
+            for table in set(data) - changed:
+                if table in self._shards:
+                    self._shards[table] = (self._shards[table][0], data[table])
+            self._dirty.clear()
+
+    def close(self) -> None:
+        pass
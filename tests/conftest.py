@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseConnector  # noqa: E402
+
+STORAGES = ["json", "journal", "sharded", "sqlite"]
+
+
+@pytest.fixture(params=STORAGES)
+def storage(request, tmp_path):
+    """A fresh database in tmp_path for every storage backend, closed again after the test."""
+    DatabaseConnector().configure(path=str(tmp_path / "database.json"), storage=request.param)
+    yield request.param
+    DatabaseConnector().close()
+
+
+@pytest.fixture
+def json_storage(tmp_path):
+    """A fresh database in tmp_path with the default JSON storage."""
+    DatabaseConnector().configure(path=str(tmp_path / "database.json"), storage="json")
+    yield "json"
+    DatabaseConnector().close()
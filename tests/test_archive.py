@@ -0,0 +1,89 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import DatabaseConnector
+from devices import Device
+from queries import Range
+from reservations import Reservation, ReservationManager
+from users import User
+
+BASE = datetime(2025, 1, 1)
+CUTOFF = datetime(2025, 3, 1)
+
+
+@pytest.fixture
+def manager(storage):
+    User.store_many([User("u1", "n"), User("u2", "n")])
+    Device.store_many([Device("d1", "u1"), Device("d2", "u1")])
+    manager = ReservationManager()
+    # Ten days apart from January to April, alternating devices
+    manager.create_many([
+        Reservation(None, f"d{1 + i % 2}", f"u{1 + i % 2}", BASE + timedelta(days=10 * i), BASE + timedelta(days=10 * i, hours=2))
+        for i in range(12)
+    ])
+    return manager
+
+
+def _ids(reservations):
+    return [r.reservation_id for r in reservations]
+
+
+def test_archive_moves_finished_reservations_by_month(manager):
+    assert manager.archive(CUTOFF) == 6
+    assert manager.archive_size() == 6
+    assert _ids(manager.find_all()) == [str(i) for i in range(7, 13)]
+    assert _ids(manager.find_all(include_archive=True)) == [str(i) for i in range(1, 13)]
+    # Nothing left to archive
+    assert manager.archive(CUTOFF) == 0
+
+
+def test_reads_combine_archive_and_table(manager):
+    manager.archive(CUTOFF)
+    page = manager.find_page(4, 4, include_archive=True)
+    assert (page.total, _ids(page.items)) == (12, ["5", "6", "7", "8"])
+    assert _ids(manager.find_page(0, 4).items) == ["7", "8", "9", "10"]
+    where = {"device_name": "d1", "start": Range(BASE + timedelta(days=15), BASE + timedelta(days=75))}
+    assert _ids(manager.find_where(where, order_by="start", include_archive=True)) == ["3", "5", "7"]
+    assert _ids(manager.find_by_device("d2", include_archive=True)) == ["2", "4", "6", "8", "10", "12"]
+    # Time-based checks reach into the archive for past time ranges
+    archived_start = BASE + timedelta(days=20)
+    assert not manager.is_available("d1", archived_start, archived_start + timedelta(hours=1))
+    assert manager.current_reservation("d1", archived_start + timedelta(hours=1)).reservation_id == "3"
+    assert _ids(manager.reservations_between("d1", BASE, BASE + timedelta(days=30))) == ["1", "3"]
+
+
+def test_delete_archived_reservation(manager):
+    manager.archive(CUTOFF)
+    assert manager.delete_by_id("3")
+    assert not manager.delete_by_id("3")
+    assert manager.archive_size() == 5
+    assert "3" not in _ids(manager.find_all(include_archive=True))
+
+
+def test_archived_ids_are_not_reused(manager):
+    manager.archive(CUTOFF)
+    later = BASE + timedelta(days=200)
+    result = manager.create_many([Reservation("2", "d1", "u1", later, later + timedelta(hours=1))])[0]
+    assert not result.accepted and "already taken" in result.reason
+    # Even if the sequence is lost and seeded from the (smaller) table again
+    sequences = DatabaseConnector().path.rsplit(".", 1)[0] + "_sequences.json"
+    with open(sequences, "w", encoding="utf-8") as handle:
+        handle.write('{"reservations": 1}')
+    new = Reservation(None, "d1", "u1", later, later + timedelta(hours=1))
+    assert manager.create(new)
+    assert new.reservation_id == "13"
+    ids = _ids(manager.find_all(include_archive=True))
+    assert len(ids) == len(set(ids)) == 13
+
+
+def test_start_archiving_runs_in_background(manager):
+    thread = manager.start_archiving(interval_s=3600)
+    assert manager.start_archiving() is thread
+    deadline = time.monotonic() + 10
+    # All reservations are in 2025, so they all ended before the current month
+    while manager.archive_size() < 12 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert manager.archive_size() == 12
+    assert manager.find_all() == []
@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from database import ConflictError
+from users import User
+
+
+def test_astore_data_rejects_stale_copy_in_same_batch(storage):
+    User("u1", "Alice").store_data()
+    a = User.find_by_attribute("id", "u1")
+    b = User.find_by_attribute("id", "u1")
+    a.name = "Bob"
+    b.name = "Carol"
+
+    async def store_both():
+        return await asyncio.gather(a.astore_data(), b.astore_data(), return_exceptions=True)
+
+    coalescer = User._store_coalescer()
+    batches = coalescer.batches
+    first, second = asyncio.run(store_both())
+    # Both were written by one store_many() call
+    assert coalescer.batches == batches + 1
+    assert first is None
+    assert isinstance(second, ConflictError)
+    assert User.find_by_attribute("id", "u1").name == "Bob"
+
+
+def test_astore_data_coalesces_distinct_keys(storage):
+    users = [User(f"u{i}", "n") for i in range(20)]
+
+    async def store_all():
+        await asyncio.gather(*(user.astore_data() for user in users))
+
+    asyncio.run(store_all())
+    assert sorted(user.id for user in User.find_all()) == sorted(f"u{i}" for i in range(20))
+    # Stored entities remember their version and can be stored again
+    users[0].name = "m"
+    users[0].store_data()
+
+
+def test_astore_data_raises_for_invalid_entity(storage):
+    with pytest.raises(ValueError):
+        asyncio.run(User("", "nobody").astore_data())
@@ -0,0 +1,122 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from devices import Device, DeviceState
+from reservations import RecurringReservation, Reservation, ReservationManager
+from users import User
+
+BASE = datetime(2025, 1, 1)
+
+
+def _hours(h):
+    return BASE + timedelta(hours=h)
+
+
+@pytest.fixture
+def manager(storage):
+    User.store_many([User(f"u{i}", "n") for i in range(3)])
+    devices = [Device(f"d{i}", "u0") for i in range(5)]
+    devices[1].state = DeviceState.MAINTENANCE
+    Device.store_many(devices)
+    manager = ReservationManager()
+    assert all(result.accepted for result in manager.create_many([
+        Reservation("1", "d0", "u0", _hours(9), _hours(11)),
+        # Follows without a gap, so d0 is busy until 12
+        Reservation("2", "d0", "u1", _hours(11), _hours(12)),
+        Reservation("3", "d0", "u1", _hours(13), _hours(14)),
+        Reservation("4", "d1", "u1", _hours(9), _hours(11)),
+        Reservation("5", "d4", "u2", _hours(13), _hours(14)),
+    ]))
+    rule = RecurringReservation("s1", "d3", "u2", _hours(10), _hours(10.5), timedelta(days=1), BASE + timedelta(days=7))
+    assert manager.create_recurring(rule).accepted
+    return manager
+
+
+def test_fleet_status(manager):
+    status = manager.fleet_status(_hours(10))
+    summary = {
+        name: (s.state, s.holder, s.reservation_id, s.free_at) for name, s in status.items()
+    }
+    assert summary == {
+        "d0": (DeviceState.RESERVED, "u0", "1", _hours(12)),
+        # Maintenance wins over the reservation, the holder is still reported
+        "d1": (DeviceState.MAINTENANCE, "u1", "4", _hours(11)),
+        "d2": (DeviceState.AVAILABLE, None, None, None),
+        "d3": (DeviceState.RESERVED, "u2", "s1", _hours(10.5)),
+        "d4": (DeviceState.AVAILABLE, None, None, None),
+    }
+    # The next day only the series holds its device
+    later = manager.fleet_status(_hours(34.25))
+    assert [name for name, s in later.items() if s.holder] == ["d3"]
+    assert later["d3"].free_at == _hours(34.5)
+
+
+def test_find_free_slots(manager):
+    assert manager.find_free_slots("d0", _hours(8), _hours(15)) == [
+        (_hours(8), _hours(9)), (_hours(12), _hours(13)), (_hours(14), _hours(15)),
+    ]
+    assert manager.find_free_slots("d0", _hours(8), _hours(15), timedelta(hours=1)) == [
+        (_hours(8), _hours(9)), (_hours(12), _hours(13)), (_hours(14), _hours(15)),
+    ]
+    assert manager.find_free_slots("d0", _hours(10), _hours(15), timedelta(minutes=61)) == []
+    # Occurrences of recurring reservations are gaps as well
+    assert manager.find_free_slots("d3", _hours(0), _hours(48)) == [
+        (_hours(0), _hours(10)), (_hours(10.5), _hours(34)), (_hours(34.5), _hours(48)),
+    ]
+    assert manager.find_free_slots("d2", _hours(0), _hours(1)) == [(_hours(0), _hours(1))]
+
+
+@pytest.mark.parametrize("n_candidates", [3, 20])
+def test_available_devices_agree_with_single_checks(storage, n_candidates):
+    """Few candidates are checked one by one, many by the sweep: both must give the same answer."""
+    User("u0", "n").store_data()
+    Device.store_many([Device(f"d{i}", "u0") for i in range(n_candidates)])
+    manager = ReservationManager()
+    rng = random.Random(n_candidates)
+    batch = []
+    for _ in range(4 * n_candidates):
+        start = _hours(rng.randrange(200))
+        batch.append(Reservation(None, f"d{rng.randrange(n_candidates)}", "u0", start, start + timedelta(hours=rng.randrange(1, 6))))
+    manager.create_many(batch)
+    for _ in range(30):
+        start = _hours(rng.randrange(200))
+        end = start + timedelta(hours=rng.randrange(1, 4))
+        expected = [f"d{i}" for i in range(n_candidates) if manager.is_available(f"d{i}", start, end)]
+        assert manager.find_available_devices(start, end) == expected
+
+
+def _reference_status(reservations, device_name, at):
+    """holder and free_at of one device, from its reservations alone."""
+    own = [r for r in reservations if r.device_name == device_name]
+    covering = [r for r in own if r.start <= at < r.end]
+    if not covering:
+        return None, None
+    free_at = max(r.end for r in covering)
+    while True:
+        following = [r.end for r in own if at < r.start <= free_at and r.end > free_at]
+        if not following:
+            return covering[0].user_id, free_at
+        free_at = max(following)
+
+
+def test_fleet_status_matches_each_device_on_its_own(storage):
+    User.store_many([User(f"u{i}", "n") for i in range(4)])
+    Device.store_many([Device(f"d{i}", "u0") for i in range(30)])
+    manager = ReservationManager()
+    rng = random.Random(13)
+    batch = []
+    for _ in range(400):
+        start = _hours(rng.randrange(300))
+        end = start + timedelta(hours=rng.randrange(1, 5))
+        batch.append(Reservation(None, f"d{rng.randrange(30)}", f"u{rng.randrange(4)}", start, end))
+    manager.create_many(batch)
+    reservations = manager.find_all()
+    for _ in range(25):
+        at = _hours(rng.randrange(-5, 310) + rng.random())
+        status = manager.fleet_status(at)
+        assert len(status) == 30
+        for name, s in status.items():
+            assert (s.holder, s.free_at) == _reference_status(reservations, name, at)
+            assert s.state == (DeviceState.RESERVED if s.holder else DeviceState.AVAILABLE)
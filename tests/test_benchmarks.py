@@ -0,0 +1,75 @@
+import json
+
+from benchmarks.compare import compare
+from benchmarks.datagen import Dataset, generate
+from benchmarks.run import percentile, run
+from database import DatabaseConnector
+from devices import Device
+from maintenance import MaintenanceManager
+from reservations import ReservationManager
+from users import User
+
+SMALL = Dataset(users=20, devices=10, reservations=60, maintenances=15)
+
+
+def _contents():
+    return (
+        # created_at is the time of the run
+        [(u.id, u.name) for u in User.find_all()],
+        [(d.device_name, d.managed_by_user_id, d.state) for d in Device.find_all()],
+        [(r.device_name, r.user_id, r.start, r.end) for r in ReservationManager().find_all()],
+        [(m.device_name, m.cost, m.performed_at) for m in MaintenanceManager().find_all()],
+    )
+
+
+def test_generated_data_is_reproducible(tmp_path):
+    contents = []
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        DatabaseConnector().configure(path=str(tmp_path / name / "database.json"), storage="json")
+        try:
+            rows = generate(SMALL, seed=5)
+            contents.append(_contents())
+        finally:
+            DatabaseConnector().close()
+        assert rows["users"] == 20 and rows["maintenances"] == 15
+        assert 0 < rows["reservations"] <= 60
+    assert contents[0] == contents[1]
+    assert len(contents[0][2]) == rows["reservations"]
+
+
+def test_scales_and_overrides():
+    assert Dataset.from_scale("10k", reservations=5).to_dict() == {
+        "users": 10_000, "devices": 10_000, "reservations": 5, "maintenances": 10_000,
+    }
+    assert Dataset.from_scale("250").devices == 250
+
+
+def test_run_reports_percentiles_and_memory(tmp_path):
+    previous = DatabaseConnector().path
+    report = run(SMALL, "json", repeat=5, seed=1, only="find", directory=str(tmp_path))
+    assert DatabaseConnector().path == previous
+    assert report["meta"]["dataset"] == SMALL.to_dict()
+    assert report["results"] and all("find" in name for name in report["results"])
+    for stats in report["results"].values():
+        assert stats["p50_ms"] <= stats["p90_ms"] <= stats["p99_ms"]
+        assert stats["peak_kib"] >= 0
+    # The report is what compare() reads back
+    json.loads(json.dumps(report))
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert (percentile(values, 50), percentile(values, 99), percentile(values, 100)) == (50.0, 99.0, 100.0)
+    assert percentile([], 50) == 0.0
+
+
+def test_compare_flags_only_real_regressions(capsys):
+    def report(p50, p99, peak):
+        return {"meta": {"storage": "json"}, "results": {"op": {"p50_ms": p50, "p99_ms": p99, "peak_kib": peak}}}
+
+    assert compare(report(1.0, 2.0, 100.0), report(1.1, 2.0, 110.0)) == []
+    # Doubled, but below the noise floor
+    assert compare(report(0.01, 0.02, 1.0), report(0.02, 0.04, 2.0)) == []
+    regressions = compare(report(1.0, 2.0, 100.0), report(2.0, 2.0, 100.0))
+    assert len(regressions) == 1 and regressions[0].startswith("op p50_ms")
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import instrumentation
+from devices import Device
+from maintenance import Maintenance, MaintenanceManager
+from reservations import Reservation, ReservationManager
+from users import User
+
+BASE = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def recorder():
+    instrumentation.enable()
+    try:
+        with instrumentation.scope() as recorder:
+            yield recorder
+    finally:
+        instrumentation.enable(False)
+
+
+def _writes(recorder):
+    stats = recorder.by_operation().get("storage.write")
+    return stats.calls if stats else 0
+
+
+def test_batches_are_written_at_once(storage, recorder):
+    User.store_many([User(f"u{i}", "n") for i in range(200)])
+    Device.store_many([Device(f"d{i}", "u0") for i in range(50)])
+    manager = ReservationManager()
+    results = manager.create_many([
+        Reservation(None, f"d{i % 50}", "u1", BASE + timedelta(hours=i), BASE + timedelta(hours=i, minutes=30))
+        for i in range(300)
+    ])
+    assert all(result.accepted for result in results)
+    MaintenanceManager().upsert_many([Maintenance(None, f"d{i}", "check", 1.0) for i in range(50)])
+    assert len(User.find_all()) == 200
+    assert len(manager.find_all()) == 300
+    if storage != "sqlite":
+        # One write per batch (the maintenance batch writes entries and cost aggregates); SQLite
+        # commits each batch as one transaction instead
+        assert _writes(recorder) == 5
+
+
+def test_create_many_reports_every_reservation(storage):
+    User.store_many([User("u0", "n")])
+    Device.store_many([Device("d0", "u0"), Device("d1", "u0")])
+    manager = ReservationManager()
+    assert manager.create(Reservation("1", "d0", "u0", BASE, BASE + timedelta(hours=2)))
+    results = manager.create_many([
+        Reservation(None, "d0", "u0", BASE + timedelta(hours=1), BASE + timedelta(hours=3)),
+        Reservation(None, "d1", "u0", BASE, BASE + timedelta(hours=1)),
+        Reservation(None, "d1", "u0", BASE + timedelta(minutes=30), BASE + timedelta(hours=2)),
+        Reservation(None, "d1", "u0", BASE + timedelta(hours=5), BASE + timedelta(hours=4)),
+        Reservation("1", "d1", "u0", BASE + timedelta(hours=6), BASE + timedelta(hours=7)),
+        Reservation(None, "", "u0", BASE, BASE + timedelta(hours=1)),
+        Reservation(None, "d1", "u0", BASE + timedelta(hours=1), BASE + timedelta(hours=2)),
+    ])
+    assert [(r.accepted, r.reason) for r in results] == [
+        (False, "conflicts with an existing reservation"),
+        (True, ""),
+        (False, "conflicts with another reservation in this batch"),
+        (False, "end is not after start"),
+        (False, "reservation_id 1 already taken"),
+        (False, "missing device_name"),
+        (True, ""),
+    ]
+    assert sorted((r.device_name, r.start) for r in manager.find_all()) == [
+        ("d0", BASE), ("d1", BASE), ("d1", BASE + timedelta(hours=1)),
+    ]
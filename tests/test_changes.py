@@ -0,0 +1,65 @@
+from changes import DELETE, PUT, RESET, ChangeFeed
+from database import DatabaseConnector
+from read_cache import TableCache
+from users import User
+
+
+def test_writes_are_published_in_order(storage):
+    table = DatabaseConnector().get_table("users")
+    feed = table.changes
+    cursor = feed.cursor
+    first = table.insert({"id": "u1", "name": "a"})
+    table.update({"name": "b"}, doc_ids=[first])
+    second = table.insert({"id": "u2", "name": "c"})
+    table.remove(doc_ids=[first])
+    DatabaseConnector().get_table("devices").insert({"device_name": "d1"})
+    changes = feed.since(cursor, "users")
+    assert [(c.op, c.doc_id) for c in changes] == [(PUT, first), (PUT, first), (PUT, second), (DELETE, first)]
+    assert [c.value["name"] for c in changes if c.op == PUT] == ["a", "b", "c"]
+    assert [c.seq for c in changes] == sorted(c.seq for c in changes)
+    # Without a table the feed holds the changes of all tables
+    assert len(feed.since(cursor)) == 5
+    # Values are copies, readers may keep them
+    changes[0].value["name"] = "changed"
+    assert table.get(doc_id=second)["name"] == "c"
+
+
+def test_subscribers_get_every_batch(storage):
+    feed = DatabaseConnector().get_table("users").changes
+    received = []
+    unsubscribe = feed.subscribe(received.append)
+    User.store_many([User("u1", "a"), User("u2", "b")])
+    User("u3", "c").store_data()
+    unsubscribe()
+    User("u4", "d").store_data()
+    assert [[c.value["id"] for c in batch if c.table == "users"] for batch in received] == [["u1", "u2"], ["u3"]]
+
+
+def test_old_cursors_have_to_reload():
+    feed = ChangeFeed(retain=3)
+    feed.publish([("t", PUT, i, {"i": i}) for i in range(10)])
+    assert feed.since(0) is None
+    assert [c.doc_id for c in feed.since(feed.cursor - 2)] == [8, 9]
+    feed.publish([(None, RESET, None, None)])
+    assert [c.op for c in feed.since(feed.cursor - 1, "t")] == [RESET]
+
+
+def test_cache_converts_only_changed_documents(storage):
+    User.store_many([User(f"u{i}", "n") for i in range(50)])
+    converted = []
+
+    def convert(doc):
+        converted.append(doc["id"])
+        return doc["id"], doc["name"]
+
+    cache = TableCache()
+    assert len(cache.get_live("users", convert)) == 50
+    assert len(converted) == 50
+    converted.clear()
+    user = User.find_by_attribute("id", "u7")
+    user.name = "changed"
+    user.store_data()
+    User.find_by_attribute("id", "u8").delete()
+    rows = cache.get_live("users", convert)
+    assert converted == ["u7"]
+    assert len(rows) == 49 and ("u7", "changed") in rows
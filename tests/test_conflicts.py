@@ -0,0 +1,93 @@
+import pytest
+
+from database import ConflictError, DatabaseConnector
+from entity import CONFLICT_REASON
+from users import User
+
+
+def _stored_user(user_id="u1", name="Alice"):
+    User(user_id, name).store_data()
+    return User.find_by_attribute("id", user_id)
+
+
+def test_store_data_rejects_stale_copy(storage):
+    first = _stored_user()
+    second = User.find_by_attribute("id", "u1")
+    first.name = "Bob"
+    first.store_data()
+    second.name = "Carol"
+    with pytest.raises(ConflictError):
+        second.store_data()
+    assert User.find_by_attribute("id", "u1").name == "Bob"
+
+
+def test_store_data_rejects_removed_document(storage):
+    user = _stored_user()
+    User.find_by_attribute("id", "u1").delete()
+    with pytest.raises(ConflictError):
+        user.store_data()
+
+
+def test_store_data_updates_version(storage):
+    user = _stored_user()
+    user.name = "Bob"
+    user.store_data()
+    user.name = "Carol"
+    user.store_data()
+    assert User.find_by_attribute("id", "u1").name == "Carol"
+
+
+def test_new_entity_overwrites_unconditionally(storage):
+    _stored_user()
+    User("u1", "Dave").store_data()
+    assert User.find_by_attribute("id", "u1").name == "Dave"
+
+
+def test_store_many_rejects_stale_copy(storage):
+    _stored_user()
+    stale = User.find_by_attribute("id", "u1")
+    fresh = User.find_by_attribute("id", "u1")
+    fresh.name = "Bob"
+    fresh.store_data()
+    stale.name = "Carol"
+    results = User.store_many([stale, User("u2", "Eve")])
+    assert [r.accepted for r in results] == [False, True]
+    assert results[0].reason == CONFLICT_REASON
+    assert User.find_by_attribute("id", "u1").name == "Bob"
+
+
+def test_store_many_rejects_stale_duplicate_in_batch(storage):
+    _stored_user()
+    a = User.find_by_attribute("id", "u1")
+    b = User.find_by_attribute("id", "u1")
+    a.name = "Bob"
+    b.name = "Carol"
+    results = User.store_many([a, b])
+    assert [r.accepted for r in results] == [True, False]
+    assert results[1].reason == CONFLICT_REASON
+    assert User.find_by_attribute("id", "u1").name == "Bob"
+    # The accepted entity can be stored again, the rejected one has to be reloaded
+    a.name = "Dan"
+    a.store_data()
+    with pytest.raises(ConflictError):
+        b.store_data()
+
+
+def test_store_many_unversioned_duplicates_later_wins(storage):
+    results = User.store_many([User("u1", "Alice"), User("u1", "Bob")])
+    assert all(r.accepted for r in results)
+    assert User.find_by_attribute("id", "u1").name == "Bob"
+    assert len(User.find_all()) == 1
+
+
+def test_batching_turns_multiprocess_off_with_warning(json_storage):
+    connector = DatabaseConnector()
+    try:
+        with pytest.warns(UserWarning, match="multiprocess"):
+            connector.configure(flush_every=10)
+        assert not connector.multiprocess
+        with pytest.raises(ValueError):
+            connector.configure(flush_every=10, multiprocess=True)
+    finally:
+        connector.configure(flush_every=1, multiprocess=True)
+    assert connector.multiprocess
@@ -0,0 +1,60 @@
+import json
+
+import instrumentation
+from database import DatabaseConnector
+from devices import Device
+from maintenance import MaintenanceManager
+from reservations import ReservationManager
+from users import User
+
+
+def _users_on_disk(path):
+    with open(path) as handle:
+        content = handle.read()
+    return len(json.loads(content).get("users", {})) if content else 0
+
+
+def test_one_handle_per_database_file(storage):
+    connector = DatabaseConnector()
+    assert DatabaseConnector() is connector
+    assert connector.get_db() is connector.get_db()
+    assert connector.get_table("reservations") is ReservationManager()._table
+    assert connector.get_table("maintenances") is MaintenanceManager()._table
+
+
+def test_reads_are_served_from_memory(storage):
+    User.store_many([User(f"u{i}", "n") for i in range(20)])
+    Device("d1", "u0").store_data()
+    instrumentation.enable()
+    try:
+        with instrumentation.scope() as recorder:
+            for _ in range(10):
+                assert len(User.find_all()) == 20
+                assert User.find_by_attribute("id", "u7").name == "n"
+                assert Device.find_by_attribute("device_name", "d1") is not None
+    finally:
+        instrumentation.enable(False)
+    stats = recorder.by_operation()
+    assert "storage.read" not in stats
+    assert stats["User.find_all"].calls == 10
+    assert sum(s.file_opens for s in stats.values()) == 0
+
+
+def test_write_behind_flushes_every_n_writes(json_storage):
+    connector = DatabaseConnector()
+    path = connector.path
+    try:
+        connector.configure(flush_every=3, multiprocess=False)
+        User("u0", "n").store_data()
+        User("u1", "n").store_data()
+        # Not written yet, but visible to readers of the process
+        assert len(User.find_all()) == 2
+        assert _users_on_disk(path) == 0
+        User("u2", "n").store_data()
+        assert _users_on_disk(path) == 3
+        User("u3", "n").store_data()
+        assert _users_on_disk(path) == 3
+        connector.flush()
+        assert _users_on_disk(path) == 4
+    finally:
+        connector.configure(flush_every=1, multiprocess=True)
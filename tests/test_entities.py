@@ -0,0 +1,49 @@
+import pytest
+
+from database import ConflictError
+from devices import Device, DeviceState
+from users import User
+
+
+@pytest.fixture
+def users(storage):
+    User.store_many([User(f"u{i}", f"name {i}") for i in range(5)])
+
+
+def test_lazy_list_is_not_changed_by_later_writes(users):
+    lazy = User.find_all(lazy=True)
+    renamed = User.find_by_attribute("id", "u1")
+    renamed.name = "renamed"
+    renamed.store_data()
+    User("u9", "new").store_data()
+    assert len(lazy) == 5
+    assert lazy.column("name")[1] == "name 1"
+    # Materialized after the write: still the document as it was read
+    assert lazy[1].name == "name 1"
+
+
+def test_lazy_entity_keeps_version_it_was_read_with(users):
+    lazy = User.find_all(lazy=True)
+    fresh = User.find_by_attribute("id", "u2")
+    fresh.name = "first"
+    fresh.store_data()
+    stale = lazy[2]
+    stale.name = "second"
+    with pytest.raises(ConflictError):
+        stale.store_data()
+    assert User.find_by_attribute("id", "u2").name == "first"
+
+
+def test_lazy_list_matches_eager_list(users):
+    lazy = User.find_all(lazy=True)
+    eager = User.find_all()
+    assert [u.id for u in lazy] == [u.id for u in eager]
+    assert [u.id for u in lazy[1:4]] == ["u1", "u2", "u3"]
+
+
+def test_device_state_round_trip(users):
+    device = Device("d1", "u1")
+    device.state = DeviceState.MAINTENANCE
+    device.store_data()
+    assert Device.find_by_attribute("device_name", "d1").state is DeviceState.MAINTENANCE
+    assert Device.find_all(lazy=True).column("state") == ["maintenance"]
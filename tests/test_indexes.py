@@ -0,0 +1,155 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from devices import Device
+from indexes import IntervalIndex, SortedIndex
+from reservations import Reservation, ReservationManager
+from users import User
+
+BASE = datetime(2025, 1, 1)
+
+
+def _random_intervals(rng, n):
+    docs = {}
+    for doc_id in range(1, n + 1):
+        start = rng.randrange(1000)
+        docs[doc_id] = {"group": rng.choice("ab"), "start": start, "end": start + rng.randrange(1, 60)}
+    return docs
+
+
+def test_entity_writes_and_lookups_use_the_hash_indexes(storage):
+    User.store_many([User(f"u{i}", "n") for i in range(5)])
+    Device.store_many([Device(f"d{i}", f"u{i % 5}") for i in range(50)])
+    table = Device.get_table()
+    table.scans = 0
+    device = Device.find_by_attribute("device_name", "d7")
+    device.set_managed_by_user_id("u0")
+    device.store_data()
+    Device.find_by_attribute("device_name", "d8").delete()
+    managed = Device.find_by_attribute("managed_by_user_id", "u0", num_to_return=100)
+    assert {d.device_name for d in managed} == {f"d{i}" for i in range(0, 50, 5)} | {"d7"}
+    assert Device.find_by_attribute("device_name", "d8") is None
+    assert table.scans == 0
+
+
+def test_hash_index_follows_updates_and_removals(json_storage):
+    User.store_many([User("u0", "n"), User("u1", "n")])
+    Device.store_many([Device(f"d{i}", "u0") for i in range(3)])
+    table = Device.get_table()
+    device = Device.find_by_attribute("device_name", "d1")
+    device.set_managed_by_user_id("u1")
+    device.store_data()
+    Device.find_by_attribute("device_name", "d2").delete()
+    before = table.index_stats()
+    assert [doc["device_name"] for doc in table.lookup("managed_by_user_id", "u0")] == ["d0"]
+    assert [doc["device_name"] for doc in table.lookup("managed_by_user_id", "u1")] == ["d1"]
+    assert table.lookup("device_name", "d2") == []
+    stats = table.index_stats()
+    assert stats["managed_by_user_id"]["hits"] - before["managed_by_user_id"]["hits"] == 2
+    assert stats["device_name"]["misses"] - before["device_name"]["misses"] == 1
+
+
+def test_interval_index_matches_brute_force():
+    rng = random.Random(3)
+    docs = _random_intervals(rng, 300)
+    index = IntervalIndex("group", "start", "end")
+    index.rebuild({str(doc_id): doc for doc_id, doc in docs.items()})
+    # Updates and removals keep the index in line with the documents
+    for doc_id in rng.sample(sorted(docs), 60):
+        if rng.random() < 0.5:
+            del docs[doc_id]
+            index.update(doc_id, None)
+        else:
+            start = rng.randrange(1000)
+            docs[doc_id] = {"group": rng.choice("ab"), "start": start, "end": start + rng.randrange(1, 200)}
+            index.update(doc_id, docs[doc_id])
+    for _ in range(200):
+        group, start = rng.choice("ab"), rng.randrange(-50, 1100)
+        end = start + rng.randrange(1, 100)
+        expected = sorted(
+            (doc["start"], doc["end"], doc_id) for doc_id, doc in docs.items()
+            if doc["group"] == group and doc["start"] < end and doc["end"] > start
+        )
+        assert index.overlapping(group, start, end) == [doc_id for _, _, doc_id in expected]
+        covering = {doc_id for doc_id, doc in docs.items() if doc["group"] == group and doc["start"] <= start < doc["end"]}
+        assert set(index.covering(group, start)) == covering
+
+
+def test_interval_index_touching_intervals_dont_overlap():
+    index = IntervalIndex("group", "start", "end")
+    index.update(1, {"group": "a", "start": 10, "end": 20})
+    assert index.overlapping("a", 20, 30) == []
+    assert index.overlapping("a", 0, 10) == []
+    assert index.overlapping("a", 19, 21) == [1]
+    assert index.covering("a", 10) == [1]
+    assert index.covering("a", 20) == []
+    # Documents without the fields aren't indexed
+    index.update(2, {"group": "a", "start": 5})
+    assert len(index) == 1
+
+
+def test_interval_index_bound_shrinks_when_long_interval_goes():
+    index = IntervalIndex("group", "start", "end")
+    for doc_id in range(1, 101):
+        index.update(doc_id, {"group": "a", "start": doc_id * 10, "end": doc_id * 10 + 5})
+    index.update(101, {"group": "a", "start": 0, "end": 5000})
+    assert index.longest() == 5000
+    assert index.overlapping("a", 995, 1000) == [101]
+    # Shortened, then removed: the bound follows, so queries look back 5 again instead of 5000
+    index.update(101, {"group": "a", "start": 0, "end": 50})
+    assert index.longest() == 50
+    index.update(101, None)
+    assert index.longest() == 5
+    assert index.overlapping("a", 995, 1000) == []
+    assert index.overlapping("a", 1000, 1001) == [100]
+    assert index.covering("a", 12) == [1]
+
+
+def test_sorted_index_bounds():
+    index = SortedIndex("value")
+    index.rebuild({str(i): {"value": v} for i, v in enumerate([5, 1, 3, 3, 9], 1)})
+    start, end = index.bounds(3, 9)
+    assert list(index.doc_ids(start, end)) == [3, 4, 1]
+    assert list(index.doc_ids(start, end, descending=True)) == [1, 4, 3]
+    assert index.bounds(10, None) == (5, 5)
+
+
+def test_reservation_boundaries(storage):
+    User("u1", "n").store_data()
+    Device("d1", "u1").store_data()
+    manager = ReservationManager()
+    nine, ten, eleven = (BASE + timedelta(hours=h) for h in (9, 10, 11))
+    assert manager.create(Reservation(None, "d1", "u1", nine, ten))
+    # Back to back is fine, any overlap isn't
+    assert manager.is_available("d1", ten, eleven)
+    assert not manager.is_available("d1", nine + timedelta(minutes=59), eleven)
+    assert not manager.is_available("d1", ten, ten)
+    assert manager.create(Reservation(None, "d1", "u1", ten, eleven))
+    assert not manager.create(Reservation(None, "d1", "u1", nine, eleven))
+    assert [r.start for r in manager.reservations_between("d1", nine, eleven)] == [nine, ten]
+    assert manager.current_reservation("d1", ten).start == ten
+    assert manager.current_reservation("d1", eleven) is None
+    assert manager.find_free_slots("d1", BASE, BASE + timedelta(days=1), timedelta(hours=1)) == [
+        (BASE, nine), (eleven, BASE + timedelta(days=1)),
+    ]
+
+
+@pytest.mark.parametrize("seed", [1, 2])
+def test_create_many_checks_batch_against_itself(storage, seed):
+    User("u1", "n").store_data()
+    Device.store_many([Device("d1", "u1"), Device("d2", "u1")])
+    rng = random.Random(seed)
+    batch = []
+    for _ in range(80):
+        start = BASE + timedelta(minutes=15 * rng.randrange(400))
+        batch.append(Reservation(None, rng.choice(["d1", "d2"]), "u1", start, start + timedelta(minutes=15 * rng.randrange(1, 8))))
+    results = ReservationManager().create_many(batch)
+    accepted = [r.item for r in results if r.accepted]
+    assert accepted
+    for device in ("d1", "d2"):
+        intervals = sorted((r.start, r.end) for r in accepted if r.device_name == device)
+        assert all(a_end <= b_start for (_, a_end), (b_start, _) in zip(intervals, intervals[1:]))
+    stored = {(r.device_name, r.start, r.end) for r in ReservationManager().find_all()}
+    assert stored == {(r.device_name, r.start, r.end) for r in accepted}
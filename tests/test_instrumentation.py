@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+import instrumentation
+from database import DatabaseConnector
+from users import User
+
+
+@pytest.fixture
+def enabled():
+    instrumentation.enable()
+    yield
+    instrumentation.enable(False)
+
+
+def test_disabled_records_nothing():
+    instrumentation.enable(False)
+    with instrumentation.scope() as recorder:
+        with instrumentation.operation("outer"):
+            instrumentation.count(rows_scanned=5)
+    assert recorder.by_path() == {}
+
+
+def test_nested_operations_are_recorded_per_path(enabled):
+    before = instrumentation.PROCESS.by_path().get(("outer",))
+    with instrumentation.scope() as recorder:
+        for _ in range(2):
+            with instrumentation.operation("outer"):
+                instrumentation.count(rows_scanned=1)
+                with instrumentation.operation("inner"):
+                    instrumentation.count(rows_scanned=10, file_opens=1)
+    stats = recorder.by_path()
+    assert (stats[("outer",)].calls, stats[("outer",)].rows_scanned, stats[("outer",)].file_opens) == (2, 22, 2)
+    assert (stats[("outer", "inner")].calls, stats[("outer", "inner")].rows_scanned) == (2, 20)
+    assert recorder.by_operation()["inner"].file_opens == 2
+    # The process statistics count the same calls in addition to the scope
+    assert instrumentation.PROCESS.by_path()[("outer",)].calls == (before.calls if before else 0) + 2
+
+
+def test_storage_reads_are_attributed_to_the_calling_operation(json_storage, enabled):
+    User.store_many([User(f"u{i}", "n") for i in range(10)])
+    # Another handle has to read the file from disk again
+    DatabaseConnector().close()
+    with instrumentation.scope() as recorder:
+        assert len(User.find_all()) == 10
+    stats = recorder.by_path()
+    read = stats[("User.find_all", "storage.read")]
+    assert read.calls == 1 and read.bytes_read > 0
+    assert stats[("User.find_all",)].bytes_read == read.bytes_read
+
+
+def test_dump_appends_one_json_line_per_call(tmp_path, enabled):
+    with instrumentation.scope() as recorder:
+        with instrumentation.operation("op"):
+            instrumentation.count(bytes_written=3)
+    path = str(tmp_path / "metrics.jsonl")
+    instrumentation.dump(path, recorder)
+    instrumentation.dump(path, recorder)
+    with open(path, encoding="utf-8") as handle:
+        records = [json.loads(line) for line in handle]
+    assert len(records) == 2
+    assert records[0]["operations"] == [{
+        "path": ["op"], "calls": 1, "wall_ms": records[0]["operations"][0]["wall_ms"],
+        "max_ms": records[0]["operations"][0]["max_ms"], "rows_scanned": 0, "bytes_read": 0,
+        "bytes_written": 3, "file_opens": 0,
+    }]
@@ -0,0 +1,81 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import storage
+from database import DatabaseConnector
+from users import User
+
+
+@pytest.fixture
+def journal(tmp_path):
+    path = str(tmp_path / "database.json")
+    DatabaseConnector().configure(path=path, storage="journal")
+    yield path
+    DatabaseConnector().close()
+
+
+def _crash_image(path, tmp_path):
+    """Copy of snapshot and log as a crash would leave them (the open handles are never closed)."""
+    crashed = str(tmp_path / "crashed" / "database.json")
+    os.makedirs(os.path.dirname(crashed))
+    shutil.copy(path, crashed)
+    shutil.copy(path + ".log", crashed + ".log")
+    return crashed
+
+
+def test_writes_only_append_changed_documents(journal):
+    User.store_many([User(f"u{i}", "n") for i in range(50)])
+    size = os.path.getsize(journal + ".log")
+    User("u7", "renamed").store_data()
+    with open(journal + ".log", encoding="utf-8") as handle:
+        last = json.loads(handle.readlines()[-1])
+    assert (last["op"], last["doc"]["name"]) == ("put", "renamed")
+    assert os.path.getsize(journal + ".log") - size < 200
+
+
+def test_torn_final_record_is_cut_off(journal, tmp_path):
+    User.store_many([User("u1", "a"), User("u2", "b")])
+    User("u2", "changed").store_data()
+    crashed = _crash_image(journal, tmp_path)
+    good_size = os.path.getsize(crashed + ".log")
+    with open(crashed + ".log", "a", encoding="utf-8") as handle:
+        handle.write('{"op": "put", "table": "users", "id": "3", "doc": {"id": "u3", "na')
+
+    DatabaseConnector().configure(path=crashed)
+    assert sorted((u.id, u.name) for u in User.find_all()) == [("u1", "a"), ("u2", "changed")]
+    assert os.path.getsize(crashed + ".log") == good_size
+    # Appending continues on a clean line
+    User("u4", "d").store_data()
+    DatabaseConnector().close()
+    DatabaseConnector().configure(path=crashed)
+    assert sorted(u.id for u in User.find_all()) == ["u1", "u2", "u4"]
+
+
+def test_corrupt_record_before_the_end_is_an_error(journal, tmp_path):
+    User("u1", "a").store_data()
+    crashed = _crash_image(journal, tmp_path)
+    with open(crashed + ".log", "r+", encoding="utf-8") as handle:
+        lines = handle.readlines()
+        handle.seek(0)
+        handle.truncate()
+        handle.writelines(["{broken\n"] + lines)
+    with pytest.raises(ValueError):
+        storage.JournalStorage(crashed).read()
+
+
+def test_compaction_folds_log_into_snapshot(journal, monkeypatch):
+    monkeypatch.setattr(storage.JournalStorage, "COMPACT_AFTER", 10)
+    for i in range(30):
+        User(f"u{i}", "n").store_data()
+    User.find_by_attribute("id", "u0").delete()
+    DatabaseConnector().close()
+    assert os.path.getsize(journal + ".log") == 0
+    with open(journal, encoding="utf-8") as handle:
+        snapshot = json.load(handle)
+    assert len(snapshot["users"]) == 29
+    # The snapshot is a plain JSON database
+    DatabaseConnector().configure(path=journal, storage="json")
+    assert len(User.find_all()) == 29
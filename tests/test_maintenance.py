@@ -0,0 +1,94 @@
+from datetime import datetime
+
+import pytest
+
+from database import ConflictError, DatabaseConnector
+from entity import CONFLICT_REASON
+from maintenance import Maintenance, MaintenanceManager
+
+
+def _summary(manager):
+    summary = manager.cost_summary()
+    return summary.total, summary.count, summary.per_device, summary.per_month
+
+
+@pytest.mark.parametrize("cost", ["a lot", None, -5.0, "nan", float("inf")])
+def test_upsert_rejects_invalid_cost_without_writing(storage, cost):
+    manager = MaintenanceManager()
+    manager.upsert(Maintenance("1", "d1", "check", 10.0, datetime(2025, 3, 1)))
+    with pytest.raises(ValueError):
+        manager.upsert(Maintenance("1", "d1", "check", cost))
+    with pytest.raises(ValueError):
+        manager.upsert(Maintenance(None, "d2", "new", cost))
+    assert [(m.maintenance_id, m.cost) for m in manager.find_all()] == [("1", 10.0)]
+    assert _summary(manager) == (10.0, 1, {"d1": 10.0}, {"2025-03": 10.0})
+
+
+def test_cost_given_as_text_is_stored_as_number(storage):
+    manager = MaintenanceManager()
+    manager.upsert(Maintenance("1", "d1", "check", "12.5", datetime(2025, 3, 1)))
+    manager.upsert_many([Maintenance("2", "d1", "more", "7")])
+    stored = DatabaseConnector().get_table("maintenances").all()
+    assert sorted(doc["cost"] for doc in stored) == [7.0, 12.5]
+    assert all(type(doc["cost"]) is float for doc in stored)
+    assert _summary(manager)[0] == 19.5
+
+
+def test_upsert_many_reports_invalid_entries(storage):
+    manager = MaintenanceManager()
+    results = manager.upsert_many([
+        Maintenance(None, "d1", "ok", 5.0), Maintenance(None, "", "no device"), Maintenance(None, "d1", "bad", -1),
+    ])
+    assert [r.accepted for r in results] == [True, False, False]
+    assert [r.reason for r in results[1:]] == ["missing device_name", "negative cost"]
+    assert len(manager.find_all()) == 1
+
+
+def test_cost_aggregates_follow_updates_and_deletes(storage):
+    manager = MaintenanceManager()
+    manager.upsert_many([
+        Maintenance("1", "d1", "a", 10.0, datetime(2025, 1, 5)),
+        Maintenance("2", "d1", "b", 20.0, datetime(2025, 2, 5)),
+        Maintenance("3", "d2", "c", 5.0),
+    ])
+    manager.upsert(Maintenance("2", "d2", "b moved", 30.0, datetime(2025, 1, 9)))
+    manager.delete_by_id("1")
+    incremental = _summary(manager)
+    assert incremental == (35.0, 2, {"d2": 35.0}, {"2025-01": 30.0})
+    manager.rebuild_costs()
+    assert _summary(manager) == incremental
+
+
+def test_stale_upsert_raises_conflict(storage):
+    manager = MaintenanceManager()
+    manager.upsert(Maintenance("1", "d1", "check", 10.0))
+    mine, theirs = manager.find_all()[0], manager.find_all()[0]
+    theirs.cost = 20.0
+    manager.upsert(theirs)
+    mine.cost = 99.0
+    with pytest.raises(ConflictError):
+        manager.upsert(mine)
+    assert [m.cost for m in manager.find_all()] == [20.0]
+    assert _summary(manager)[0] == 20.0
+    # The written copy carries the new version and can be upserted again
+    theirs.cost = 25.0
+    manager.upsert(theirs)
+    manager.delete_by_id("1")
+    with pytest.raises(ConflictError):
+        manager.upsert(theirs)
+    assert manager.find_all() == []
+
+
+def test_upsert_many_rejects_stale_entries(storage):
+    manager = MaintenanceManager()
+    manager.upsert_many([Maintenance("1", "d1", "a", 10.0), Maintenance("2", "d1", "b", 5.0)])
+    first, second = sorted(manager.find_all(), key=lambda m: m.maintenance_id)
+    stale = Maintenance("1", "d1", "a", 1.0, version=first.version)
+    first.cost = 11.0
+    manager.upsert(first)
+    second.cost = 6.0
+    duplicate = Maintenance("2", "d1", "b", 7.0, version=second.version)
+    results = manager.upsert_many([stale, second, duplicate])
+    assert [(r.accepted, r.reason) for r in results] == [(False, CONFLICT_REASON), (True, ""), (False, CONFLICT_REASON)]
+    assert sorted((m.maintenance_id, m.cost) for m in manager.find_all()) == [("1", 11.0), ("2", 6.0)]
+    assert _summary(manager)[0] == 17.0
@@ -0,0 +1,124 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from devices import Device
+from maintenance import Maintenance, MaintenanceManager
+from reservations import RecurringReservation, Reservation, ReservationManager
+from users import User
+
+BASE = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def reservations(storage):
+    User.store_many([User(f"u{i}", "n") for i in range(3)])
+    Device.store_many([Device(f"d{i}", "u0") for i in range(3)])
+    rng = random.Random(11)
+    batch = []
+    for i in range(90):
+        start = BASE + timedelta(hours=3 * i + rng.randrange(2))
+        batch.append(Reservation(None, f"d{i % 3}", f"u{rng.randrange(3)}", start, start + timedelta(hours=1)))
+    manager = ReservationManager()
+    assert all(result.accepted for result in manager.create_many(batch))
+    return manager
+
+
+def _reference(manager, filters=None, date_range=None, descending=False):
+    rows = [
+        r for r in manager.find_all()
+        if all(getattr(r, field) == value for field, value in (filters or {}).items())
+        and (date_range is None or date_range[0] <= r.start < date_range[1])
+    ]
+    return [r.reservation_id for r in sorted(rows, key=lambda r: r.start, reverse=descending)]
+
+
+@pytest.mark.parametrize("descending", [False, True])
+@pytest.mark.parametrize("offset,limit", [(0, 10), (80, 10), (85, 10), (90, 10), (200, 10), (0, 0), (0, 1000)])
+def test_page_boundaries(reservations, offset, limit, descending):
+    expected = _reference(reservations, descending=descending)
+    page = reservations.find_page(offset, limit, descending=descending)
+    assert page.total == 90
+    assert (page.offset, page.limit) == (offset, limit)
+    assert [r.reservation_id for r in page.items] == expected[offset:offset + limit]
+
+
+def test_pages_cover_all_reservations_once(reservations):
+    seen = []
+    offset = 0
+    while True:
+        page = reservations.find_page(offset, 7, filters={"device_name": "d1"})
+        if not page.items:
+            break
+        seen += [r.reservation_id for r in page.items]
+        offset += 7
+    assert seen == _reference(reservations, {"device_name": "d1"})
+
+
+def test_date_range_is_half_open(reservations):
+    first = reservations.find_page(0, 1).items[0]
+    last = reservations.find_page(89, 1).items[0]
+    date_range = (first.start, last.start)
+    page = reservations.find_page(0, 100, date_range=date_range)
+    assert page.total == 89
+    assert [r.reservation_id for r in page.items] == _reference(reservations, date_range=date_range)
+    open_end = reservations.find_page(0, 100, filters={"user_id": "u2"}, date_range=(first.start + timedelta(days=3), None))
+    assert [r.reservation_id for r in open_end.items] == _reference(
+        reservations, {"user_id": "u2"}, (first.start + timedelta(days=3), datetime.max)
+    )
+
+
+def test_date_range_needs_start_order(reservations):
+    with pytest.raises(ValueError):
+        reservations.find_page(date_range=(BASE, None), order_by="end")
+
+
+def test_entity_pages(storage):
+    User.store_many([User(f"u{i:02d}", f"name {99 - i}") for i in range(30)])
+    page = User.find_page(25, 10)
+    assert page.total == 30
+    assert [u.id for u in page.items] == [f"u{i:02d}" for i in range(25, 30)]
+    by_name = User.find_page(0, 3, order_by="name", descending=True)
+    assert [u.name for u in by_name.items] == ["name 99", "name 98", "name 97"]
+    assert User.find_page(40, 10).items == []
+
+
+def test_maintenance_pages_in_order_of_entry(storage):
+    manager = MaintenanceManager()
+    manager.upsert_many([Maintenance(None, f"d{i % 2}", f"entry {i}", 1.0) for i in range(12)])
+    page = manager.find_page(8, 5, descending=True)
+    assert page.total == 12
+    assert [m.description for m in page.items] == ["entry 3", "entry 2", "entry 1", "entry 0"]
+    filtered = manager.find_page(0, 3, filters={"device_name": "d1"})
+    assert (filtered.total, [m.description for m in filtered.items]) == (6, ["entry 1", "entry 3", "entry 5"])
+
+
+def test_deep_pages_with_recurring_read_everything_before_them(reservations, monkeypatch):
+    requested = []
+    find_page = reservations._table.find_page
+
+    def spy(offset, limit, *args):
+        requested.append((offset, limit))
+        return find_page(offset, limit, *args)
+
+    monkeypatch.setattr(reservations._table, "find_page", spy)
+    expected = _reference(reservations)
+    assert [r.reservation_id for r in reservations.find_page(60, 10).items] == expected[60:70]
+    assert requested == [(60, 10)]
+
+    Device("d3", "u0").store_data()
+    rule = RecurringReservation(
+        None, "d3", "u0", BASE, BASE + timedelta(hours=1), timedelta(days=1), BASE + timedelta(days=5),
+    )
+    assert reservations.create_recurring(rule).accepted
+    requested.clear()
+    page = reservations.find_page(60, 10)
+    assert page.total == 95
+    assert requested == [(0, 70)]
+    # A date range keeps the read small again
+    requested.clear()
+    date_range = (BASE + timedelta(days=8), BASE + timedelta(days=9))
+    page = reservations.find_page(0, 10, date_range=date_range)
+    assert [r.reservation_id for r in page.items] == _reference(reservations, date_range=date_range)
+    assert requested == [(0, 10)]
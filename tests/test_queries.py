@@ -0,0 +1,76 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import DatabaseConnector
+from devices import Device, DeviceState
+from queries import In, Range, matches
+from reservations import Reservation, ReservationManager
+from users import User
+
+BASE = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def table(storage):
+    User.store_many([User(f"u{i}", "n") for i in range(6)])
+    Device.store_many([Device(f"d{i}", "u0") for i in range(8)])
+    rng = random.Random(19)
+    batch = []
+    for _ in range(300):
+        start = BASE + timedelta(hours=rng.randrange(2000))
+        note = rng.choice(["", "Kurs", "Projekt"])
+        batch.append(Reservation(None, f"d{rng.randrange(8)}", f"u{rng.randrange(6)}", start, start + timedelta(hours=1), note))
+    ReservationManager().create_many(batch)
+    return DatabaseConnector().get_table("reservations")
+
+
+QUERIES = [
+    ({"device_name": "d3"}, None, False, None),
+    ({"user_id": In(["u1", "u4"]), "note": "Kurs"}, "start", False, None),
+    ({"start": Range(BASE + timedelta(days=10), BASE + timedelta(days=30))}, "start", True, 7),
+    ({"device_name": "d1", "start": Range(BASE + timedelta(days=20), None)}, "start", False, 5),
+    ({"note": "Projekt"}, None, True, 10),
+    ({"user_id": "u9"}, None, False, None),
+]
+
+
+@pytest.mark.parametrize("where,order_by,descending,limit", QUERIES)
+def test_find_where_matches_brute_force(table, where, order_by, descending, limit):
+    docs = [doc for doc in table.all() if matches(doc, where)]
+    if order_by is None:
+        docs.sort(key=lambda doc: doc.doc_id, reverse=descending)
+    else:
+        docs.sort(key=lambda doc: (doc[order_by], doc.doc_id), reverse=descending)
+    expected = [doc.doc_id for doc in docs][:limit]
+    assert [doc.doc_id for doc in table.find_where(where, order_by, descending, limit)] == expected
+
+
+def test_planner_picks_the_most_selective_index(table):
+    if DatabaseConnector().storage == "sqlite":
+        pytest.skip("SQLite plans its queries itself, see test_sqlite.py")
+    plan = table.explain_where({"device_name": "d3"})
+    assert (plan.strategy, plan.index, plan.candidates) == ("index", "device_name", len(table.lookup("device_name", "d3")))
+    # A single user has fewer reservations than the whole date range
+    plan = table.explain_where({"user_id": "u2", "start": Range(BASE, None)})
+    assert (plan.strategy, plan.index) == ("index", "user_id")
+    plan = table.explain_where({"start": Range(BASE + timedelta(days=10), BASE + timedelta(days=11))}, order_by="start")
+    assert (plan.strategy, plan.index, plan.ordered) == ("range", "start", True)
+    assert plan.candidates < 20
+    plan = table.explain_where({"user_id": In(["u1", "u4"])})
+    assert plan.candidates == len(table.lookup("user_id", "u1")) + len(table.lookup("user_id", "u4"))
+    # Nothing indexed: a scan of all documents
+    plan = table.explain_where({"note": "Kurs"})
+    assert (plan.strategy, plan.candidates) == ("scan", len(table))
+
+
+def test_entity_find_where_converts_enums(storage):
+    User("u0", "n").store_data()
+    devices = [Device(f"d{i}", "u0") for i in range(5)]
+    devices[1].state = DeviceState.MAINTENANCE
+    devices[3].state = DeviceState.INACTIVE
+    Device.store_many(devices)
+    found = Device.find_where({"state": In([DeviceState.MAINTENANCE, DeviceState.INACTIVE])}, order_by="device_name")
+    assert [d.device_name for d in found] == ["d1", "d3"]
+    assert [d.device_name for d in Device.find_where({"managed_by_user_id": "u0"}, limit=2)] == ["d0", "d1"]
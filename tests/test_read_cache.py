@@ -0,0 +1,82 @@
+import multiprocessing
+
+import pytest
+
+from database import ConflictError, DatabaseConnector
+from read_cache import TableCache
+from snapshots import DeviceRecord, UserRecord
+from users import User
+
+
+def test_unchanged_table_returns_same_snapshot(storage):
+    User.store_many([User(f"u{i}", "n") for i in range(3)])
+    cache = TableCache()
+    first = cache.get_snapshot(UserRecord)
+    assert cache.get_snapshot(UserRecord) is first
+    assert first.column("id") == ("u0", "u1", "u2")
+
+
+def test_snapshot_after_writes_shares_unchanged_records(storage):
+    User.store_many([User(f"u{i}", "n") for i in range(3)])
+    cache = TableCache()
+    before = cache.get_snapshot(UserRecord)
+    user = before.get("u1").to_entity()
+    user.name = "renamed"
+    user.store_data()
+    User("u3", "new").store_data()
+    User.find_by_attribute("id", "u0").delete()
+
+    after = cache.get_snapshot(UserRecord)
+    assert after.column("id") == ("u1", "u2", "u3")
+    assert after.get("u1").name == "renamed"
+    assert after.get("u2") is before.get("u2")
+    # The earlier snapshot is immutable
+    assert before.column("id") == ("u0", "u1", "u2")
+    assert before.get("u1").name == "n"
+
+
+def test_snapshot_records_carry_version_for_conflicts(storage):
+    User("u1", "n").store_data()
+    cache = TableCache()
+    stale = cache.get_snapshot(UserRecord).get("u1").to_entity()
+    fresh = User.find_by_attribute("id", "u1")
+    fresh.name = "first"
+    fresh.store_data()
+    stale.name = "second"
+    with pytest.raises(ConflictError):
+        stale.store_data()
+
+
+def test_derived_values_are_kept_per_snapshot(storage):
+    User("u1", "n").store_data()
+    cache = TableCache()
+    calls = []
+
+    def labels(rows):
+        calls.append(1)
+        return tuple(f"{r.name} ({r.id})" for r in rows)
+
+    snapshot = cache.get_snapshot(UserRecord)
+    assert snapshot.derive("labels", labels) == ("n (u1)",)
+    assert cache.get_snapshot(UserRecord).derive("labels", labels) == ("n (u1)",)
+    assert len(calls) == 1
+    assert len(cache.get_snapshot(DeviceRecord)) == 0
+
+
+def _store_user(path, storage, user_id):
+    # Runs in another process
+    DatabaseConnector().configure(path=path, storage=storage)
+    User(user_id, "other process").store_data()
+    DatabaseConnector().close()
+
+
+def test_writes_of_other_processes_reach_the_snapshot(storage):
+    User("u0", "n").store_data()
+    cache = TableCache()
+    assert cache.get_snapshot(UserRecord).column("id") == ("u0",)
+    context = multiprocessing.get_context("spawn")
+    process = context.Process(target=_store_user, args=(DatabaseConnector().path, storage, "u1"))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert cache.get_snapshot(UserRecord).column("id") == ("u0", "u1")
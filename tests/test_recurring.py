@@ -0,0 +1,127 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from devices import Device
+from reservations import RecurringReservation, Reservation, ReservationManager
+from users import User
+
+BASE = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def manager(storage):
+    User.store_many([User(f"u{i}", "n") for i in range(3)])
+    Device.store_many([Device(f"d{i}", "u0") for i in range(4)])
+    manager = ReservationManager()
+    rng = random.Random(7)
+    singles = []
+    for _ in range(200):
+        start = BASE + timedelta(minutes=rng.randrange(200_000))
+        singles.append(Reservation(None, f"d{rng.randrange(2)}", f"u{rng.randrange(3)}", start, start + timedelta(minutes=45)))
+    manager.create_many(singles)
+    # Series on the devices without single reservations, so none of them conflicts
+    for i in range(2):
+        start = BASE + timedelta(days=i, minutes=5 + i)
+        rule = RecurringReservation(
+            None, f"d{2 + i}", f"u{i}", start, start + timedelta(hours=1), timedelta(days=1, minutes=i),
+            BASE + timedelta(days=120),
+        )
+        assert manager.create_recurring(rule).accepted
+    return manager
+
+
+def _expected(manager, filters=None, descending=False, date_range=None):
+    """All reservations and occurrences matching, sorted by start: the slow reference."""
+    docs = [
+        (r.start, r.reservation_id, r.device_name, r.user_id) for r in manager.find_all()
+    ]
+    for rule in manager.find_recurring():
+        docs += [(start, rule.reservation_id, rule.device_name, rule.user_id) for start, _ in rule.occurrences()]
+    filters = filters or {}
+    docs = [
+        doc for doc in docs
+        if all(doc[{"device_name": 2, "user_id": 3}[field]] == value for field, value in filters.items())
+        and (date_range is None or date_range[0] <= doc[0] < date_range[1])
+    ]
+    return sorted(docs, reverse=descending)
+
+
+def _keys(page):
+    return [(r.start, r.reservation_id, r.device_name, r.user_id) for r in page.items]
+
+
+def test_occurrence_counts_match_listing():
+    rule = RecurringReservation("1", "d", "u", BASE, BASE + timedelta(hours=2), timedelta(days=7), BASE + timedelta(days=70))
+    assert len(rule) == 10
+    assert len(list(rule.occurrences())) == 10
+    lo, hi = BASE + timedelta(days=7), BASE + timedelta(days=21)
+    # Starting in [lo, hi): days 7 and 14, hi itself is excluded
+    assert [start for start, _ in rule.occurrences_starting(lo, hi)] == [lo, BASE + timedelta(days=14)]
+    assert rule.count_starting(lo, hi) == 2
+    assert list(rule.occurrences_starting(lo, hi, descending=True))[0][0] == BASE + timedelta(days=14)
+    # Overlapping also includes the occurrence that started before and ends after lo
+    later = lo + timedelta(hours=1)
+    assert rule.count_starting(later, hi) == 1
+    assert rule.count_between(later, hi) == 2
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_find_page_merges_occurrences(manager, descending):
+    expected = _expected(manager, descending=descending)
+    assert len(expected) > 400
+    for offset in (0, 20, 195, len(expected) - 5, len(expected), len(expected) + 10):
+        page = manager.find_page(offset, 20, descending=descending)
+        assert page.total == len(expected)
+        assert _keys(page) == expected[offset:offset + 20]
+
+
+@pytest.mark.parametrize("filters", [{"device_name": "d3"}, {"user_id": "u1"}, {"device_name": "d0", "user_id": "u2"}])
+def test_find_page_filters_occurrences(manager, filters):
+    expected = _expected(manager, filters)
+    page = manager.find_page(5, 30, filters=filters)
+    assert page.total == len(expected)
+    assert _keys(page) == expected[5:35]
+
+
+def test_find_page_date_range_bounds(manager):
+    rule = manager.find_recurring("d2")[0]
+    # The range starts exactly at one occurrence and ends exactly at another, which is left out
+    date_range = (rule.start + 10 * rule.every, rule.start + 20 * rule.every)
+    expected = _expected(manager, {"device_name": "d2"}, date_range=date_range)
+    page = manager.find_page(0, 50, filters={"device_name": "d2"}, date_range=date_range)
+    assert page.total == 10
+    assert _keys(page) == expected
+
+
+def test_find_page_computes_only_the_page(manager, monkeypatch):
+    computed = []
+    occurrence_doc = ReservationManager._occurrence_doc
+
+    def counting(rule, start, end):
+        computed.append(start)
+        return occurrence_doc(rule, start, end)
+
+    monkeypatch.setattr(ReservationManager, "_occurrence_doc", staticmethod(counting))
+    page = manager.find_page(0, 10)
+    assert len(page.items) == 10
+    # At most one page (plus the head of the merge) per series, not the whole series
+    assert len(computed) <= 2 * (10 + 1)
+    assert page.total == len(_expected(manager))
+
+
+def test_find_by_device_date_range(manager):
+    rule = manager.find_recurring("d3")[0]
+    date_range = (rule.start + 3 * rule.every, rule.start + 6 * rule.every)
+    found = manager.find_by_device("d3", date_range=date_range)
+    assert [r.start for r in found] == [start for start, _ in rule.occurrences_starting(*date_range)]
+    assert len(manager.find_by_device("d3")) == len(rule)
+
+
+def test_recurring_blocks_availability(manager):
+    rule = manager.find_recurring("d2")[0]
+    start = rule.start + 5 * rule.every
+    assert not manager.is_available("d2", start + timedelta(minutes=30), start + timedelta(hours=2))
+    assert manager.is_available("d2", start + timedelta(hours=1), start + timedelta(hours=2))
+    assert not manager.create(Reservation(None, "d2", "u0", start, start + timedelta(minutes=10)))
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import relations
+from devices import Device
+from maintenance import Maintenance, MaintenanceManager
+from reservations import RecurringReservation, Reservation, ReservationManager
+from users import User
+
+BASE = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def fleet(storage):
+    User.store_many([User("u1", "Alice"), User("u2", "Bob"), User("u3", "Carol")])
+    Device.store_many([Device("d1", "u1"), Device("d2", "u1"), Device("d3", "u2")])
+    reservations = ReservationManager()
+    reservations.create_many([
+        Reservation(None, "d1", "u2", BASE, BASE + timedelta(hours=1)),
+        Reservation(None, "d1", "u3", BASE + timedelta(hours=1), BASE + timedelta(hours=2)),
+        Reservation(None, "d3", "u3", BASE, BASE + timedelta(hours=1)),
+    ])
+    assert reservations.create_recurring(RecurringReservation(
+        None, "d1", "u3", BASE + timedelta(days=1), BASE + timedelta(days=1, hours=1), timedelta(days=7),
+        BASE + timedelta(days=60),
+    )).accepted
+    MaintenanceManager().upsert_many([Maintenance(None, "d1", "a", 10.0), Maintenance(None, "d3", "b", 5.0)])
+
+
+def test_count_dependents(fleet):
+    u3 = User.find_by_attribute("id", "u3")
+    assert u3.count_dependents() == {"devices": 0, "reservations": 2, "recurring_reservations": 1}
+    d1 = Device.find_by_attribute("device_name", "d1")
+    assert d1.count_dependents() == {
+        "reservations": 2, "recurring_reservations": 1, "maintenances": 1, "maintenance_costs": 1,
+    }
+    assert not Device.find_by_attribute("device_name", "d2").has_dependents()
+
+
+def test_restrict_keeps_everything(fleet):
+    with pytest.raises(relations.IntegrityError):
+        User.find_by_attribute("id", "u1").delete()
+    assert User.find_by_attribute("id", "u1") is not None
+    assert len(Device.find_all()) == 3
+
+
+def test_restrict_below_a_cascade_blocks_the_delete(fleet):
+    # Deleting u2 would cascade to its reservations, but it still manages d3
+    with pytest.raises(relations.IntegrityError):
+        User.find_by_attribute("id", "u2").delete()
+    assert len(ReservationManager().find_all()) == 3
+
+
+def test_cascade_deletes_dependents(fleet):
+    Device.find_by_attribute("device_name", "d1").delete()
+    reservations = ReservationManager()
+    assert [r.device_name for r in reservations.find_all()] == ["d3"]
+    assert reservations.find_recurring() == []
+    maintenances = MaintenanceManager()
+    assert [m.device_name for m in maintenances.find_all()] == ["d3"]
+    assert maintenances.cost_summary().per_device == {"d3": 5.0}
+
+
+def test_cascade_from_user(fleet):
+    User.find_by_attribute("id", "u3").delete()
+    assert User.find_by_attribute("id", "u3") is None
+    assert [r.user_id for r in ReservationManager().find_all()] == ["u2"]
+    assert ReservationManager().find_recurring() == []
+    # Devices are untouched
+    assert len(Device.find_all()) == 3
+
+
+def test_missing_references(fleet):
+    missing = relations.missing_references("reservations", {"device_name": "d9", "user_id": "u1"})
+    assert [(m.field, m.parent_table) for m in missing] == [("device_name", "devices")]
+    assert relations.missing_references("devices", {"device_name": "d4", "managed_by_user_id": "u3"}) == []
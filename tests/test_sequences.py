@@ -0,0 +1,48 @@
+import multiprocessing
+
+from database import DatabaseConnector
+from sequences import SequenceAllocator
+
+
+def _allocate(path, storage, rounds):
+    DatabaseConnector().configure(path=path, storage=storage)
+    ids = []
+    for i in range(rounds):
+        first = DatabaseConnector().next_id("maintenances", "maintenance_id", 1 + i % 3)
+        ids += range(first, first + 1 + i % 3)
+    DatabaseConnector().close()
+    return ids
+
+
+def test_concurrent_processes_never_share_ids(storage, tmp_path):
+    path = DatabaseConnector().path
+    DatabaseConnector().close()
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(4) as pool:
+        results = pool.starmap(_allocate, [(path, storage, 25)] * 4)
+    ids = [i for result in results for i in result]
+    assert len(ids) == len(set(ids)) == 4 * sum(1 + i % 3 for i in range(25))
+    assert sorted(ids) == list(range(1, len(ids) + 1))
+
+
+def test_sequence_starts_after_existing_ids(storage):
+    DatabaseConnector().get_table("reservations").insert_multiple([
+        {"reservation_id": "7"}, {"reservation_id": "x"}, {"reservation_id": "3"},
+    ])
+    assert DatabaseConnector().next_id("reservations", "reservation_id") == 8
+
+
+def test_advance_only_moves_forward(tmp_path):
+    sequences = SequenceAllocator(str(tmp_path / "sequences.json"))
+    assert sequences.allocate("t", 5) == 1
+    sequences.advance("t", 3)
+    assert sequences.allocate("t") == 6
+    sequences.advance("t", 20)
+    assert sequences.allocate("t") == 20
+    sequences.advance("new", 4, seed=lambda: 10)
+    assert sequences.allocate("new") == 10
+
+
+def test_advance_id_ignores_ids_that_are_not_numbers(storage):
+    DatabaseConnector().advance_id("maintenances", "maintenance_id", ["abc", None, "41", "5"])
+    assert DatabaseConnector().next_id("maintenances", "maintenance_id") == 42
@@ -0,0 +1,53 @@
+import os
+from datetime import datetime, timedelta
+
+from database import DatabaseConnector
+from devices import Device
+from maintenance import Maintenance, MaintenanceManager
+from reservations import Reservation, ReservationManager
+from users import User
+
+BASE = datetime(2025, 1, 1)
+
+
+def _fill():
+    User.store_many([User("u0", "n")])
+    Device.store_many([Device("d0", "u0")])
+    ReservationManager().create_many([
+        Reservation(None, "d0", "u0", BASE + timedelta(days=i), BASE + timedelta(days=i, hours=1)) for i in range(10)
+    ])
+
+
+def _shards(path):
+    directory = os.path.splitext(path)[0] + "_tables"
+    return {
+        name[:-len(".json")]: os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json")
+    }
+
+
+def test_single_file_is_split_into_tables(json_storage):
+    path = DatabaseConnector().path
+    _fill()
+    DatabaseConnector().configure(storage="sharded")
+    assert [r.start for r in ReservationManager().find_all()] == [BASE + timedelta(days=i) for i in range(10)]
+    assert User.find_by_attribute("id", "u0").name == "n"
+    assert {"users", "devices", "reservations"} <= set(_shards(path))
+    assert os.path.exists(path + ".bak") and not os.path.exists(path)
+
+
+def test_writing_one_table_leaves_the_others_alone(tmp_path):
+    path = str(tmp_path / "database.json")
+    DatabaseConnector().configure(path=path, storage="sharded")
+    try:
+        _fill()
+        MaintenanceManager()
+        before = {table: os.stat(shard).st_mtime_ns for table, shard in _shards(path).items()}
+        MaintenanceManager().upsert(Maintenance(None, "d0", "check", 5.0, BASE))
+        after = {table: os.stat(shard).st_mtime_ns for table, shard in _shards(path).items()}
+        changed = {table for table in after if after[table] != before.get(table)}
+        assert changed == {"maintenances", "maintenance_costs"}
+        # The same datetime codec as the other tables
+        DatabaseConnector().close()
+        assert MaintenanceManager().find_all()[0].performed_at == BASE
+    finally:
+        DatabaseConnector().close()
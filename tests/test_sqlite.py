@@ -0,0 +1,97 @@
+import json
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import DatabaseConnector
+from devices import Device
+from maintenance import Maintenance, MaintenanceManager
+from queries import Range
+from reservations import RecurringReservation, ReservationManager
+from serializer import encode_value
+from sqlite_store import SQLiteDatabase
+from users import User
+
+BASE = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    """A fresh database in tmp_path with the SQLite storage."""
+    DatabaseConnector().configure(path=str(tmp_path / "database.json"), storage="sqlite")
+    yield "sqlite"
+    DatabaseConnector().close()
+
+
+def _columns(table):
+    rows = DatabaseConnector().get_db().connection.execute(f'PRAGMA table_info("{table}")').fetchall()
+    return {row["name"] for row in rows}
+
+
+def test_maintenance_dates_are_queried_on_their_index(sqlite_storage):
+    manager = MaintenanceManager()
+    manager.upsert_many([
+        Maintenance(None, f"d{i % 3}", "check", 10.0, BASE + timedelta(days=i)) for i in range(40)
+    ] + [Maintenance(None, "d0", "undated", 1.0)])
+    table = DatabaseConnector().get_table("maintenances")
+    assert "performed_at" in _columns("maintenances")
+    where = {"performed_at": Range(BASE + timedelta(days=10), BASE + timedelta(days=20))}
+    plan = table.explain_where(where, order_by="performed_at")
+    assert (plan.strategy, plan.index, plan.ordered) == ("sql", "idx_maintenances_performed_at", True)
+    docs = table.find_where(where, order_by="performed_at")
+    assert [doc["performed_at"] for doc in docs] == [BASE + timedelta(days=i) for i in range(10, 20)]
+    assert table.scans == 0
+
+
+def test_rules_and_cost_aggregates_have_columns(sqlite_storage):
+    User.store_many([User("u0", "n"), User("u1", "n")])
+    Device.store_many([Device("d0", "u0"), Device("d1", "u0")])
+    manager = ReservationManager()
+    for i in range(2):
+        rule = RecurringReservation(
+            None, f"d{i}", f"u{i}", BASE, BASE + timedelta(hours=1), timedelta(days=7), BASE + timedelta(days=70),
+        )
+        assert manager.create_recurring(rule).accepted
+    rules = DatabaseConnector().get_table("recurring_reservations")
+    assert {"device_name", "user_id", "start", "every", "until"} <= _columns("recurring_reservations")
+    assert rules.explain_where({"device_name": "d1"}).index.startswith("idx_recurring_reservations_device_name")
+    assert rules.explain_where({"user_id": "u0"}).index == "idx_recurring_reservations_user_id"
+    assert [rule.device_name for rule in manager.find_recurring()] == ["d0", "d1"]
+    assert manager.find_recurring()[0].every == timedelta(days=7)
+
+    MaintenanceManager().upsert_many([
+        Maintenance(None, "d0", "a", 10.0, datetime(2025, 3, 1)), Maintenance(None, "d0", "b", 5.0),
+    ])
+    costs = DatabaseConnector().get_table("maintenance_costs")
+    assert costs.explain_where({"device_name": "d0"}).index == "idx_maintenance_costs_device_name"
+    row = DatabaseConnector().get_db().connection.execute('SELECT "count", total FROM maintenance_costs').fetchone()
+    assert tuple(row) == (2, 15.0)
+    assert MaintenanceManager().cost_summary().per_month == {"2025-03": 10.0}
+
+
+def test_columns_added_later_are_migrated(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    connection = sqlite3.connect(path)
+    # The maintenances table as older versions created it, performed_at lived in the JSON column
+    connection.execute(
+        'CREATE TABLE maintenances (doc_id INTEGER PRIMARY KEY, maintenance_id TEXT, device_name TEXT, '
+        "description TEXT, cost REAL, extra TEXT NOT NULL DEFAULT '{}')"
+    )
+    extra = json.dumps(encode_value({"performed_at": datetime(2025, 2, 3), "_version": 1}))
+    connection.execute("INSERT INTO maintenances VALUES (1, '1', 'd1', 'check', 12.5, ?)", (extra,))
+    connection.commit()
+    connection.close()
+
+    db = SQLiteDatabase(path)
+    try:
+        table = db.table("maintenances")
+        where = {"performed_at": Range(datetime(2025, 2, 1), datetime(2025, 3, 1))}
+        assert table.explain_where(where).index == "idx_maintenances_performed_at"
+        assert [doc["performed_at"] for doc in table.find_where(where)] == [datetime(2025, 2, 3)]
+        row = db.connection.execute("SELECT performed_at, extra FROM maintenances").fetchone()
+        assert row["performed_at"] == "2025-02-03T00:00:00.000000"
+        assert json.loads(row["extra"]) == {"_version": 1}
+        assert table.get(doc_id=1)["_version"] == 1
+    finally:
+        db.close()
@@ -0,0 +1,125 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+import transfer
+from database import DatabaseConnector
+from devices import Device
+from maintenance import Maintenance, MaintenanceManager
+from reservations import RecurringReservation, Reservation, ReservationManager
+from users import User
+
+BASE = datetime(2025, 1, 1)
+
+
+@pytest.fixture
+def fleet(storage):
+    User.store_many([User("u1", "Alice"), User("u2", "Bob")])
+    Device.store_many([Device("d1", "u1"), Device("d2", "u2")])
+    return storage
+
+
+def _csv(*lines):
+    return io.StringIO("\n".join(lines) + "\n")
+
+
+def test_imported_maintenance_ids_are_not_allocated_again(fleet):
+    manager = MaintenanceManager()
+    manager.upsert(Maintenance(None, "d1", "first", 1.0))
+    report = transfer.import_file("maintenances", _csv(
+        "maintenance_id,device_name,description,cost", "2,d1,imported-two,2", "3,d1,imported-three,3",
+    ))
+    assert report.imported == 2
+    new = Maintenance(None, "d1", "new", 4.0)
+    manager.upsert(new)
+    assert new.maintenance_id == "4"
+    descriptions = {m.maintenance_id: m.description for m in manager.find_all()}
+    assert descriptions == {"1": "first", "2": "imported-two", "3": "imported-three", "4": "new"}
+    assert manager.cost_summary().total == 10.0
+
+
+def test_imported_reservation_ids_are_not_allocated_again(fleet):
+    manager = ReservationManager()
+    assert manager.create(Reservation(None, "d1", "u1", BASE, BASE + timedelta(hours=1)))
+    report = transfer.import_file("reservations", io.StringIO(
+        '{"reservation_id": "2", "device_name": "d1", "user_id": "u1", '
+        '"start": "2025-01-02T00:00:00", "end": "2025-01-02T01:00:00"}\n'
+    ), "jsonl")
+    assert report.imported == 1
+    results = manager.create_many([
+        Reservation(None, "d2", "u2", BASE + timedelta(days=i), BASE + timedelta(days=i, hours=1)) for i in range(3)
+    ])
+    assert all(result.accepted for result in results)
+    ids = [r.reservation_id for r in manager.find_all()]
+    assert len(ids) == len(set(ids)) == 5
+
+
+def test_allocation_skips_ids_stored_without_the_sequence(fleet):
+    manager = MaintenanceManager()
+    manager.upsert(Maintenance(None, "d1", "first"))
+    # Written directly, e.g. by another program: the sequence doesn't know these ids
+    DatabaseConnector().get_table("maintenances").insert_multiple([
+        {"maintenance_id": str(i), "device_name": "d1", "description": "raw", "cost": 0.0} for i in (2, 3)
+    ])
+    results = manager.upsert_many([Maintenance(None, "d2", "new"), Maintenance(None, "d2", "new")])
+    assert [r.item.maintenance_id for r in results] == ["4", "5"]
+    assert len(manager.find_all()) == 5
+
+
+def test_rejected_rows_are_reported_by_line(fleet):
+    report = transfer.import_file("devices", _csv(
+        "device_name,managed_by_user_id,is_active",
+        "d3,u1,true",
+        "d4,nobody,true",
+        "d5,u2,maybe",
+        ",u1,true",
+    ))
+    assert (report.rows, report.imported, report.failed) == (4, 1, 3)
+    assert [error.line for error in report.errors] == [3, 4, 5]
+    assert Device.find_by_attribute("device_name", "d3") is not None
+    assert Device.find_by_attribute("device_name", "d4") is None
+
+
+@pytest.mark.parametrize("fmt", transfer.FORMATS)
+def test_export_import_round_trip(fleet, fmt, tmp_path):
+    reservations = ReservationManager()
+    reservations.create_many([
+        Reservation(None, "d1", "u1", BASE + timedelta(days=i), BASE + timedelta(days=i, hours=1), f"note {i}")
+        for i in range(5)
+    ])
+    series = RecurringReservation(
+        None, "d2", "u2", BASE, BASE + timedelta(hours=2), timedelta(days=7), BASE + timedelta(days=70), "weekly",
+    )
+    assert reservations.create_recurring(series).accepted
+    MaintenanceManager().upsert_many([Maintenance(None, "d2", "oil, filter", 12.5, BASE)])
+    exported = {}
+    for table in transfer.FIELDS:
+        handle = io.StringIO()
+        exported[table] = transfer.export_table(table, handle, fmt)
+        handle.seek(0)
+        exported[table, "text"] = handle.getvalue()
+
+    DatabaseConnector().configure(path=str(tmp_path / "copy.json"))
+    for table in transfer.FIELDS:
+        report = transfer.import_file(table, io.StringIO(exported[table, "text"]), fmt)
+        assert (report.imported, report.failed) == (exported[table], 0)
+
+    assert sorted(u.id for u in User.find_all()) == ["u1", "u2"]
+    copied = sorted((r.reservation_id, r.start, r.end, r.note) for r in ReservationManager().find_all())
+    assert copied == [(str(i + 1), BASE + timedelta(days=i), BASE + timedelta(days=i, hours=1), f"note {i}") for i in range(5)]
+    assert ReservationManager().find_recurring() == [series]
+    (maintenance,) = MaintenanceManager().find_all()
+    assert (maintenance.description, maintenance.cost, maintenance.performed_at) == ("oil, filter", 12.5, BASE)
+
+
+def test_recurring_reservation_rows_are_validated(fleet):
+    report = transfer.import_file("recurring_reservations", _csv(
+        "reservation_id,device_name,user_id,start,end,every,until",
+        "7,d1,u1,2025-01-06T09:00:00,2025-01-06T12:00:00,604800,2025-03-01T00:00:00",
+        ",d1,u2,2025-01-07T10:00:00,2025-01-07T11:00:00,0,2025-03-01T00:00:00",
+        ",d1,u2,2025-01-13T10:00:00,2025-01-13T11:00:00,86400,2025-03-01T00:00:00",
+    ))
+    assert (report.imported, [error.line for error in report.errors]) == (1, [3, 4])
+    (rule,) = ReservationManager().find_recurring("d1")
+    assert (rule.reservation_id, rule.every, len(rule)) == ("7", timedelta(days=7), 8)
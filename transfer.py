@@ -0,0 +1,336 @@
+"""
+Streaming import and export of the users, devices, reservations (single and recurring) and
+maintenances as CSV or JSON Lines.
+
+Rows are read and written one at a time; imports are validated and committed in chunks through the
+bulk writes of the managers (Entity.store_many, ReservationManager.create_many,
+MaintenanceManager.upsert_many), so memory doesn't grow with the size of the file. Rows referencing
+a user or device that doesn't exist (see relations.py) are rejected, so users are imported first,
+then devices, then reservations, recurring reservations and maintenances. Imported reservation and maintenance ids advance
+the id sequences, so ids assigned later don't collide with them.
+
+    python transfer.py import devices inventory.csv
+    python transfer.py export reservations bookings.jsonl --include-archive
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from database import DatabaseConnector, WriteResult
+from devices import Device
+from maintenance import Maintenance, MaintenanceManager
+from relations import missing_references
+from reservations import RecurringReservation, Reservation, ReservationManager
+from users import User
+
+# Exported fields per table: (field, kind). Other stored fields (e.g. the version stamp) aren't exported.
+FIELDS: Dict[str, List[Tuple[str, str]]] = {
+    "users": [("id", "text"), ("name", "text"), ("created_at", "datetime")],
+    "devices": [
+        ("device_name", "text"), ("managed_by_user_id", "text"), ("is_active", "bool"),
+        ("state", "text"), ("created_at", "datetime"),
+    ],
+    "reservations": [
+        ("reservation_id", "text"), ("device_name", "text"), ("user_id", "text"),
+        ("start", "datetime"), ("end", "datetime"), ("note", "text"),
+    ],
+    # The rule records, "every" is the interval in seconds (as stored)
+    "recurring_reservations": [
+        ("reservation_id", "text"), ("device_name", "text"), ("user_id", "text"),
+        ("start", "datetime"), ("end", "datetime"), ("every", "real"), ("until", "datetime"), ("note", "text"),
+    ],
+    "maintenances": [
+        ("maintenance_id", "text"), ("device_name", "text"), ("description", "text"),
+        ("cost", "real"), ("performed_at", "datetime"),
+    ],
+}
+
+FORMATS = ("csv", "jsonl")
+
+_TRUE = {"true", "1", "yes"}
+_FALSE = {"false", "0", "no"}
+
+
+@dataclass
+class RowError:
+    # Line of the row in the file (the last line of a CSV row spanning several lines)
+    line: int
+    reason: str
+
+
+@dataclass
+class ImportReport:
+    """
+    Progress and outcome of an import. errors only keeps the first max_errors rejected rows,
+    failed counts all of them.
+    """
+    table: str
+    rows: int = 0
+    imported: int = 0
+    failed: int = 0
+    errors: List[RowError] = field(default_factory=list)
+
+
+def format_of(path: str) -> str:
+    """The format matching the file extension (.csv, .jsonl or .ndjson)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise ValueError(f"Can't tell the format of {path!r}, expected one of {FORMATS}")
+
+
+def _check(table: str, fmt: str) -> None:
+    if table not in FIELDS:
+        raise ValueError(f"Unknown table {table!r}, expected one of {sorted(FIELDS)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {FORMATS}")
+
+
+# --- Export ------------------------------------------------------------------------------------
+
+def _export_value(kind: str, value: Any, fmt: str) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if fmt == "csv":
+        if kind == "bool" and isinstance(value, bool):
+            return "true" if value else "false"
+        return "" if value is None else value
+    return value
+
+
+def export_rows(table: str, include_archive: bool = False) -> Iterator[Mapping]:
+    """
+    The stored documents of the table, read from storage chunk by chunk.
+    include_archive: the archived reservations follow those of the table.
+    """
+    yield from DatabaseConnector().get_table(table).iter_documents()
+    if include_archive and table == "reservations":
+        yield from ReservationManager().iter_archived()
+
+
+def export_table(table: str, handle: IO[str], fmt: str = "csv", include_archive: bool = False) -> int:
+    """Write all rows of the table to the text handle, one at a time. Returns the number of rows."""
+    _check(table, fmt)
+    fields = FIELDS[table]
+    writer = None
+    if fmt == "csv":
+        writer = csv.writer(handle)
+        writer.writerow([name for name, _ in fields])
+    written = 0
+    for doc in export_rows(table, include_archive):
+        if writer is not None:
+            writer.writerow([_export_value(kind, doc.get(name), fmt) for name, kind in fields])
+        else:
+            row = {name: _export_value(kind, doc[name], fmt) for name, kind in fields if doc.get(name) is not None}
+            handle.write(json.dumps(row, ensure_ascii=False) + "\n")
+        written += 1
+    return written
+
+
+# --- Import ------------------------------------------------------------------------------------
+
+def read_rows(handle: IO[str], fmt: str) -> Iterator[Tuple[int, Any]]:
+    """
+    (line, raw row) of every row of the text handle: a dict of strings for CSV, the line's text
+    for JSON Lines (decoded by import_rows, so a broken line only rejects that row).
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(handle)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line, text in enumerate(handle, 1):
+            if text.strip():
+                yield line, text
+
+
+def _import_value(name: str, kind: str, value: Any) -> Any:
+    if kind == "datetime":
+        return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    if kind == "bool":
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text not in _TRUE and text not in _FALSE:
+            raise ValueError(f"invalid {name} {value!r}, expected true or false")
+        return text in _TRUE
+    if kind == "real":
+        return float(value)
+    return str(value)
+
+
+def _to_document(table: str, raw: Any) -> dict:
+    """The typed document of one raw row, raises ValueError for invalid values."""
+    row = json.loads(raw) if isinstance(raw, str) else raw
+    if not isinstance(row, dict):
+        raise ValueError("row is not an object")
+    doc = {}
+    for name, kind in FIELDS[table]:
+        value = row.get(name)
+        # Empty CSV cells are missing values
+        if value is None or value == "":
+            continue
+        try:
+            doc[name] = _import_value(name, kind, value)
+        except ValueError:
+            raise ValueError(f"invalid {name} {value!r}") from None
+    return doc
+
+
+def _require(doc: Mapping, *names: str) -> None:
+    for name in names:
+        if name not in doc:
+            raise ValueError(f"missing {name}")
+
+
+def _to_item(table: str, doc: dict) -> Any:
+    """The object the bulk write of the table expects."""
+    missing = missing_references(table, doc)
+    if missing:
+        raise ValueError(f"unknown {missing[0].field} {doc[missing[0].field]!r}")
+    if table == "users":
+        _require(doc, "id", "name")
+        return User.from_dict(doc)
+    if table == "devices":
+        _require(doc, "device_name", "managed_by_user_id")
+        return Device.from_dict(doc)
+    if table == "reservations":
+        _require(doc, "device_name", "user_id", "start", "end")
+        return Reservation(
+            doc.get("reservation_id"), doc["device_name"], doc["user_id"], doc["start"], doc["end"], doc.get("note", "")
+        )
+    if table == "recurring_reservations":
+        _require(doc, "device_name", "user_id", "start", "end", "every", "until")
+        if doc["every"] <= 0:
+            raise ValueError(f"invalid every {doc['every']!r}")
+        return RecurringReservation(
+            doc.get("reservation_id"), doc["device_name"], doc["user_id"], doc["start"], doc["end"],
+            timedelta(seconds=doc["every"]), doc["until"], doc.get("note", ""),
+        )
+    _require(doc, "device_name")
+    return Maintenance(
+        doc.get("maintenance_id"), doc["device_name"], doc.get("description", ""),
+        doc.get("cost", 0.0), doc.get("performed_at"),
+    )
+
+
+def _writer(table: str) -> Callable[[list], List[WriteResult]]:
+    if table == "users":
+        return User.store_many
+    if table == "devices":
+        return Device.store_many
+    if table == "reservations":
+        return ReservationManager().create_many
+    if table == "recurring_reservations":
+        manager = ReservationManager()
+        # Each series is checked against the stored ones, there is no batch write for them
+        return lambda rules: [manager.create_recurring(rule) for rule in rules]
+    return MaintenanceManager().upsert_many
+
+
+def import_rows(table: str, rows: Iterable[Tuple[int, Any]], chunk_size: int = 500,
+                progress: Optional[Callable[[ImportReport], None]] = None, max_errors: int = 1000) -> ImportReport:
+    """
+    Validate the (line, raw row) pairs of read_rows() and store the valid ones, chunk_size rows per
+    write. Users, devices and maintenances with an existing key are updated, reservations are only
+    created if they don't conflict (see ReservationManager.create_many and create_recurring). progress(report) is called
+    after every chunk.
+    """
+    if table not in FIELDS:
+        raise ValueError(f"Unknown table {table!r}, expected one of {sorted(FIELDS)}")
+    write = _writer(table)
+    report = ImportReport(table)
+
+    def reject(line: int, reason: str) -> None:
+        report.failed += 1
+        if len(report.errors) < max_errors:
+            report.errors.append(RowError(line, reason))
+
+    def commit(chunk: List[Tuple[int, Any]]) -> None:
+        for (line, _), result in zip(chunk, write([item for _, item in chunk])):
+            if result.accepted:
+                report.imported += 1
+            else:
+                reject(line, result.reason)
+        if progress is not None:
+            progress(report)
+
+    chunk = []
+    for line, raw in rows:
+        report.rows += 1
+        try:
+            chunk.append((line, _to_item(table, _to_document(table, raw))))
+        except (KeyError, ValueError) as e:
+            reject(line, str(e))
+            continue
+        if len(chunk) >= chunk_size:
+            commit(chunk)
+            chunk = []
+    if chunk:
+        commit(chunk)
+    # Invalid rows are rejected right away, rows the write refused only with their chunk
+    report.errors.sort(key=lambda error: error.line)
+    return report
+
+
+def import_file(table: str, handle: IO[str], fmt: str = "csv", chunk_size: int = 500,
+                progress: Optional[Callable[[ImportReport], None]] = None, max_errors: int = 1000) -> ImportReport:
+    """Import the rows of a CSV (with a header row) or JSON Lines text handle into the table."""
+    _check(table, fmt)
+    return import_rows(table, read_rows(handle, fmt), chunk_size, progress, max_errors)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Import or export a table as CSV or JSON Lines.")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("table", choices=sorted(FIELDS))
+    parser.add_argument("file", help="file to read or write, - for stdin/stdout")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--database", help="database file (default: the app's database.json)")
+    parser.add_argument("--storage", choices=sorted(DatabaseConnector.STORAGES))
+    parser.add_argument("--chunk-size", type=int, default=500, help="rows per write when importing")
+    parser.add_argument("--include-archive", action="store_true", help="export the archived reservations as well")
+    args = parser.parse_args(argv)
+
+    if args.format is None and args.file == "-":
+        parser.error("--format is required for stdin/stdout")
+    fmt = args.format or format_of(args.file)
+    if args.database or args.storage:
+        DatabaseConnector().configure(path=args.database, storage=args.storage)
+    try:
+        if args.command == "export":
+            if args.file == "-":
+                written = export_table(args.table, sys.stdout, fmt, args.include_archive)
+            else:
+                with open(args.file, "w", encoding="utf-8", newline="") as handle:
+                    written = export_table(args.table, handle, fmt, args.include_archive)
+            print(f"{args.table}: {written} rows exported", file=sys.stderr)
+            return
+
+        def progress(report: ImportReport) -> None:
+            print(f"{report.rows} rows read, {report.imported} imported, {report.failed} rejected", file=sys.stderr)
+
+        if args.file == "-":
+            report = import_file(args.table, sys.stdin, fmt, args.chunk_size, progress)
+        else:
+            with open(args.file, encoding="utf-8-sig", newline="") as handle:
+                report = import_file(args.table, handle, fmt, args.chunk_size, progress)
+        for error in report.errors:
+            print(f"line {error.line}: {error.reason}", file=sys.stderr)
+        if report.failed > len(report.errors):
+            print(f"... {report.failed - len(report.errors)} more rejected rows", file=sys.stderr)
+    finally:
+        DatabaseConnector().close()
+    if report.failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from datetime import datetime
 
 class User(Entity):
     """User class - represents a user in the business logic."""
+    __slots__ = ("id", "name")
 
     def __init__(self, id: str, name: str) -> None:
         """Create a new user based on the given name and id."""
@@ -24,7 +25,8 @@ class User(Entity):
 
     @classmethod
     def from_dict(cls, data: dict):
-        user = User(data["id"], data["name"])
-        if "created_at" in data:
-            user.created_at = data["created_at"]
+        user = cls._new()
+        user.id = data["id"]
+        user.name = data["name"]
+        user.created_at = data["created_at"] if "created_at" in data else datetime.now()
         return user
\ No newline at end of file